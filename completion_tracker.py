@@ -0,0 +1,449 @@
+# completion_tracker.py - Completion tracking for prompts queued on ComfyUI hosts
+# Listens on each host's /ws?clientId=<client_id> stream and maps execution events
+# (execution_start / executing / executed / execution_error / ...) to the prompt ids we posted.
+# ComfyUI only sends these events to the client that queued the prompt, so prompts must be
+# posted with tracker.client_id. Without websocket-client (in requirements.txt, but the tracker
+# runs without it) or while a websocket is down, pending prompts are checked via /queue and /history.
+# The trigger nodes queue the real renders themselves and list their prompt ids in their UI output
+# (render_result); a tracked trigger prompt only counts as done once all of those renders are.
+# Each tracked prompt gets a concurrent.futures.Future plus optional callbacks.
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future, wait as wait_futures
+from urllib.parse import urlsplit
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+try:
+    from . import http_pool  # shared keep-alive sessions (package import inside ComfyUI)
+except ImportError:
+    import http_pool
+
+WS_CONNECT_TIMEOUT = 5   # seconds to open a websocket
+WS_RECV_TIMEOUT = 1.0    # seconds between checks for close() while the stream is quiet
+POLL_INTERVAL = 2.0      # seconds between /history checks without a websocket
+HISTORY_SWEEP = 30.0     # seconds between /history safety sweeps while the websocket is up
+RECONNECT_DELAY = 5.0    # seconds of /history polling before a websocket reconnect
+HISTORY_TIMEOUT = (2, 5)
+EARLY_EVENTS_MAX = 1000  # prompts seen before track() was called, kept (oldest dropped first) for a late track()
+
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+FINISHED = (DONE, ERROR)
+
+# UI output keys of the trigger nodes (render_result)
+RENDERS_KEY, RENDER_HOST_KEY, RENDER_ERROR_KEY = 'queued_ids', 'render_host', 'render_error'
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '0.0.0.0', '::1')
+
+
+def _host_url(host: str) -> str:
+    host = host.rstrip('/')
+    return host if '://' in host else f"http://{host}"
+
+
+def render_result(result: tuple, queued_ids, host: str, error: str = None) -> dict:
+    """Node return value of a trigger: its outputs plus the render prompt ids it queued on host."""
+    ui = {RENDERS_KEY: [p for p in queued_ids if p], RENDER_HOST_KEY: [host]}
+    if error:
+        ui[RENDER_ERROR_KEY] = [error]
+    return {"ui": ui, "result": result}
+
+
+def queued_renders(outputs: dict):
+    """([(prompt_id, host)], [error]) a finished trigger prompt listed in its outputs, None if it lists none."""
+    renders, errors, found = [], [], False
+    for output in outputs.values():
+        if not isinstance(output, dict) or RENDERS_KEY not in output:
+            continue
+        found = True
+        host = (output.get(RENDER_HOST_KEY) or [None])[0]
+        renders.extend((prompt_id, host) for prompt_id in output[RENDERS_KEY] or () if prompt_id)
+        errors.extend(output.get(RENDER_ERROR_KEY) or ())
+    return (renders, errors) if found else None
+
+
+def render_host(parent_host: str, host) -> str:
+    """URL of a render host as seen from here: the trigger posts to 127.0.0.1 on its own machine."""
+    if not host:
+        return parent_host
+    url = _host_url(host)
+    parts = urlsplit(url)
+    if parts.hostname in LOCAL_HOSTS:
+        parent = urlsplit(parent_host)
+        return f"{parent.scheme}://{parent.hostname}:{parts.port or parent.port or 8188}"
+    return url
+
+
+def _event_time(data: dict) -> float:
+    # execution_* events carry the host's own time in ms, also when replayed from /history
+    stamp = data.get('timestamp')
+    return stamp / 1000.0 if isinstance(stamp, (int, float)) else time.time()
+
+
+class PromptState:
+    """
+    Where one posted prompt is. info is whatever the caller passed to track().
+    A trigger prompt's renders are PromptStates too (parent set, not listed by states()).
+    """
+    __slots__ = ('prompt_id', 'host', 'status', 'node', 'outputs', 'error', 'info',
+                 'submitted_at', 'started_at', 'finished_at', 'future', 'callbacks',
+                 'parent', 'renders', 'waiting')
+
+    def __init__(self, prompt_id: str, host: str, info=None, parent=None):
+        self.prompt_id = prompt_id
+        self.host = host
+        self.status = QUEUED
+        self.node = None
+        self.outputs = {}
+        self.error = None
+        self.info = info
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = Future()
+        self.callbacks = []
+        self.parent = parent
+        self.renders = []      # render PromptStates queued by this (trigger) prompt
+        self.waiting = set()   # ids of those renders not finished yet
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def __repr__(self):
+        return f"PromptState({self.prompt_id[:8]} on {self.host}: {self.status})"
+
+
+class CompletionTracker:
+    """
+    follow_renders: a prompt whose outputs list queued renders (render_result) finishes with them.
+    prune: forget finished prompts once their callbacks ran (long-running processes, e.g. ComfyUI).
+    """
+
+    def __init__(self, client_id: str = None, use_websocket: bool = True, poll_interval: float = POLL_INTERVAL,
+                 follow_renders: bool = True, prune: bool = False):
+        self.client_id = client_id or str(uuid.uuid4())
+        self.use_websocket = use_websocket and websocket is not None
+        self.poll_interval = poll_interval
+        self.follow_renders = follow_renders
+        self.prune = prune
+        self._prompts = {}     # prompt_id -> PromptState (renders included)
+        self._early = {}       # prompt_id -> list of events seen before track()
+        self._watchers = {}    # host url -> thread
+        self._connected = {}   # host url -> websocket currently up
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # --- public API ---
+
+    def watch(self, host: str) -> None:
+        """Start listening to a host (done by track() too); call before posting to catch every event."""
+        host = _host_url(host)
+        with self._lock:
+            if host in self._watchers or self._stop.is_set():
+                return
+            thread = threading.Thread(target=self._watch_host, args=(host,), daemon=True,
+                                      name=f"completion-{host}")
+            self._watchers[host] = thread
+        thread.start()
+
+    def track(self, host: str, prompt_id: str, info=None, callback=None) -> Future:
+        """Follow a posted prompt. The future resolves to its PromptState once it is done or failed."""
+        host = _host_url(host)
+        with self._lock:
+            state = self._prompts.get(prompt_id)
+            if state is None:
+                state = self._prompts[prompt_id] = PromptState(prompt_id, host, info)
+            if callback is not None:
+                state.callbacks.append(callback)
+            early = self._early.pop(prompt_id, ())
+        for event_type, data in early:
+            self._apply(state, event_type, data)
+        self.watch(host)
+        return state.future
+
+    def move(self, prompt_id: str, host: str, new_prompt_id: str) -> None:
+        """A queued prompt was deleted and re-posted elsewhere: same state and future, new id and host."""
+        host = _host_url(host)
+        with self._lock:
+            state = self._prompts.pop(prompt_id, None)
+            if state is None:
+                return
+            state.prompt_id = new_prompt_id
+            state.host = host
+            self._prompts[new_prompt_id] = state
+            early = self._early.pop(new_prompt_id, ())
+        for event_type, data in early:
+            self._apply(state, event_type, data)
+        self.watch(host)
+
+    def add_listener(self, fn) -> None:
+        """fn(state) on every status change of every tracked prompt (called from tracker threads)."""
+        if fn not in self._listeners:  # the same listener may be added once per run
+            self._listeners.append(fn)
+
+    def state(self, prompt_id: str):
+        return self._prompts.get(prompt_id)
+
+    def states(self) -> list:
+        """Tracked prompts, without the renders they queued."""
+        with self._lock:
+            return [s for s in self._prompts.values() if s.parent is None]
+
+    def counts(self) -> dict:
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, ERROR), 0)
+        for state in self.states():
+            counts[state.status] += 1
+        return counts
+
+    def wait(self, prompt_ids=None, timeout: float = None) -> dict:
+        """Block until the prompts (default: all tracked) are finished or timeout; returns counts()."""
+        states = self.states() if prompt_ids is None else [self._prompts[p] for p in prompt_ids if p in self._prompts]
+        wait_futures([s.future for s in states], timeout=timeout)
+        return self.counts()
+
+    def mode(self, host: str = None) -> str:
+        if host is not None and self._connected.get(_host_url(host)):
+            return "websocket"
+        return "websocket" if self.use_websocket else "/history polling"
+
+    def close(self) -> None:
+        self._stop.set()
+
+    # --- event handling ---
+
+    def handle_event(self, host: str, message: dict) -> None:
+        """Apply one websocket message ({"type": ..., "data": {...}})."""
+        event_type = message.get('type')
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if not prompt_id:
+            return
+        with self._lock:
+            state = self._prompts.get(prompt_id)
+            if state is None:
+                # event for a prompt we have not been told about (yet): keep it for a late track()
+                if prompt_id not in self._early and len(self._early) >= EARLY_EVENTS_MAX:
+                    del self._early[next(iter(self._early))]
+                self._early.setdefault(prompt_id, []).append((event_type, data))
+                return
+        self._apply(state, event_type, data)
+
+    def _apply(self, state: PromptState, event_type: str, data: dict) -> None:
+        renders = []
+        with self._lock:
+            if state.finished:
+                return
+            before = state.status
+            if event_type in ('execution_start', 'execution_cached'):
+                state.status = RUNNING
+            elif event_type == 'executing':
+                if data.get('node') is None:
+                    state.status = DONE  # ComfyUI's "prompt finished" marker
+                else:
+                    state.status = RUNNING
+                    state.node = data.get('node')
+            elif event_type == 'executed':
+                state.status = RUNNING
+                if data.get('node') is not None:
+                    state.outputs[data['node']] = data.get('output')
+            elif event_type == 'execution_success':
+                state.status = DONE
+            elif event_type == 'execution_error':
+                state.status = ERROR
+                state.error = f"{data.get('node_type', '?')}: {data.get('exception_message', 'error')}".strip()
+            elif event_type == 'execution_interrupted':
+                state.status = ERROR
+                state.error = "interrupted"
+            if event_type == 'execution_start' and 'timestamp' in data:
+                state.started_at = _event_time(data)  # the host's start, also when we saw it running earlier
+            if state.status == DONE and self.follow_renders and state.parent is None:
+                renders = self._start_renders(state)
+            if state.status == before and not renders:
+                return
+            now = _event_time(data)
+            if state.started_at is None and state.status != QUEUED:
+                state.started_at = now
+            if state.finished:
+                state.finished_at = now
+        for render, early in renders:
+            for early_type, early_data in early:
+                self._apply(render, early_type, early_data)
+            self.watch(render.host)
+            self._notify(render)  # listeners see the render queued
+        if state.status != before:
+            self._notify(state)
+        if state.finished and state.parent is not None:
+            self._render_finished(state)
+
+    def _start_renders(self, state: PromptState) -> list:
+        """(under the lock) [(render state, early events)] of a trigger prompt that just finished; it keeps running meanwhile."""
+        found = queued_renders(state.outputs)
+        if found is None:
+            return []
+        ids, errors = found
+        if errors:
+            state.error = "; ".join(errors)
+        renders = []
+        for prompt_id, host in ids:
+            if prompt_id in self._prompts:
+                continue
+            render = PromptState(prompt_id, render_host(state.host, host), state.info, parent=state)
+            self._prompts[prompt_id] = render
+            state.renders.append(render)
+            state.waiting.add(prompt_id)
+            renders.append((render, self._early.pop(prompt_id, ())))
+        if state.waiting:
+            state.status = RUNNING
+        elif state.error:
+            state.status = ERROR
+        return renders
+
+    def _render_finished(self, render: PromptState) -> None:
+        parent = render.parent
+        with self._lock:
+            parent.waiting.discard(render.prompt_id)
+            if render.status == ERROR and parent.error is None:
+                parent.error = f"render {render.prompt_id[:8]}: {render.error}"
+            self._prompts.pop(render.prompt_id, None)  # the parent keeps it in .renders
+            if parent.waiting or parent.finished:
+                return
+            parent.status = ERROR if parent.error else DONE
+            parent.finished_at = render.finished_at or time.time()
+        self._notify(parent)
+
+    def _apply_history(self, state: PromptState, entry: dict) -> None:
+        status = entry.get('status') or {}
+        messages = dict((kind, data) for kind, data in status.get('messages') or [])
+        if 'execution_start' in messages:
+            self._apply(state, 'execution_start', messages['execution_start'])
+        error = messages.get('execution_error') or messages.get('execution_interrupted')
+        if status.get('status_str') == 'error' or error is not None:
+            kind = 'execution_interrupted' if 'execution_interrupted' in messages else 'execution_error'
+            self._apply(state, kind, error or {'exception_message': 'failed'})
+        elif status.get('completed') or entry.get('outputs'):
+            with self._lock:
+                state.outputs.update(entry.get('outputs') or {})
+            self._apply(state, 'execution_success', messages.get('execution_success') or {})
+
+    def _notify(self, state: PromptState) -> None:
+        for fn in list(self._listeners) + list(state.callbacks if state.finished else ()):
+            try:
+                fn(state)
+            except Exception as e:
+                print(f"[tracker] callback failed for {state.prompt_id[:8]}: {e}")
+        if state.finished and not state.future.done():
+            state.future.set_result(state)
+        if self.prune and state.finished and state.parent is None and not state.waiting:
+            with self._lock:
+                if self._prompts.get(state.prompt_id) is state:
+                    del self._prompts[state.prompt_id]
+
+    # --- per host watcher ---
+
+    def _pending(self, host: str, renders_only: bool = False) -> list:
+        with self._lock:
+            return [s for s in self._prompts.values() if s.host == host and not s.finished
+                    and (s.parent is not None or not renders_only) and not s.waiting]
+
+    def check_history(self, host: str, states=None) -> None:
+        """
+        Check unfinished prompts of a host (default: all): one /queue read, then /history/<id>
+        for each prompt that is no longer queued or running.
+        """
+        host = _host_url(host)
+        states = self._pending(host) if states is None else states
+        if not states:
+            return
+        try:
+            resp = http_pool.get(f"{host}/queue", timeout=HISTORY_TIMEOUT)
+            resp.raise_for_status()
+            data = resp.json()
+        except Exception:
+            return  # host unreachable: try again next round
+        # queue items are [number, prompt_id, prompt, extra_data, outputs]
+        pending = {item[1] for item in data.get('queue_pending', [])}
+        running = {item[1] for item in data.get('queue_running', [])}
+        for state in states:
+            if state.prompt_id in pending:
+                continue
+            if state.prompt_id in running:
+                if state.status == QUEUED:
+                    self._apply(state, 'execution_start', {})
+                continue
+            try:
+                resp = http_pool.get(f"{host}/history/{state.prompt_id}", timeout=HISTORY_TIMEOUT)
+                resp.raise_for_status()
+                entry = resp.json().get(state.prompt_id)
+            except Exception:
+                return
+            if entry:
+                self._apply_history(state, entry)
+
+    def _poll_for(self, host: str, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            self.check_history(host)
+            self._stop.wait(self.poll_interval)
+
+    def _watch_host(self, host: str) -> None:
+        ws_url = "ws" + host[len("http"):] + f"/ws?clientId={self.client_id}"
+        while not self._stop.is_set():
+            if not self.use_websocket:
+                self._poll_for(host, RECONNECT_DELAY)
+                continue
+            try:
+                ws = websocket.create_connection(ws_url, timeout=WS_CONNECT_TIMEOUT)
+            except Exception:
+                self._poll_for(host, RECONNECT_DELAY)
+                continue
+            self._connected[host] = True
+            try:
+                ws.settimeout(WS_RECV_TIMEOUT)
+                self.check_history(host)  # anything that finished while we were not listening
+                last_sweep = last_poll = time.monotonic()
+                while not self._stop.is_set():
+                    try:
+                        message = ws.recv()
+                    except websocket.WebSocketTimeoutException:
+                        message = None
+                    if isinstance(message, str):  # binary frames are previews
+                        self.handle_event(host, json.loads(message))
+                    if time.monotonic() - last_sweep > HISTORY_SWEEP:
+                        self.check_history(host)
+                        last_sweep = last_poll = time.monotonic()
+                    elif time.monotonic() - last_poll > self.poll_interval:
+                        # renders are queued by the trigger nodes with their own client ids, so
+                        # their events do not come to us
+                        renders = self._pending(host, renders_only=True)
+                        if renders:
+                            self.check_history(host, renders)
+                        last_poll = time.monotonic()
+            except Exception:
+                pass  # connection dropped
+            finally:
+                self._connected[host] = False
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+            self._poll_for(host, RECONNECT_DELAY)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_tracker() -> CompletionTracker:
+    """Process-wide tracker, used by the trigger nodes inside ComfyUI; finished prompts are dropped."""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = CompletionTracker(follow_renders=False, prune=True)
+    return _shared
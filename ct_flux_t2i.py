@@ -1,4 +1,3 @@
-import json
 import sys
 import uuid
 import time
@@ -9,6 +8,13 @@ try:
     import requests
 except ImportError:
     requests = None
+# keep-alive sessions, compiled base workflows, render results for the launcher
+try:
+    from . import completion_tracker, http_pool, workflow_templates  # package import inside ComfyUI
+except ImportError:
+    import completion_tracker
+    import http_pool
+    import workflow_templates
 
 # Defaults for some nodes (you can expand this later)
 NODE_DEFAULTS = {
@@ -64,6 +70,8 @@ class WorkflowTrigger:
                 "shot": ("STRING", {"default": "shot"}),
                 "name": ("STRING", {"default": "name"}),
                 "seed_start": ("INT", {"default": 0, "min": 0, "max": 4294967295}),
+                "front": ("BOOLEAN", {"default": False, "label_on": "yes", "label_off": "no",
+                          "tooltip": "Queue the render jobs at the front of the host's queue (priority shots)"}),
 
                 "lora_1": ("STRING", {"default": ""}),
                 "lora_1_strength": ("FLOAT", {"default": 1.0, "min": -10.0, "max": 10.0, "step": 0.05}),
@@ -101,9 +109,11 @@ class WorkflowTrigger:
                 lora_5="", lora_5_strength=1.0,
                 lora_6="", lora_6_strength=1.0,
                 lora_7="", lora_7_strength=1.0,
-                lora_8="", lora_8_strength=1.0):
+                lora_8="", lora_8_strength=1.0,
+                front=False):
 
         debug_lines = ["=== WorkflowTrigger DEBUG START ==="]
+        queued_ids = []
         print("=== WorkflowTrigger START ===")
 
         try:
@@ -119,33 +129,26 @@ class WorkflowTrigger:
             debug_lines.append("Base file exists ✓")
             print("Base file exists ✓")
 
-            # 2. Load raw json
-            with open(json_file, 'r') as f:
-                loaded_data = json.load(f)
-            debug_lines.append(f"Loaded base JSON - {len(loaded_data)} top-level keys")
-            print(f"Loaded base JSON - {len(loaded_data)} top-level keys")
+            # 2. Compiled base workflow (loaded once, cached until the file changes)
+            template = workflow_templates.load_template(json_file)
+            debug_lines.append(f"Loaded base template - {len(template.nodes_by_class)} node classes")
+            print(f"Loaded base template - {len(template.nodes_by_class)} node classes")
 
-            payload_str = json.dumps(loaded_data)
-            debug_lines.append(f"Serialized length: {len(payload_str):,} chars")
-
-            # 3. REPLACETEXT replacement
-            original_count = payload_str.count("REPLACETEXT")
+            # 3. REPLACETEXT binding (structural - prompt text needs no JSON escaping)
+            original_count = template.count()
             debug_lines.append(f"Found {original_count} × REPLACETEXT")
             print(f"Found {original_count} × REPLACETEXT")
 
             replaced_count = 0
             if workflow_json.strip():
-                payload_str = payload_str.replace("REPLACETEXT", workflow_json)
+                payload = template.render({workflow_templates.PLACEHOLDER: workflow_json})
                 replaced_count = original_count
                 debug_lines.append(f"Replaced {replaced_count} placeholders")
                 print(f"Replaced {replaced_count} placeholders")
             else:
+                payload = template.render()
                 debug_lines.append("workflow_json empty → no replacement")
 
-            # 4. Parse back to dict
-            payload = json.loads(payload_str)
-            debug_lines.append("Successfully parsed modified payload")
-
             # 5. Get prompt_dict
             if "prompt" in payload:
                 prompt_dict = payload["prompt"]
@@ -242,9 +245,11 @@ class WorkflowTrigger:
             # Queuing loop
             queued_ids = []
             base_payload = {"prompt": prompt_dict}
+            # Copy-on-write per job: only the KSampler changes, every other node is shared
+            ksampler_ids = [nid for nid, node in prompt_dict.items() if node.get("class_type") == "KSampler"][:1]
 
             for i in range(num_jobs):
-                job_payload = json.loads(json.dumps(base_payload))
+                job_payload = workflow_templates.fork(base_payload, ksampler_ids)
                 job_prompt = job_payload["prompt"]
 
                 for nid, node in job_prompt.items():
@@ -254,13 +259,15 @@ class WorkflowTrigger:
                         break
 
                 job_payload["client_id"] = str(uuid.uuid4())
+                if front:
+                    job_payload["front"] = True  # ahead of everything already queued
 
                 if not requests:
                     debug_lines.append(f"Job {i+1} failed: requests not available")
                     continue
 
                 try:
-                    resp = requests.post(f"http://{host}/prompt", json=job_payload, timeout=30)
+                    resp = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(job_payload), timeout=30)
                     if resp.ok:
                         data = resp.json()
                         pid = data.get("prompt_id")
@@ -272,10 +279,13 @@ class WorkflowTrigger:
                     debug_lines.append(f"Request error job {i+1}: {str(req_err)}")
 
             debug_lines.append(f"Queued total: {len(queued_ids)} jobs")
+            debug_lines.append(http_pool.format_pool_stats())
             debug_lines.append("=== WorkflowTrigger DEBUG END ===")
             print("=== WorkflowTrigger END ===")
 
-            return ("\n".join(debug_lines), workflow_json, len(queued_ids))
+            shortfall = f"{num_jobs - len(queued_ids)} of {num_jobs} renders not queued" if len(queued_ids) < num_jobs else None
+            return completion_tracker.render_result(("\n".join(debug_lines), workflow_json, len(queued_ids)),
+                                                    queued_ids, host, shortfall)
 
         except Exception as e:
             import traceback
@@ -285,7 +295,8 @@ class WorkflowTrigger:
             print("CRITICAL EXCEPTION in WorkflowTrigger:")
             print(str(e))
             print(traceback.format_exc())
-            return ("\n".join(debug_lines), workflow_json, 0)
+            return completion_tracker.render_result(("\n".join(debug_lines), workflow_json, 0), queued_ids, host,
+                                                    f"WorkflowTrigger: {e}")
 
 
 # Mappings
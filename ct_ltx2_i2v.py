@@ -10,6 +10,13 @@ try:
     import requests
 except ImportError:
     requests = None
+# keep-alive sessions, compiled base workflows, render results for the launcher
+try:
+    from . import completion_tracker, http_pool, workflow_templates  # package import inside ComfyUI
+except ImportError:
+    import completion_tracker
+    import http_pool
+    import workflow_templates
 
 LOADIMAGE_DIR = os.getenv('COMFYUI_OUTPUT', '/ComfyUI/output')
 
@@ -34,6 +41,8 @@ class CT_LTX2_i2v_trigger:
                 "shot": ("STRING", {"default": "shot", "multiline": False}),
                 "name": ("STRING", {"default": "name", "multiline": False}),
                 "regenerate": ("BOOLEAN", {"default": False, "label_on": "yes", "label_off": "no"}),
+                "front": ("BOOLEAN", {"default": False, "label_on": "yes", "label_off": "no",
+                          "tooltip": "Queue the render jobs at the front of the host's queue (priority shots)"}),
             }
         }
 
@@ -47,9 +56,10 @@ class CT_LTX2_i2v_trigger:
                 width, height, video_length, checkpoint_name, fps,
                 json_file=None,
                 project=None, sequence=None, shot=None, name=None,
-                regenerate=False):
+                regenerate=False, front=False):
 
         debug_lines = []
+        queued_ids = []
         returned_json = None
 
         try:
@@ -84,19 +94,15 @@ class CT_LTX2_i2v_trigger:
                 debug_lines.append("⚠️ Base workflow file not found!")
                 raise FileNotFoundError(f"Base workflow missing: {json_file}")
 
-            with open(json_file, 'r') as f:
-                loaded_data = json.load(f)
-
-            payload_str = json.dumps(loaded_data)
+            template = workflow_templates.load_template(json_file)
 
             if input_prompt.strip():
-                payload_str = payload_str.replace("REPLACETEXT", input_prompt.strip())
+                payload = template.render({workflow_templates.PLACEHOLDER: input_prompt.strip()})
                 debug_lines.append("Prompt (REPLACETEXT) replaced")
             else:
+                payload = template.render()
                 debug_lines.append("No prompt provided → using base prompt")
 
-            payload = json.loads(payload_str)
-
             # Apply settings to known node IDs
             if "92:3" in payload:
                 payload["92:3"]["inputs"]["text"] = input_prompt.strip() or payload["92:3"]["inputs"].get("text", "")
@@ -174,7 +180,7 @@ class CT_LTX2_i2v_trigger:
                     else:
                         debug_lines.append(f"Processing {len(to_process)} image(s)")
                         for image_file in to_process:
-                            job_payload = json.loads(json.dumps(base_payload))
+                            job_payload = workflow_templates.fork(base_payload, ["98", "75"])
                             job_prompt = job_payload["prompt"]
 
                             full_img_path = os.path.join(input_dir, image_file)
@@ -189,8 +195,10 @@ class CT_LTX2_i2v_trigger:
                                 debug_lines.append(f"Output prefix: {prefix} (75)")
 
                             job_payload["client_id"] = str(uuid.uuid4())
+                            if front:
+                                job_payload["front"] = True  # ahead of everything already queued
                             if requests:
-                                r = requests.post(f"http://{host}/prompt", json=job_payload)
+                                r = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(job_payload))
                                 if r.ok:
                                     queued_ids.append(r.json().get("prompt_id"))
                                 else:
@@ -198,10 +206,12 @@ class CT_LTX2_i2v_trigger:
 
             else:
                 debug_lines.append("No project/seq/shot/name → queuing single job")
-                job_payload = json.loads(json.dumps(base_payload))
+                job_payload = workflow_templates.fork(base_payload, ())
                 job_payload["client_id"] = str(uuid.uuid4())
+                if front:
+                    job_payload["front"] = True  # ahead of everything already queued
                 if requests:
-                    r = requests.post(f"http://{host}/prompt", json=job_payload)
+                    r = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(job_payload))
                     if r.ok:
                         queued_ids.append(r.json().get("prompt_id"))
                     else:
@@ -211,13 +221,15 @@ class CT_LTX2_i2v_trigger:
             debug_lines.append(f"Queued {len(queued_ids)} job(s)")
 
             debug_lines.append("=== DEBUG END ===")
-            return ("\n".join(debug_lines), returned_json, 1 if queued_ids else 0)
+            return completion_tracker.render_result(("\n".join(debug_lines), returned_json, 1 if queued_ids else 0),
+                                                    queued_ids, host)
 
         except Exception as e:
             import traceback
             debug_lines.append(f"Error: {str(e)}")
             debug_lines.append(traceback.format_exc())
-            return ("\n".join(debug_lines), None, 0)
+            return completion_tracker.render_result(("\n".join(debug_lines), None, 0), queued_ids, host,
+                                                    f"CT_LTX2_i2v_trigger: {e}")
 
 
 NODE_CLASS_MAPPINGS = {"CT_LTX2_i2v_trigger": CT_LTX2_i2v_trigger}
@@ -1,4 +1,3 @@
-import json
 import os
 import uuid
 import time
@@ -8,6 +7,13 @@ try:
     import requests
 except ImportError:
     requests = None
+# keep-alive sessions, compiled base workflows, render results for the launcher
+try:
+    from . import completion_tracker, http_pool, workflow_templates  # package import inside ComfyUI
+except ImportError:
+    import completion_tracker
+    import http_pool
+    import workflow_templates
 
 
 class QwenCameraTrigger:
@@ -28,6 +34,8 @@ class QwenCameraTrigger:
             "optional": {
                 "json_file": ("STRING", {"default": "", "multiline": False}),
                 "seed_base": ("INT", {"default": 123456789, "min": 0, "max": 2**31-1}),
+                "front": ("BOOLEAN", {"default": False, "label_on": "yes", "label_off": "no",
+                          "tooltip": "Queue the render jobs at the front of the host's queue (priority shots)"}),
             }
         }
 
@@ -38,12 +46,13 @@ class QwenCameraTrigger:
     OUTPUT_NODE = True
 
     def execute(self, mode, host, input_dir, project, sequence, shot, name,
-                json_file="", seed_base=123456789):
+                json_file="", seed_base=123456789, front=False):
 
         print("[QwenCam] === execute() STARTED ===")
         print(f"[QwenCam] mode={mode!r}  host={host}  json_file='{json_file}'")
 
         debug = []
+        queued_ids = []
         debug.append("=== ct_qwen_cameratransform ===")
         debug.append(f"Mode : {mode}")
         debug.append(f"Host : {host}")
@@ -68,8 +77,7 @@ class QwenCameraTrigger:
                 raise FileNotFoundError(f"Base workflow not found: {json_file}")
 
             print("[QwenCam] Step 2: Loading JSON")
-            with open(json_file, 'r', encoding='utf-8') as f:
-                base_workflow = json.load(f)
+            template = workflow_templates.load_template(json_file)
             print("[QwenCam] JSON loaded successfully")
 
             debug.append(f"Loaded base workflow: {json_file}")
@@ -83,7 +91,7 @@ class QwenCameraTrigger:
             if not image_paths:
                 debug.append(f"No images found for pattern: {search_pattern}")
                 print("[QwenCam] No images → early return")
-                return ("\n".join(debug), "No matching images", 0)
+                return completion_tracker.render_result(("\n".join(debug), "No matching images", 0), queued_ids, host)
 
             debug.append(f"Found {len(image_paths)} input image(s)")
 
@@ -117,11 +125,15 @@ class QwenCameraTrigger:
             if not combinations:
                 debug.append(f"WARNING: no camera angles generated for mode '{mode}'")
                 print("[QwenCam] No combinations → returning early")
-                return ("\n".join(debug), f"No angles for mode {mode}", 0)
+                return completion_tracker.render_result(("\n".join(debug), f"No angles for mode {mode}", 0),
+                                                        queued_ids, host)
 
             debug.append(f"→ Generating {len(combinations)} camera setups per input image")
 
             queued_ids = []
+            # Rendered once; every camera job copies only the nodes it patches (copy-on-write)
+            base_workflow = template.render()
+            patched_nodes = ["8", "4", "2:105"] + template.nodes_of_class("SaveImage")
 
             for img_idx, full_img_path in enumerate(image_paths, 1):
                 filename = os.path.basename(full_img_path)
@@ -136,7 +148,7 @@ class QwenCameraTrigger:
                 for cam_idx, (h_angle, v_angle, zoom) in enumerate(combinations, 1):
                     print(f"[QwenCam]   → Cam {cam_idx}/{len(combinations)}  h={h_angle:.1f} v={v_angle:.1f} z={zoom:.1f}")
 
-                    workflow = json.loads(json.dumps(base_workflow))
+                    workflow = workflow_templates.fork(base_workflow, patched_nodes)
 
                     # Absolute path for LoadImage
                     abs_image_path = os.path.abspath(full_img_path)
@@ -167,13 +179,14 @@ class QwenCameraTrigger:
                     # e.g. project/seq/shot/5angles/a_5angles_i01_c001_...
                     prefix = f"{project}/{sequence}/{shot}/{original_mode}/{name}_{original_mode}_i{img_idx:02d}_c{cam_idx:03d}_h{int(h_angle):03d}_v{int(v_angle):+03d}_z{zoom:.1f}_"
                     print(f"[QwenCam]     Setting SaveImage prefix: {prefix}")
-                    for node_id, node in workflow.items():
-                        if node.get("class_type") == "SaveImage":
-                            node["inputs"]["filename_prefix"] = prefix
+                    for node_id in template.nodes_of_class("SaveImage"):
+                        workflow[node_id]["inputs"]["filename_prefix"] = prefix
 
                     print("[QwenCam]     Sending to ComfyUI API...")
                     payload = {"prompt": workflow}
                     payload["client_id"] = str(uuid.uuid4())
+                    if front:
+                        payload["front"] = True  # ahead of everything already queued
 
                     if not requests:
                         print("[QwenCam]     requests library missing!")
@@ -181,7 +194,7 @@ class QwenCameraTrigger:
                         continue
 
                     try:
-                        resp = requests.post(f"http://{host}/prompt", json=payload, timeout=12)
+                        resp = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(payload), timeout=12)
                         print(f"[QwenCam]     Response: {resp.status_code}")
                         if resp.ok:
                             prompt_id = resp.json().get("prompt_id")
@@ -197,11 +210,13 @@ class QwenCameraTrigger:
                         errors.append(f"Request exception cam {cam_idx}: {str(req_e)}")
 
             print(f"[QwenCam] All jobs processed - queued {jobs_queued}")
+            debug.append(http_pool.format_pool_stats())
             status_msg = f"Queued {jobs_queued} jobs | {len(errors)} errors"
             debug.append(f"Finished → {status_msg}")
 
             print("[QwenCam] === execute() FINISHED normally ===")
-            return ("\n".join(debug), status_msg, jobs_queued)
+            return completion_tracker.render_result(("\n".join(debug), status_msg, jobs_queued), queued_ids, host,
+                                                    "; ".join(errors[:3]) if errors else None)
 
         except Exception as e:
             print(f"[QwenCam] !!! EXCEPTION: {type(e).__name__} - {str(e)}")
@@ -212,7 +227,8 @@ class QwenCameraTrigger:
             debug.append("Exception occurred:")
             debug.append(tb.strip())
             print("[QwenCam] === execute() FINISHED with exception ===")
-            return ("\n".join(debug), "Execution failed", jobs_queued)
+            return completion_tracker.render_result(("\n".join(debug), "Execution failed", jobs_queued), queued_ids,
+                                                    host, f"QwenCameraTrigger: {e}")
 
 
 # Registration
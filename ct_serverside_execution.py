@@ -4,6 +4,14 @@ import shutil
 import glob
 import json
 import requests  # For internal queuing
+try:
+    from . import http_pool  # shared keep-alive sessions (package import inside ComfyUI)
+except ImportError:
+    import http_pool
+try:
+    from . import workflow_templates  # compiled base workflows (package import inside ComfyUI)
+except ImportError:
+    import workflow_templates
 import time
 import uuid
 import random
@@ -11,6 +19,8 @@ from io import StringIO
 import traceback
 import sys
 
+WAN_PLACEHOLDERS = ("REPLACETEXT", "PROJECT", "SEQUENCE", "SHOT", "NAME")
+
 # Copied from ct_wan2_5s.py for node extraction and defaults
 NODE_DEFAULTS = {
     "KSampler": {"steps": 20, "cfg": 8.0, "sampler_name": "euler", "scheduler": "normal", "denoise": 1.0, "seed": 0},
@@ -118,13 +128,12 @@ class CTServersideExecution:
                 # Build sub-payload (reuse ct_wan2_5s.py style)
                 if not os.path.exists(base_wan_path):
                     raise FileNotFoundError(f"WAN base missing: {base_wan_path}")
-                with open(base_wan_path, 'r') as f:
-                    loaded_data = json.load(f)
-                payload_str = json.dumps(loaded_data)
-                # Replaces (like in ct_wan2_5s.py)
-                payload_str = payload_str.replace("REPLACETEXT", workflow)
-                payload_str = payload_str.replace("PROJECT", project).replace("SEQUENCE", sequence).replace("SHOT", shot).replace("NAME", name)
-                sub_payload = json.loads(payload_str)
+                template = workflow_templates.load_template(base_wan_path, WAN_PLACEHOLDERS)
+                # Replaces (like in ct_wan2_5s.py), bound per string value so the prompt text is left alone
+                sub_payload = template.render({
+                    "REPLACETEXT": workflow,
+                    "PROJECT": project, "SEQUENCE": sequence, "SHOT": shot, "NAME": name,
+                }, writable=["15", "6", "8", "9:235", "9:236", "11"])  # copy-on-write: only the overridden nodes
                 sub_prompt = sub_payload.get("prompt", sub_payload)
 
                 # Single-image overrides
@@ -155,7 +164,7 @@ class CTServersideExecution:
                 if requests is None:
                     debug_lines.append("❌ requests missing—cannot queue sub-job")
                     continue
-                resp = requests.post(f"http://{local_host}/prompt", json=final_sub_payload)
+                resp = http_pool.post_bytes(f"http://{local_host}/prompt", workflow_templates.encode_payload(final_sub_payload))
                 if resp.ok:
                     sub_id = resp.json().get("prompt_id")
                     queued_sub_ids.append(sub_id)
@@ -1,7 +1,5 @@
 import json
 import sys
-import uuid
-import time
 import random
 from io import StringIO
 import os
@@ -11,6 +9,13 @@ try:
     import requests
 except ImportError:
     requests = None
+# keep-alive sessions, compiled base workflows, render results for the launcher
+try:
+    from . import completion_tracker, http_pool, workflow_templates  # package import inside ComfyUI
+except ImportError:
+    import completion_tracker
+    import http_pool
+    import workflow_templates
 
 LOADIMAGE_DIR = os.getenv('COMFYUI_OUTPUT', '/ComfyUI/output')
 NODE_DEFAULTS = {
@@ -58,6 +63,13 @@ def extract_prompt_from_workflow(full_workflow):
     api_prompt = {"prompt": node_data}
     return api_prompt
 
+def _report_completion(state):
+    elapsed = f" in {state.finished_at - state.submitted_at:.0f}s" if state.finished_at else ""
+    if state.status == completion_tracker.DONE:
+        print(f"[CT_WAN] ✅ {state.prompt_id[:8]} done{elapsed} ({len(state.outputs)} outputs)")
+    else:
+        print(f"[CT_WAN] ❌ {state.prompt_id[:8]} failed{elapsed}: {state.error}")
+
 class CT_WAN_TRIGGER:
     @classmethod
     def INPUT_TYPES(cls):
@@ -75,6 +87,8 @@ class CT_WAN_TRIGGER:
                 "sequence": ("STRING", {"default": "seq", "multiline": False}),
                 "shot": ("STRING", {"default": "shot", "multiline": False}),
                 "name": ("STRING", {"default": "name", "multiline": False}),
+                "front": ("BOOLEAN", {"default": False, "label_on": "yes", "label_off": "no",
+                          "tooltip": "Queue the render jobs at the front of the host's queue (priority shots)"}),
             }
         }
 
@@ -84,9 +98,13 @@ class CT_WAN_TRIGGER:
     CATEGORY = "ct_tools"
     OUTPUT_NODE = True
 
-    def execute(self, workflow_json, host, width, height, json_file=None, num_jobs=1, project=None, sequence=None, shot=None, name=None):
+    def execute(self, workflow_json, host, width, height, json_file=None, num_jobs=1, project=None, sequence=None, shot=None, name=None,
+                front=False):
         debug_lines = []
+        queued_ids = []
         returned_json = None
+        tracker = completion_tracker.shared_tracker()
+        tracker.watch(host)  # listen before posting so no completion event is missed
         try:
             debug_lines.append("=== DEBUG START ===")
             debug_lines.append(f"📁 Output: {LOADIMAGE_DIR} | LoadImage: {LOADIMAGE_DIR}")
@@ -96,18 +114,16 @@ class CT_WAN_TRIGGER:
             debug_lines.append(f"Using file: {base_path}")
             if not os.path.exists(base_path):
                 raise FileNotFoundError(f"❌ File missing: {base_path}")
-            with open(base_path, 'r') as f:
-                loaded_data = json.load(f)
-            payload_str = json.dumps(loaded_data)
-            debug_lines.append(f"✅ Loaded ({len(payload_str)} chars): {payload_str[:300]}...")
-            original_count = payload_str.count("REPLACETEXT")
+            template = workflow_templates.load_template(base_path)
+            debug_lines.append(f"✅ Loaded template: {len(template.nodes_by_class)} node classes")
+            original_count = template.count()
             debug_lines.append(f"Found {original_count} 'REPLACETEXT'")
             if workflow_json.strip():
-                payload_str = payload_str.replace("REPLACETEXT", workflow_json)
+                loaded_data = template.render({workflow_templates.PLACEHOLDER: workflow_json})
                 debug_lines.append(f"✅ Replaced with '{workflow_json}'")
             else:
+                loaded_data = template.render()
                 debug_lines.append("⚠️ No text; using original")
-            loaded_data = json.loads(payload_str)
             if "nodes" in loaded_data:
                 debug_lines.append("🔄 Extracting from full workflow")
                 payload = extract_prompt_from_workflow(loaded_data)
@@ -159,7 +175,7 @@ class CT_WAN_TRIGGER:
                     if not images_to_process:
                         debug_lines.append("⚠️ No new images to process (all have videos) - queuing batch workflow to scan later")
                         # Queue batch when no new images
-                        job_payload = json.loads(json.dumps(base_payload))
+                        job_payload = workflow_templates.fork(base_payload, ["15", "16", "9:235", "9:236"])
                         job_prompt = job_payload.get("prompt", job_payload)
                         container_dir = f"{LOADIMAGE_DIR}/{project}/{sequence}/{shot}"
                         if "15" in job_prompt:
@@ -174,11 +190,13 @@ class CT_WAN_TRIGGER:
                             if sampler_id in job_prompt:
                                 job_prompt[sampler_id]["inputs"]["noise_seed"] = seed
                                 debug_lines.append(f"🔀 Batch job seed: {seed} for {sampler_id}")
-                        job_payload["client_id"] = str(uuid.uuid4())
+                        job_payload["client_id"] = tracker.client_id  # completion events go to this client
+                        if front:
+                            job_payload["front"] = True  # ahead of everything already queued
                         if requests is None:
                             debug_lines.append("❌ Batch failed: requests library not available")
                         else:
-                            response = requests.post(f"http://{host}/prompt", json=job_payload)
+                            response = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(job_payload))
                             debug_lines.append(f"Batch status {response.status_code} | ID {job_payload['client_id'][:8]}")
                             if response.ok:
                                 resp_data = response.json()
@@ -194,7 +212,7 @@ class CT_WAN_TRIGGER:
                         os.makedirs(output_dir, exist_ok=True)
                         debug_lines.append(f"✅ Using output dir: {output_dir}")
                         for i, image in enumerate(images_to_process):
-                            job_payload = json.loads(json.dumps(base_payload))
+                            job_payload = workflow_templates.fork(base_payload, ["15", "8", "9:235", "9:236"])
                             job_prompt = job_payload.get("prompt", job_payload)
                             container_image_path = os.path.join(LOADIMAGE_DIR, project, sequence, shot, image)
                             if "15" in job_prompt:
@@ -214,11 +232,13 @@ class CT_WAN_TRIGGER:
                                     seed_set = True
                             if not seed_set:
                                 debug_lines.append("⚠️ No KSamplerAdvanced samplers found—seeds unchanged")
-                            job_payload["client_id"] = str(uuid.uuid4())
+                            job_payload["client_id"] = tracker.client_id  # completion events go to this client
+                            if front:
+                                job_payload["front"] = True  # ahead of everything already queued
                             if requests is None:
                                 debug_lines.append(f"❌ Job {i+1} ({image}) failed: requests library not available")
                                 continue
-                            response = requests.post(f"http://{host}/prompt", json=job_payload)
+                            response = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(job_payload))
                             debug_lines.append(f"Job {i+1} ({image}): Status {response.status_code} | ID {job_payload['client_id'][:8]}")
                             if response.ok:
                                 resp_data = response.json()
@@ -230,7 +250,7 @@ class CT_WAN_TRIGGER:
             else:
                 debug_lines.append("⚠️ Missing path fields; using fallback num_jobs mode")
                 for i in range(num_jobs):
-                    job_payload = json.loads(json.dumps(base_payload))
+                    job_payload = workflow_templates.fork(base_payload, ["9:235", "9:236"])
                     job_prompt = job_payload.get("prompt", job_payload)
                     seed = random.randint(0, 2**32 - 1)
                     for sampler_id in ["9:235", "9:236"]:
@@ -238,11 +258,13 @@ class CT_WAN_TRIGGER:
                             job_prompt[sampler_id]["inputs"]["noise_seed"] = seed
                             debug_lines.append(f"🔀 Job {i+1}: Seed {seed} for {sampler_id}")
                             break
-                    job_payload["client_id"] = str(uuid.uuid4())
+                    job_payload["client_id"] = tracker.client_id  # completion events go to this client
+                    if front:
+                        job_payload["front"] = True  # ahead of everything already queued
                     if requests is None:
                         debug_lines.append(f"❌ Job {i+1} failed: requests library not available")
                         continue
-                    response = requests.post(f"http://{host}/prompt", json=job_payload)
+                    response = http_pool.post_bytes(f"http://{host}/prompt", workflow_templates.encode_payload(job_payload))
                     debug_lines.append(f"Job {i+1}: Status {response.status_code} | ID {job_payload['client_id'][:8]}")
                     if response.ok:
                         resp_data = response.json()
@@ -252,51 +274,27 @@ class CT_WAN_TRIGGER:
                 returned_json = json.dumps({'queued_ids': queued_ids})
                 debug_lines.append(f"✅ Queued {len(queued_ids)} fallback jobs")
             if queued_ids:
-                prompt_id = queued_ids[0]
-                debug_lines.append(f"⏳ Polling first job {prompt_id[:8]} (up to 300s)...")
-                poll_interval = 10  # seconds
-                timeout = 300  # 5 minutes max
-                start_time = time.time()
-                job_complete = False
-                while time.time() - start_time < timeout:
-                    if requests is None:
-                        debug_lines.append("❌ Cannot poll: requests library not available")
-                        break
-                    history_resp = requests.get(f"http://{host}/history/{prompt_id}")
-                    if history_resp.ok:
-                        full_history = history_resp.json()
-                        history = full_history.get(prompt_id, {})
-                        if history and 'outputs' in history and history['outputs']:
-                            debug_lines.append("=== FIRST JOB HISTORY ===")
-                            debug_lines.append(json.dumps(history, indent=2)[:300] + "...")
-                            outputs = history.get("outputs", {})
-                            debug_lines.append(f"✅ {len(outputs)} outputs for job 1!")
-                            errors = history.get("errors", [])
-                            if errors:
-                                debug_lines.append(f"Errors: {errors}")
-                            job_complete = True
-                            break
-                        else:
-                            debug_lines.append(f"⏳ Job still running... (checked at {int(time.time() - start_time)}s)")
-                    else:
-                        debug_lines.append(f"⚠️ Poll failed: {history_resp.status_code}")
-                    time.sleep(poll_interval)
-                if not job_complete:
-                    debug_lines.append("⚠️ Job timed out after 300s - still running or issue with workflow (check SaveVideo node)")
-                else:
-                    debug_lines.append("✅ First job completed successfully")
+                # Completion is reported by the tracker (websocket, /history fallback) instead of
+                # blocking this worker: the queued jobs cannot start on this host while it waits.
+                for prompt_id in queued_ids:
+                    tracker.track(host, prompt_id, info={'project': project, 'sequence': sequence,
+                                                          'shot': shot, 'name': name},
+                                  callback=_report_completion)
+                debug_lines.append(f"👀 Tracking {len(queued_ids)} job(s) via {tracker.mode(host)}")
             debug_lines.append("=== DEBUG END ===")
-            return ("\n".join(debug_lines), returned_json, 1)
+            return completion_tracker.render_result(("\n".join(debug_lines), returned_json, 1), queued_ids, host)
         except json.JSONDecodeError as e:
             debug_lines.append(f"❌ JSON Error (line {e.lineno}): {str(e)}")
-            return ("\n".join(debug_lines), None, 0)
+            return completion_tracker.render_result(("\n".join(debug_lines), None, 0), queued_ids, host,
+                                                    f"CT_WAN_TRIGGER: {e}")
         except FileNotFoundError as e:
-            return (str(e), None, 0)
+            return completion_tracker.render_result((str(e), None, 0), queued_ids, host, str(e))
         except Exception as e:
             import traceback
             debug_lines.append(f"❌ Error: {str(e)}")
             debug_lines.append(traceback.format_exc())
-            return ("\n".join(debug_lines), None, 0)
+            return completion_tracker.render_result(("\n".join(debug_lines), None, 0), queued_ids, host,
+                                                    f"CT_WAN_TRIGGER: {e}")
 
 # LOCAL MAPPINGS ONLY - No built-ins!
 NODE_CLASS_MAPPINGS = {"CT_WAN_TRIGGER": CT_WAN_TRIGGER}
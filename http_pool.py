@@ -0,0 +1,100 @@
+# http_pool.py - Shared keep-alive HTTP sessions for talking to ComfyUI hosts
+# Used by the launcher (scripts/launcher.py) and by every trigger node, so repeated
+# /prompt posts to the same host reuse open connections instead of a new TCP connect each.
+# One requests.Session per host with a bounded connection pool, plus reuse counters.
+import threading
+from urllib.parse import urlsplit
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+CONNECT_TIMEOUT = 5    # seconds to open a connection
+READ_TIMEOUT = 30      # seconds to wait for a response
+POOL_MAXSIZE = 8       # open connections kept per host
+DEFAULT_TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _host_of(url: str) -> str:
+    parts = urlsplit(url if "://" in url else f"http://{url}")
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def session_for(url: str):
+    """Keep-alive session for the host of url, created on first use."""
+    host = _host_of(url)
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                if requests is None:
+                    raise RuntimeError("requests library not available")
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, pool_block=False)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _sessions[host] = session
+    return session
+
+
+def post(url: str, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Drop-in for requests.post() over the shared session of the host."""
+    return session_for(url).post(url, timeout=timeout, **kwargs)
+
+
+def post_bytes(url: str, body: bytes, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """POST an already serialized JSON body (see workflow_templates.encode_payload)."""
+    headers = {"Content-Type": "application/json", **kwargs.pop("headers", {})}
+    return session_for(url).post(url, data=body, headers=headers, timeout=timeout, **kwargs)
+
+
+def get(url: str, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Drop-in for requests.get() over the shared session of the host."""
+    return session_for(url).get(url, timeout=timeout, **kwargs)
+
+
+def pool_stats() -> dict:
+    """
+    Per host: requests sent, connections opened and requests that reused an open connection.
+    Counted from the urllib3 pools behind each session.
+    """
+    stats = {}
+    with _lock:
+        sessions = list(_sessions.items())
+    for host, session in sessions:
+        sent = opened = 0
+        for adapter in set(session.adapters.values()):
+            manager = getattr(adapter, "poolmanager", None)
+            if manager is None:
+                continue
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                sent += getattr(pool, "num_requests", 0)
+                opened += getattr(pool, "num_connections", 0)
+        stats[host] = {"requests": sent, "connections": opened, "reused": max(0, sent - opened)}
+    return stats
+
+
+def format_pool_stats() -> str:
+    stats = pool_stats()
+    if not stats:
+        return "HTTP pool: no requests"
+    parts = [f"{host} {s['requests']} req / {s['connections']} conn ({s['reused']} reused)"
+             for host, s in sorted(stats.items())]
+    return "HTTP pool: " + ", ".join(parts)
+
+
+def close_all() -> None:
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,116 @@
+# backlog.py
+# Local backlog of planned jobs that have not been handed to a host yet. Every submission passes
+# through it; with in-flight limits (FLUX_MAX_INFLIGHT etc.) jobs wait here instead of in a
+# ComfyUI queue. One heap per job family; higher priority goes first (job['priority'], see
+# parser.shot_priority), submission order within a priority.
+# Jobs are pulled from the job source lazily, at most FILL_WINDOW waiting at a time, so planning
+# streams like before and priorities apply within that window.
+# Jobs still in the backlog can be reprioritised while the run is going.
+
+import heapq
+import itertools
+import threading
+
+import host_scheduler
+
+DEFAULT_PRIORITY = 0
+WAIT_STEP = 0.5  # seconds between re-checks while no family can take a job
+FILL_WINDOW = 256  # jobs pulled from the source ahead of the hosts
+
+
+class Backlog:
+    def __init__(self, jobs=(), window: int = FILL_WINDOW):
+        self._heaps = {}   # family -> [(-priority, order, job)]
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._source = iter(jobs)
+        self._overrides = []  # (match, priority) of reprioritise(), for jobs not pulled yet
+        self.window = window
+
+    def put(self, job: dict, priority: int = None) -> None:
+        if priority is None:
+            priority = job.get('priority', DEFAULT_PRIORITY)
+        else:
+            job['priority'] = priority
+        with self._cond:
+            self._push(job, priority)
+            self._cond.notify_all()
+
+    def _push(self, job: dict, priority: int) -> None:
+        family = host_scheduler.family_of(job['jt'])
+        heapq.heappush(self._heaps.setdefault(family, []), (-priority, next(self._order), job))
+
+    def _fill(self) -> None:
+        """Pull jobs from the source until window are waiting or it runs dry (lock held)."""
+        while self._source is not None and sum(len(heap) for heap in self._heaps.values()) < self.window:
+            job = next(self._source, None)
+            if job is None:
+                self._source = None
+                return
+            for match, priority in self._overrides:
+                if match(job):
+                    job['priority'] = priority
+            self._push(job, job.get('priority', DEFAULT_PRIORITY))
+
+    def __len__(self) -> int:
+        with self._cond:
+            return sum(len(heap) for heap in self._heaps.values())
+
+    def counts(self) -> dict:
+        """Jobs waiting per family."""
+        with self._cond:
+            return {family: len(heap) for family, heap in self._heaps.items() if heap}
+
+    def reprioritise(self, match, priority: int) -> int:
+        """
+        Give every waiting job with match(job) true the priority; returns how many changed.
+        Matching jobs still to be pulled from the source get it too.
+        """
+        changed = 0
+        with self._cond:
+            if self._source is not None:
+                self._overrides.append((match, priority))
+            for family, heap in self._heaps.items():
+                entries = []
+                for key, order, job in heap:
+                    if match(job) and key != -priority:
+                        key = -priority
+                        job['priority'] = priority
+                        changed += 1
+                    entries.append((key, order, job))
+                heapq.heapify(entries)
+                self._heaps[family] = entries
+            self._cond.notify_all()
+        return changed
+
+    def wake(self) -> None:
+        """Re-check waiting getters (call when hosts gain room)."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def get(self, ready, stop: threading.Event = None):
+        """
+        Best waiting job for which ready(job) is true, blocking until there is one. Only the head
+        of each family is offered, so a family's order is kept. None once the backlog and its
+        source are empty or stop is set.
+        """
+        with self._cond:
+            while stop is None or not stop.is_set():
+                self._fill()
+                heads = [heap[0] for heap in self._heaps.values() if heap]
+                if not heads:
+                    return None
+                for entry in sorted(heads, key=lambda e: e[:2]):
+                    if ready(entry[2]):
+                        heap = self._heaps[host_scheduler.family_of(entry[2]['jt'])]
+                        return heapq.heappop(heap)[2]
+                self._cond.wait(WAIT_STEP)
+            return None
+
+    def drain(self, ready, stop: threading.Event = None):
+        """Jobs in backlog order as ready() lets them through, until the backlog is empty."""
+        while True:
+            job = self.get(ready, stop)
+            if job is None:
+                return
+            yield job
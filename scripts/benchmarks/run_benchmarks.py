@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# benchmarks/run_benchmarks.py
+# Times the launcher pipeline on synthetic stories, one phase at a time:
+#   parse    - parser.parse_config on the story file
+#   cache    - config_cache.load_document on a warm sidecar cache
+#   collect  - launcher.collect_jobs over the parsed config
+#   payload  - launcher.load_and_modify_workflow + encoding to the posted bytes for every job
+# Peak memory per phase is measured in a separate tracemalloc pass so it does not skew timings.
+#
+# Usage:
+#   python scripts/benchmarks/run_benchmarks.py
+#   python scripts/benchmarks/run_benchmarks.py --sizes 100,1000,10000,100000
+#   python scripts/benchmarks/run_benchmarks.py --save-baseline local
+#   python scripts/benchmarks/run_benchmarks.py --compare local
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+sys.path.insert(0, SCRIPTS_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import parser  # config parser
+import config_cache
+import launcher
+import workflow_templates  # root level, put on sys.path by launcher
+from synthetic_story import write_story
+
+PHASES = ('parse', 'cache', 'collect', 'payload')
+DEFAULT_SIZES = (100, 1000, 10000)
+REGRESSION_FACTOR = 1.2
+
+
+class _NullWriter(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+
+def _quiet():
+    """The launcher prints per job; keep that (and its buffering) out of the measurements."""
+    return contextlib.redirect_stdout(_NullWriter())
+
+
+def build_payloads(jobs):
+    """
+    Payload phase: what run_storytools_execution does per job, minus the HTTP post -
+    build the payload, then the request body of each of its num_jobs posts.
+    """
+    total_bytes = 0
+    for job in jobs:
+        base_path = launcher.jobtype_to_json.get(job['jt'])
+        if not base_path:
+            continue
+        payload, _server = launcher.load_and_modify_workflow(base_path, dict(job), job['seed_start'])
+        body = workflow_templates.encode_payload(payload)
+        for i in range(job['num_jobs']):
+            total_bytes += len(workflow_templates.with_client_id(body, f"bench_{i}"))
+    return total_bytes
+
+
+def _phase_funcs(story_path):
+    state = {}
+
+    def parse():
+        state['config'] = parser.parse_config(story_path)
+
+    def cache():
+        config_cache.load_document(story_path)
+
+    def collect():
+        state['jobs'] = launcher.collect_jobs(state['config'])
+
+    def payload():
+        state['payload_bytes'] = build_payloads(state['jobs'])
+
+    return state, {'parse': parse, 'cache': cache, 'collect': collect, 'payload': payload}
+
+
+def _best_of(func, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_size(num_shots, repeats, workdir):
+    story_path = write_story(os.path.join(workdir, f'story_{num_shots}.txt'), num_shots)
+    state, funcs = _phase_funcs(story_path)
+
+    with _quiet():
+        # Warm the sidecar cache and the host queues once, outside the timings
+        config_cache.load_document(story_path)
+        funcs['parse']()
+        launcher.init_host_queues(state['config']['globals'], load_aware=False)  # no polling of the fake hosts
+
+        seconds = {}
+        for phase in PHASES:
+            seconds[phase] = _best_of(funcs[phase], repeats)
+
+        peaks = {}
+        for phase in PHASES:
+            tracemalloc.start()
+            funcs[phase]()
+            peaks[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return {
+        'shots': num_shots,
+        'jobs': len(state['jobs']),
+        'story_bytes': os.path.getsize(story_path),
+        'payload_bytes': state['payload_bytes'],
+        'seconds': seconds,
+        'peak_bytes': peaks,
+    }
+
+
+def print_report(results):
+    print(f"{'shots':>8} {'jobs':>8}  " + "  ".join(f"{p + ' ms':>11}" for p in PHASES)
+          + "  " + "  ".join(f"{p + ' MB':>11}" for p in PHASES))
+    for r in results:
+        times = "  ".join(f"{r['seconds'][p] * 1000:11.1f}" for p in PHASES)
+        peaks = "  ".join(f"{r['peak_bytes'][p] / 1e6:11.2f}" for p in PHASES)
+        print(f"{r['shots']:>8} {r['jobs']:>8}  {times}  {peaks}")
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def save_baseline(name, results):
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    data = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+    with open(baseline_path(name), 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    print(f"Baseline saved: {baseline_path(name)}")
+
+
+def compare_baseline(name, results, factor=REGRESSION_FACTOR):
+    """Prints a per-phase ratio against a stored baseline. Returns the number of regressions."""
+    with open(baseline_path(name), 'r', encoding='utf-8') as f:
+        baseline = {r['shots']: r for r in json.load(f)['results']}
+
+    regressions = 0
+    print(f"\nCompared with baseline '{name}' (regression if > {factor:.2f}x):")
+    for r in results:
+        base = baseline.get(r['shots'])
+        if base is None:
+            print(f"{r['shots']:>8}: no baseline entry")
+            continue
+        cells = []
+        for phase in PHASES:
+            old = base['seconds'].get(phase)
+            if not old:
+                cells.append(f"{phase}=n/a")
+                continue
+            ratio = r['seconds'][phase] / old
+            flag = ''
+            if ratio > factor:
+                flag = ' REGRESSION'
+                regressions += 1
+            cells.append(f"{phase}={ratio:.2f}x{flag}")
+        print(f"{r['shots']:>8}: " + ", ".join(cells))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark parse / collect / payload phases on synthetic stories")
+    ap.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                    help="comma separated shot counts (default: %(default)s)")
+    ap.add_argument('--repeats', type=int, default=3, help="timing repeats per phase, best is kept")
+    ap.add_argument('--save-baseline', metavar='NAME', help="store results as baselines/NAME.json")
+    ap.add_argument('--compare', metavar='NAME', help="compare against baselines/NAME.json")
+    ap.add_argument('--factor', type=float, default=REGRESSION_FACTOR,
+                    help="slowdown ratio counted as a regression (default: %(default)s)")
+    args = ap.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ct_bench_') as workdir:
+        for num_shots in sizes:
+            print(f"Benchmarking {num_shots} shots...")
+            results.append(bench_size(num_shots, args.repeats, workdir))
+
+    print()
+    print_report(results)
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare:
+        if compare_baseline(args.compare, results, args.factor):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/synthetic_story.py
+# Generates large synthetic story configs in the same format as configs/story_template.txt
+import random
+
+JOBTYPE_MIXES = [
+    "ct_flux_t2i",
+    "ct_flux_t2i,ct_ltx2_i2v",
+    "ct_flux_t2i,ct_wan2_5s",
+    "ct_qwen_cameratransform",
+    "ct_ltx2_i2v",
+]
+
+WORDS = (
+    "golden teapot wooden table volcanic rocks stormy ocean dawn mist driftwood seashells "
+    "camera slowly tracks out waves crash fog rays shadow cinematic wide angle close up"
+).split()
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _multi_line(rng, lines, words):
+    return "\n".join(_sentence(rng, words) for _ in range(lines))
+
+
+def generate_story_lines(num_shots: int, shots_per_sequence: int = 50, seed: int = 0) -> list[str]:
+    """Globals with 8 LoRA pairs and host lists, then num_shots shot blocks."""
+    rng = random.Random(seed)
+    out = [
+        "#GLOBAL SETTINGS\n",
+        "PROJECT=Bench\n",
+        "WIDTH=1280\n",
+        "HEIGHT=720\n",
+        "\n",
+        f"GRAPHICAL_STYLE={_sentence(rng, 60)}\n",
+        f"NEGATIVE_PROMPT={_sentence(rng, 20)}\n",
+        "FLUX_HOST=172.16.1.12:8188, 192.168.20.2:8188, 192.168.20.3:8188\n",
+        "WAN_HOST=172.16.1.12:8188\n",
+        "QWEN_HOST=172.16.1.12:8188\n",
+        "LTX_HOST=172.16.1.12:8188, 192.168.20.2:8188\n",
+        "SEED_START=483647\n",
+        "FLUX_ITERATIONS=2\n",
+    ]
+    for i in range(1, 9):
+        out.append(f"FLUX_LORA{i}=lora_{i}_{_sentence(rng, 1)}.safetensors\n")
+        out.append(f"FLUX_LORA{i}_STRENGTH={rng.choice(['0.5', '0.8', '1.0', '1.5'])}\n")
+    out += [
+        "LTX_CHECKPOINT=ltx-2-19b-distilled-fp8.safetensors\n",
+        "LTX_FPS=24\n",
+        "LTX_VIDEO_LENGTH=361\n",
+        "QWEN_CAMERATRANSFORMATION_MODE=FrontBackLeftRight\n",
+        "JOBTYPE=ct_flux_t2i,ct_wan2_5s,ct_qwen_cameratransform,ct_ltx2_i2v\n",
+        "\n",
+        "SYNOPSIS=\n",
+        _multi_line(rng, 3, 12) + "\n",
+        "\n",
+    ]
+
+    for n in range(num_shots):
+        seq = f"SQ{n // shots_per_sequence:04d}"
+        shot = f"{(n % shots_per_sequence + 1) * 10:04d}"
+        out += [
+            "!---------\n",
+            f"SEQUENCE={seq}\n",
+            f"SHOT={shot}\n",
+            f"NAME=sh{shot}\n",
+            "\n",
+            f"CAMERA_PROMPT={_sentence(rng, 8)}\n",
+            f"AUDIO_PROMPT={_sentence(rng, 10)}\n",
+            "ENVIRONMENT_PROMPT=\n",
+            _multi_line(rng, rng.randint(1, 4), 25) + "\n",
+            f"ACTION_PROMPT={_sentence(rng, 8)}\n",
+            "\n",
+            "IMG_PROMPT=\n",
+            _multi_line(rng, rng.randint(1, 3), 20) + "\n",
+        ]
+        if rng.random() < 0.7:
+            out.append(f"JOBTYPE={rng.choice(JOBTYPE_MIXES)}\n")
+        if rng.random() < 0.05:
+            out.append("DISABLED=1\n")
+        if rng.random() < 0.2:
+            out.append(f"STATUS_CTFLUXT2I={rng.choice(['run', 'done', 'changes'])}\n")
+        if rng.random() < 0.1:
+            out.append(f"WIDTH={rng.choice([960, 1024, 1920])}\n")
+        out.append("\n")
+    return out
+
+
+def write_story(path, num_shots: int, seed: int = 0) -> str:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.writelines(generate_story_lines(num_shots, seed=seed))
+    return str(path)
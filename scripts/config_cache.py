@@ -0,0 +1,154 @@
+# config_cache.py
+# Sidecar cache of the parsed story config (<story>.txt.ctcache next to the story file).
+# Holds the StoryDocument snapshot: per-block values and hashes, shot ranges and ShotIndex.
+# Keyed by file size, mtime and content hash. A stale cache is not thrown away: the
+# document re-parses only the blocks that changed since it was written.
+# Files pulled in with INCLUDE= get their own sidecar holding just their parsed shot blocks;
+# on load only the included files that changed are re-parsed, in parallel.
+# Updated: JSON instead of pickle - the sidecar sits on shared storage, and unpickling a file
+# anyone can replace would run their code. A cache that is not valid JSON is just a miss.
+
+import gc
+import hashlib
+import io
+import json
+import os
+
+import parser  # config parser
+from story_document import StoryDocument
+
+CACHE_SUFFIX = '.ctcache'
+CACHE_VERSION = 3  # bump when StoryDocument.snapshot() changes (2: *_HOST_WEIGHTS in globals, 3: JSON)
+
+
+def cache_path_for(config_path) -> str:
+    return str(config_path) + CACHE_SUFFIX
+
+
+def read_story_file(config_path) -> tuple[bytes, list[str]]:
+    """Raw bytes (for hashing) and text lines, split exactly like open(...).readlines()."""
+    with open(config_path, 'rb') as f:
+        data = f.read()
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8').readlines()
+    return data, lines
+
+
+def _read_cache(cache_path):
+    """The cache entry dict (version, size, mtime_ns, digest and document or shots), None if unusable."""
+    gc.disable()  # decoding allocates lots of small containers; GC passes would dominate
+    try:
+        with open(cache_path, 'rb') as f:
+            entry = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[cache] Ignoring unreadable cache {cache_path}: {e}")
+        return None
+    finally:
+        gc.enable()
+    if not isinstance(entry, dict) or entry.get('version') != CACHE_VERSION:
+        return None
+    return entry
+
+
+def _write_cache(cache_path, size, mtime_ns, digest, **payload):
+    """payload: document=StoryDocument.snapshot() of a story file or shots=[[key, values], ...] of an included one."""
+    tmp_path = cache_path + '.tmp'
+    entry = {'version': CACHE_VERSION, 'size': size, 'mtime_ns': mtime_ns, 'digest': digest, **payload}
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[cache] Could not write {cache_path}: {e}")
+
+
+def load_document(config_path, use_cache: bool = True) -> StoryDocument:
+    """
+    Load a story file into a StoryDocument, going through the sidecar cache.
+    Exact hit: no parsing at all. Stale cache: only changed blocks are re-parsed.
+    """
+    data, lines = read_story_file(config_path)
+    if not use_cache:
+        document = StoryDocument()
+        document.load(lines)
+        return document
+
+    st = os.stat(config_path)
+    digest = hashlib.sha1(data).hexdigest()
+    cache_path = cache_path_for(config_path)
+
+    entry = _read_cache(cache_path)
+    if entry is not None and 'document' not in entry:
+        entry = None  # cache of the same file read as an included shot file
+    if entry is not None:
+        try:
+            document = StoryDocument.restore(entry['document'])
+        except Exception as e:
+            print(f"[cache] Ignoring unreadable cache {cache_path}: {e}")
+            entry = None
+    if entry is not None:
+        if entry['size'] == st.st_size and entry['digest'] == digest:
+            document.lines = lines
+            if entry['mtime_ns'] != st.st_mtime_ns:
+                # touched but unchanged - refresh the key so the next check is exact
+                _write_cache(cache_path, st.st_size, st.st_mtime_ns, digest, document=entry['document'])
+            print(f"[cache] Hit: {cache_path}")
+            return document
+        reparsed = document.update(lines)
+        print(f"[cache] Stale: re-parsed {reparsed}/{len(document.blocks)} blocks")
+    else:
+        document = StoryDocument()
+        document.load(lines)
+        print(f"[cache] Miss: parsed {len(document.blocks)} blocks")
+
+    _write_cache(cache_path, st.st_size, st.st_mtime_ns, digest, document=document.snapshot())
+    return document
+
+
+def _cached_shots(file_path):
+    """Parsed shot blocks of an included file if its cache entry is current, else None."""
+    entry = _read_cache(cache_path_for(file_path))
+    if entry is None or not isinstance(entry.get('shots'), list):
+        return None
+    st = os.stat(file_path)
+    if entry['size'] != st.st_size:
+        return None
+    if entry['mtime_ns'] != st.st_mtime_ns:
+        with open(file_path, 'rb') as f:
+            if hashlib.sha1(f.read()).hexdigest() != entry['digest']:
+                return None
+    try:
+        return [(tuple(key), values) for key, values in entry['shots']]
+    except (TypeError, ValueError):
+        return None
+
+
+def load_shot_file(file_path):
+    """Parse an included file and refresh its cache entry (runs in a worker process)."""
+    data, lines = read_story_file(file_path)
+    st = os.stat(file_path)
+    shots = parser.scan_shot_file(lines)
+    _write_cache(cache_path_for(file_path), st.st_size, st.st_mtime_ns, hashlib.sha1(data).hexdigest(),
+                 shots=[[list(key), values] for key, values in shots])
+    return shots
+
+
+def load_config(config_path, use_cache: bool = True):
+    """Cached drop-in for parser.parse_config(), INCLUDE= files included."""
+    config = load_document(config_path, use_cache).config
+    paths = parser.include_paths(config['globals'], os.path.dirname(os.path.abspath(config_path)))
+    if not paths:
+        return config
+    return parser.merge_included(config, load_included(paths, use_cache))
+
+
+def load_included(paths: list[str], use_cache: bool = True) -> list:
+    """Parsed shot blocks of each INCLUDE= file, in order. Only files whose cache is stale are parsed, in parallel."""
+    if not use_cache:
+        return parser.map_files(parser.read_shot_file, paths)
+    included = [_cached_shots(p) for p in paths]
+    stale = [p for p, shots in zip(paths, included) if shots is None]
+    parsed = dict(zip(stale, parser.map_files(load_shot_file, stale)))
+    print(f"[cache] Includes: {len(paths) - len(stale)} cached, {len(stale)} parsed")
+    return [parsed[p] if shots is None else shots for p, shots in zip(paths, included)]
@@ -0,0 +1,68 @@
+# fingerprint_store.py
+# Fingerprints of the last successfully rendered job per shot and jobtype,
+# kept next to the story file (<story>.txt.fingerprints.json).
+# A job is recorded once all of its prompts finished done, so only runs that follow their prompts
+# (launcher --wait, the GUI) update the store; a job that fails or is interrupted stays dirty.
+# The launcher's --dirty mode only queues jobs whose parser.shot_fingerprint() changed since.
+
+import json
+import os
+
+import parser  # config parser
+
+FINGERPRINT_SUFFIX = '.fingerprints.json'
+
+
+def store_path_for(config_path) -> str:
+    return str(config_path) + FINGERPRINT_SUFFIX
+
+
+def job_key(job: dict) -> str:
+    return f"{job['jt']}/{job['project']}/{job['sequence']}/{job['shot_id']}/{job['subshot_id']}"
+
+
+def job_fingerprint(job: dict) -> str:
+    """Fingerprint of a collected job, computed once and kept on the job dict."""
+    fp = job.get('fingerprint')
+    if fp is None:
+        fp = job['fingerprint'] = parser.shot_fingerprint(job['shot_data'], job['jt'])
+    return fp
+
+
+def load_fingerprints(config_path) -> dict:
+    path = store_path_for(config_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"[fingerprints] Ignoring unreadable {path}: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_fingerprints(config_path, fingerprints: dict) -> None:
+    path = store_path_for(config_path)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(fingerprints), f, indent=0, sort_keys=True)  # may be updated by tracker threads
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"[fingerprints] Could not write {path}: {e}")
+
+
+def record_success(fingerprints: dict, job: dict) -> None:
+    fingerprints[job_key(job)] = job_fingerprint(job)
+
+
+def filter_dirty(jobs, fingerprints: dict):
+    """Yield only jobs whose fingerprint differs from the stored last-success one."""
+    unchanged = 0
+    for job in jobs:
+        if fingerprints.get(job_key(job)) == job_fingerprint(job):
+            unchanged += 1
+            continue
+        yield job
+    print(f"[fingerprints] Skipped {unchanged} unchanged jobs")
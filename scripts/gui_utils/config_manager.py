@@ -1,89 +1,176 @@
 # gui_utils/config_manager.py
-import re
+# Shots of INCLUDE= files are merged into the tree like parse_config does; each included file
+# keeps its own lines and shot ranges, so its shots are edited, run and marked in that file.
+import os
 from pathlib import Path
 
-import parser  # config_parser.py – assumed to exist
+import config_cache
+import parser
+from story_document import StoryDocument
+
+
+class IncludedFile:
+    """Lines and parsed shot blocks of one INCLUDE= file; line ranges are scanned on first use."""
+
+    def __init__(self, path: Path, lines: list[str], shots: list):
+        self.path = path
+        self.lines = lines
+        self.shots = shots
+        self._shot_ranges = None
+
+    @property
+    def shot_ranges(self) -> dict:
+        if self._shot_ranges is None:
+            self._shot_ranges = parser.fill_shot_ranges({}, (
+                (start, end, *parser.scan_block(self.lines[start:end])[1:])
+                for start, end in parser.split_blocks(self.lines)
+            ))
+        return self._shot_ranges
 
 
 class ConfigManager:
     def __init__(self):
         self.config_path: Path | None = None
-        self.config = {}
+        self.document = StoryDocument()
+        self.document_path: Path | None = None
+        self.config = self.document.config
         self.original_lines = []
-        self.shot_ranges = {}
+        self.shot_ranges = self.document.shot_ranges
+        self.includes: list[IncludedFile] = []
         self.project = ""
 
     def load_config(self, path: Path):
         self.config_path = path
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                self.original_lines = f.readlines()
-            self.config = parser.parse_config(str(path))
-            self.project = self.config.get("globals", {}).get("PROJECT", "Unknown")
-            self._scan_shot_ranges()
+            if self.document_path != Path(path) or not self.document.blocks:
+                # Opening a file: start from the sidecar cache instead of a full text parse
+                self.document = config_cache.load_document(path)
+                self.document_path = Path(path)
+            else:
+                # Reloading only re-parses the blocks whose text changed on disk
+                _, lines = config_cache.read_story_file(path)
+                self.document.update(lines)
+            self._load_includes()
+            self._sync_from_document()
             return True, ""
         except Exception as e:
+            self.document = StoryDocument()
+            self.document_path = None
+            self.includes = []
             return False, str(e)
 
+    def _load_includes(self):
+        base_dir = os.path.dirname(os.path.abspath(self.config_path))
+        paths = parser.include_paths(self.document.config['globals'], base_dir)
+        dropped = {key for inc in self.includes for key, _ in inc.shots}  # merged in before a reload
+        self.includes = [
+            IncludedFile(Path(p), config_cache.read_story_file(p)[1], shots)
+            for p, shots in zip(paths, config_cache.load_included(paths))
+        ]
+        self._merge_includes(dropped)
+
+    def _merge_includes(self, dropped=()):
+        # Shots an included file no longer has fall back to the main file's block (or go)
+        self.document.reset_shots(dropped)
+        if self.includes:
+            parser.merge_included(self.document.config, [inc.shots for inc in self.includes])
+
+    def _sync_from_document(self):
+        self.original_lines = self.document.lines
+        self.config = self.document.config
+        self.shot_ranges = self.document.shot_ranges
+        self.project = self.config.get("globals", {}).get("PROJECT", "Unknown")
+
+    def shot_block(self, seq, shot):
+        """(path, lines, start, end) of the block a shot comes from, None if there is none."""
+        key = (seq, shot)
+        for inc in reversed(self.includes):  # a later file wins, like in the merged config
+            if key in inc.shot_ranges:
+                return (inc.path, inc.lines, *inc.shot_ranges[key])
+        if key in self.shot_ranges:
+            return (Path(self.config_path), self.original_lines, *self.shot_ranges[key])
+        return None
+
+    def insert_point(self, seq, shot=None):
+        """
+        (path, lines, line) where a new block of seq goes: after shot if given, else after the
+        last block of seq (the story file is searched first, then the included files in order),
+        else at the end of the story file.
+        """
+        if shot is not None:
+            block = self.shot_block(seq, shot)
+            if block is not None:
+                return block[0], block[1], block[3]
+        point = (Path(self.config_path), self.original_lines, len(self.original_lines))
+        sources = [(Path(self.config_path), self.original_lines, self.shot_ranges)]
+        sources += [(inc.path, inc.lines, inc.shot_ranges) for inc in self.includes]
+        for path, lines, shot_ranges in sources:
+            for (s, _), (_, end) in shot_ranges.items():
+                if s == seq:
+                    point = (path, lines, end)
+        return point
+
+    def edit_shots(self, shots, edit) -> int:
+        """
+        Replace the block of each (seq, shot) with edit(block_lines), in the file the shot comes
+        from; edit returns None to leave a block as it is. Each changed file is written and
+        re-parsed once. Returns the number of blocks changed.
+        """
+        per_file = {}
+        for seq, shot in shots:
+            block = self.shot_block(seq, shot)
+            if block is not None:
+                path, lines, start, end = block
+                per_file.setdefault(path, (lines, set()))[1].add((start, end))
+        changed = 0
+        for path, (lines, spans) in per_file.items():
+            new_lines = lines[:]
+            edited = 0
+            for start, end in sorted(spans, reverse=True):  # bottom up, so earlier spans stay valid
+                new_block = edit(lines[start:end])
+                if new_block is not None:
+                    new_lines[start:end] = new_block
+                    edited += 1
+            if edited:
+                self.write_lines(path, new_lines)
+                changed += edited
+        return changed
+
+    def write_lines(self, path: Path, lines: list[str]):
+        """Write the story file or one included file and re-parse only that file."""
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.writelines(lines)
+        # Patch the parsed config in place (critical for tree/editor to see changes)
+        if Path(path) == Path(self.config_path):
+            globals_block = self.document.blocks[0] if self.document.blocks else None
+            self.document.update(lines)
+            if self.document.blocks[0] is not globals_block:
+                self._load_includes()  # INCLUDE= may have changed
+            else:
+                self._merge_includes()
+        else:
+            i = next(i for i, inc in enumerate(self.includes) if inc.path == Path(path))
+            dropped = {key for key, _ in self.includes[i].shots}
+            self.includes[i] = IncludedFile(Path(path), lines, config_cache.load_shot_file(path))
+            self._merge_includes(dropped)
+        self._sync_from_document()
+
     def save_changes(self, seq, shot, new_text: str):
         if not self.config_path:
             return False, "No config file loaded"
-        key = (seq, shot)
-        if key not in self.shot_ranges:
+        block = self.shot_block(seq, shot)
+        if block is None:
             return False, "Shot range not found"
-        start, end = self.shot_ranges[key]
+        path, lines, start, end = block
         if not new_text.endswith("\n"):
             new_text += "\n"
-        new_lines = self.original_lines[:start] + [new_text] + self.original_lines[end:]
+        new_lines = lines[:start] + new_text.splitlines(keepends=True) + lines[end:]
         try:
-            with open(self.config_path, "w", encoding="utf-8", newline="") as f:
-                f.writelines(new_lines)
-            self.original_lines = new_lines
-            self._scan_shot_ranges()  # Re-scan ranges
-            # Reload full parsed config (critical for tree/editor to see changes)
-            success, msg = self.load_config(self.config_path)
-            if not success:
-                print(f"[WARNING] Failed to reload config after save: {msg}")
+            self.write_lines(path, new_lines)
             return True, "Saved"
         except Exception as e:
             return False, str(e)
 
-    def _scan_shot_ranges(self):
-        self.shot_ranges.clear()
-        if not self.original_lines:
-            return
-        current_seq = None
-        block_start = -1
-        i = 0
-        while i < len(self.original_lines):
-            line = self.original_lines[i].strip()
-            if line.startswith("SEQUENCE="):
-                current_seq = line[9:].strip()
-                block_start = i
-                i += 1
-                continue
-            if line == "!---------":
-                if block_start != -1 and current_seq is not None:
-                    shot_id = self._find_shot_in_block(block_start, i)
-                    if shot_id:
-                        self.shot_ranges[(current_seq, shot_id)] = (block_start, i)
-                block_start = i
-                i += 1
-                continue
-            i += 1
-        # last block
-        if block_start != -1 and current_seq is not None:
-            shot_id = self._find_shot_in_block(block_start, len(self.original_lines))
-            if shot_id:
-                self.shot_ranges[(current_seq, shot_id)] = (block_start, len(self.original_lines))
-
-    def _find_shot_in_block(self, start, end):
-        for j in range(end - 1, start - 1, -1):
-            l = self.original_lines[j].strip()
-            if l.startswith("SHOT="):
-                return l[5:].strip()
-        return None
-
     def get_globals_text(self):
         if not self.original_lines:
             return "# No config loaded"
@@ -92,4 +179,4 @@ class ConfigManager:
             if line.strip() == "!---------":
                 break
             text += line
-        return text if text.strip() else "# No globals found"
\ No newline at end of file
+        return text if text.strip() else "# No globals found"
@@ -1,18 +1,103 @@
 # gui_utils/run_manager.py
+# Launches run on a worker thread (with in-flight limits run_storytools_execution only returns
+# once the last job is posted); results come back to the GUI thread through _LaunchSignals.
+import threading
 from pathlib import Path
 from datetime import datetime
-import re
 
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QObject, QTimer, Signal, Slot
 
 from gui_utils.constants import JOBTYPE_HOST_MAPPING
 from launcher import run_storytools_execution
+import completion_tracker  # root level, on sys.path via launcher
+import fingerprint_store
+import job_ledger
 import parser
 
 
+class _LaunchSignals(QObject):
+    """Lives on the GUI thread, so the launch worker's emits are delivered there."""
+    shot_launched = Signal(str, str, str, str)  # seq, shot, jobtype, temp config path
+    finished = Signal(str, int, int, int)       # jobtype, submitted, total, skipped
+
+    def __init__(self, manager):
+        super().__init__(manager.window)
+        self.manager = manager
+        self.shot_launched.connect(self._on_shot_launched)
+        self.finished.connect(self._on_finished)
+
+    @Slot(str, str, str, str)
+    def _on_shot_launched(self, seq, shot, jobtype, temp_path):
+        self.manager._shot_launched(seq, shot, jobtype, Path(temp_path))
+
+    @Slot(str, int, int, int)
+    def _on_finished(self, jobtype, success_count, total, skipped_count):
+        self.manager._launch_finished(jobtype, success_count, total, skipped_count)
+
+
 class RunManager:
     def __init__(self, window):
         self.window = window
+        self.tracker = completion_tracker.CompletionTracker()
+        self.ledger = None
+        self.fingerprints = None  # of the story file; updated as launched jobs finish (launcher --dirty)
+        self._fingerprints_path = None
+        self._saved_fingerprints = {}
+        self._status_timer = None
+        self._signals = _LaunchSignals(self)
+        self._launch_thread = None
+        self._launch_ledger = None
+
+    def _open_ledger(self, jobtype):
+        # One ledger per story file (not the temp configs), one run per launch
+        config_path = self.window.config_manager.config_path
+        if self.ledger is None or self.ledger.path != job_ledger.ledger_path_for(config_path):
+            if self.ledger is not None:
+                self.ledger.close()
+            self.ledger = job_ledger.JobLedger.for_config(config_path)
+        self.ledger.start_run(config_path, note=f"gui {jobtype}")
+        return self.ledger
+
+    def _open_fingerprints(self):
+        config_path = self.window.config_manager.config_path
+        if self.fingerprints is None or self._fingerprints_path != config_path:
+            self._save_fingerprints()
+            self.fingerprints = fingerprint_store.load_fingerprints(config_path)
+            self._fingerprints_path = config_path
+            self._saved_fingerprints = dict(self.fingerprints)
+        return self.fingerprints
+
+    def _save_fingerprints(self):
+        if self.fingerprints is None:
+            return
+        current = dict(self.fingerprints)  # recorded by tracker threads
+        if current != self._saved_fingerprints:
+            fingerprint_store.save_fingerprints(self._fingerprints_path, current)
+            self._saved_fingerprints = current
+
+    def _watch_completion(self):
+        # Tracker callbacks run on its own threads, so the counts are polled from the GUI thread
+        if self._status_timer is None:
+            self._status_timer = QTimer(self.window)
+            self._status_timer.timeout.connect(self._show_completion)
+        self._status_timer.start(1000)
+
+    def _launching(self) -> bool:
+        return self._launch_thread is not None and self._launch_thread.is_alive()
+
+    def _show_completion(self):
+        counts = self.tracker.counts()
+        active = counts['queued'] + counts['running'] or self._launching()
+        msg = (f"Prompts: {counts['done']} done, {counts['error']} failed, "
+               f"{counts['running']} running, {counts['queued']} queued")
+        if self._launching():
+            msg = "Submitting… " + msg
+        self.window.statusBar().showMessage(msg, 0 if active else 8000)
+        if self.ledger is not None:
+            self.ledger.flush()  # outcomes recorded by the tracker since the last tick
+        self._save_fingerprints()
+        if not active:
+            self._status_timer.stop()
 
     def _get_checked_hosts_str(self, jobtype: str) -> str:
         checked = self.window.selection.host_selections.get(jobtype, set())
@@ -32,37 +117,25 @@ class RunManager:
         return line
 
     def _is_shot_skippable(self, seq, shot, jobtype):
-        key = (seq, shot)
-        if key not in self.window.config_manager.shot_ranges:
+        if self.window.config_manager.shot_block(seq, shot) is None:
             return True, "Range missing"
 
-        start, end = self.window.config_manager.shot_ranges[key]
-        block_lines = self.window.config_manager.original_lines[start:end]
-
-        is_disabled = any(
-            re.match(r'^\s*DISABLED\s*=\s*(1|yes|true|on)\s*$', ln.strip(), re.IGNORECASE)
-            for ln in block_lines
-        )
-        if is_disabled:
+        index = self.window.config_manager.config.index
+        if index.is_disabled(seq, shot):
             return True, "Disabled"
 
-        status_key = f"STATUS_{jobtype.upper().replace('_', '')}"
-        is_omitted = any(
-            re.match(rf'^\s*{status_key}\s*=\s*omit\s*$', ln.strip(), re.IGNORECASE)
-            for ln in block_lines
-        )
-        if is_omitted:
+        if index.get_status(seq, shot, jobtype) == "omit":
             return True, "Omitted"
 
         return False, ""
 
     def _build_shot_block(self, seq, shot, host_key=None, host_str=''):
-        key = (seq, shot)
-        if key not in self.window.config_manager.shot_ranges:
+        shot_block = self.window.config_manager.shot_block(seq, shot)
+        if shot_block is None:
             return []
 
-        start, end = self.window.config_manager.shot_ranges[key]
-        block = self.window.config_manager.original_lines[start:end]
+        _, lines, start, end = shot_block
+        block = lines[start:end]
 
         if not host_key:
             return block
@@ -76,7 +149,10 @@ class RunManager:
 
         globals_dict = self.window.config_manager.config.get('globals', {}).copy()
 
-        derived = ['FLUX_HOSTS', 'WAN_HOSTS', 'LTX_HOSTS', 'QWEN_HOSTS']
+        derived = ['FLUX_HOSTS', 'WAN_HOSTS', 'LTX_HOSTS', 'QWEN_HOSTS',
+                   'FLUX_HOST_WEIGHTS', 'WAN_HOST_WEIGHTS', 'LTX_HOST_WEIGHTS', 'QWEN_HOST_WEIGHTS']
+        # The shot block is copied in below; its INCLUDE= files would not resolve from launch_configs
+        derived.append(parser.INCLUDE_KEY)
         removed = [k for k in derived if k in globals_dict]
         for k in removed:
             del globals_dict[k]
@@ -125,12 +201,12 @@ class RunManager:
 
     def _mark_as_run(self, seq, shot, jobtype):
         status_key = f"STATUS_{jobtype.upper().replace('_', '')}"
-        key = (seq, shot)
-        if key not in self.window.config_manager.shot_ranges:
+        shot_block = self.window.config_manager.shot_block(seq, shot)
+        if shot_block is None:
             return False
 
-        start, end = self.window.config_manager.shot_ranges[key]
-        original_lines = self.window.config_manager.original_lines[:]
+        path, lines, start, end = shot_block
+        original_lines = lines[:]
 
         status_line_idx = None
         for i in range(start, end):
@@ -150,16 +226,9 @@ class RunManager:
             original_lines.insert(insert_pos + 1, new_status)
 
         try:
-            with open(self.window.config_manager.config_path, "w", encoding="utf-8", newline="") as f:
-                f.writelines(original_lines)
-            self.window.config_manager.original_lines = original_lines
-
-            success, msg = self.window.config_manager.load_config(self.window.config_manager.config_path)
-            if success:
-                print(f"[DEBUG] Re-parsed config after marking {seq}/{shot}")
-            else:
-                print(f"[WARNING] Failed to re-parse after marking: {msg}")
-
+            # Writes the file the shot came from (the story file or an INCLUDE= file) and re-parses it
+            self.window.config_manager.write_lines(path, original_lines)
+            print(f"[DEBUG] Re-parsed {path.name} after marking {seq}/{shot}")
             return True
         except Exception as e:
             print(f"[ERROR] Failed to mark status for {seq}/{shot}: {e}")
@@ -170,6 +239,9 @@ class RunManager:
         if not jobtype or jobtype == "Select Jobtype":
             self.window.statusBar().showMessage("Select a jobtype first", 5000)
             return
+        if self._launching():
+            self.window.statusBar().showMessage("A launch is still submitting – wait for it to finish", 5000)
+            return
 
         selected_indexes = self.window.tree.selectionModel().selectedIndexes()
         selected_shots = []
@@ -185,8 +257,11 @@ class RunManager:
             return
 
         print(f"[INFO] Launching {len(selected_shots)} shot(s) as {jobtype}")
+        ledger = self._open_ledger(jobtype)
+        fingerprints = self._open_fingerprints()
 
-        success_count = 0
+        # Temp configs are written here (they read the editor and the tree), submitted on the worker
+        launches = []
         skipped_count = 0
         for seq, shot in selected_shots:
             skip, reason = self._is_shot_skippable(seq, shot, jobtype)
@@ -203,34 +278,57 @@ class RunManager:
             if not temp_path:
                 print(f"[ERROR] {msg}")
                 continue
-
+            launches.append((seq, shot, temp_path))
+
+        self.window.statusBar().showMessage(f"Submitting {len(launches)} {jobtype} job(s)…", 0)
+        self._launch_ledger = ledger
+        self._launch_thread = threading.Thread(
+            target=self._launch, args=(jobtype, launches, ledger, fingerprints, len(selected_shots), skipped_count),
+            daemon=True, name="gui-launch")
+        self._launch_thread.start()
+        self._watch_completion()
+
+    def _launch(self, jobtype, launches, ledger, fingerprints, total, skipped_count):
+        # Worker thread: no widget access here, results go through self._signals
+        success_count = 0
+        for seq, shot, temp_path in launches:
             try:
                 parsed = parser.parse_config(str(temp_path))
                 run_storytools_execution(
                     config=parsed,
                     allowed_jobtypes=[jobtype],
                     target_sequence=None,
-                    target_shot=None
+                    target_shot=None,
+                    tracker=self.tracker,
+                    ledger=ledger,
+                    fingerprints=fingerprints
                 )
                 success_count += 1
-                self._mark_as_run(seq, shot, jobtype)
-
-                # Delete temp config unless "Keep temp configs" is checked
-                if not self.window.keep_temp_checkbox.isChecked():
-                    try:
-                        temp_path.unlink()
-                        print(f"[INFO] Deleted temp config: {temp_path}")
-                    except Exception as del_e:
-                        print(f"[WARNING] Failed to delete temp config {temp_path}: {del_e}")
+                self._signals.shot_launched.emit(seq, shot, jobtype, str(temp_path))
             except Exception as e:
                 print(f"[ERROR] Launch failed for {seq}/{shot}: {e}")
+        self._signals.finished.emit(jobtype, success_count, total, skipped_count)
+
+    def _shot_launched(self, seq, shot, jobtype, temp_path):
+        self._mark_as_run(seq, shot, jobtype)
+
+        # Delete temp config unless "Keep temp configs" is checked
+        if not self.window.keep_temp_checkbox.isChecked():
+            try:
+                temp_path.unlink()
+                print(f"[INFO] Deleted temp config: {temp_path}")
+            except Exception as del_e:
+                print(f"[WARNING] Failed to delete temp config {temp_path}: {del_e}")
 
-        total = len(selected_shots)
+    def _launch_finished(self, jobtype, success_count, total, skipped_count):
         msg = f"Submitted {success_count}/{total} {jobtype} job(s)"
         if skipped_count > 0:
             msg += f" ({skipped_count} skipped)"
         self.window.statusBar().showMessage(msg, 8000)
         print(f"[INFO] {msg}")
+        self._launch_ledger.finish_run()
+        if success_count:
+            self._watch_completion()
 
         self.window.refresh_tree_only()
 
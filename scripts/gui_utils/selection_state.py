@@ -3,6 +3,7 @@ from PySide6.QtWidgets import QLabel, QCheckBox
 from PySide6.QtCore import Qt
 
 from gui_utils.constants import JOBTYPE_HOST_MAPPING
+import parser
 
 
 class SelectionState:
@@ -96,7 +97,11 @@ class SelectionState:
         selected_hosts = self.host_selections[selected_jobtype]
 
         for host in hosts:
-            cb = QCheckBox(host)
+            # entries keep their weight ("host:8188*4") so the run config still carries it
+            address, weight = parser.parse_host_entry(host)
+            cb = QCheckBox(f"{address}  ×{weight}" if weight > 1 else address)
+            if weight > 1:
+                cb.setToolTip(f"Capacity weight {weight}: gets {weight}x the jobs of a single host")
             cb.setChecked(host in selected_hosts)
             cb.stateChanged.connect(
                 lambda state, h=host, jt=selected_jobtype: self._on_host_toggled(jt, h, bool(state))
@@ -1,6 +1,4 @@
 # gui_utils/tree_helpers.py
-import re
-
 from PySide6.QtGui import (
     QStandardItem,
     QFont,
@@ -15,9 +13,24 @@ from PySide6.QtWidgets import QHeaderView
 STATUS_COLOR_ROLE = 1001  # Custom role to store status QColor for stylesheet override
 
 
-def populate_tree(tree, config, project, shot_ranges, original_lines):
+STATUS_COLORS = {
+    "done": QColor(100, 180, 255),     # blue
+    "run": QColor(255, 140, 0),        # orange
+    "changes": QColor(200, 0, 255),    # purple
+    "omit": QColor(128, 128, 128),     # dark grey
+    "not_started": QColor(224, 224, 224),
+}
+
+
+def populate_tree(tree, config, project):
+    """Build the seq/shot tree. DISABLED and STATUS_* come from the parser's ShotIndex (config.index)."""
     model = QStandardItemModel()
     root = model.invisibleRootItem()
+    index = config.index
+
+    current_jobtype = tree.window().selection.selected_jobtype
+    if current_jobtype == "Select Jobtype":
+        current_jobtype = None
 
     sequences = sorted(config.get(project, {}).keys())
 
@@ -41,45 +54,15 @@ def populate_tree(tree, config, project, shot_ranges, original_lines):
             shot_item.setEditable(False)
             shot_item.setData((seq, shot_id), Qt.ItemDataRole.UserRole)
 
-            key = (seq, shot_id)
-            if key in shot_ranges:
-                start, end = shot_ranges[key]
-                block = original_lines[start:end]
-                is_disabled = any(
-                    re.match(r"^\s*DISABLED\s*=\s*(1|yes|true|on)\s*$", ln.strip(), re.IGNORECASE)
-                    for ln in block
-                )
-                if is_disabled:
-                    shot_item.setForeground(QColor(220, 80, 80))
-                    shot_item.setData(QColor(220, 80, 80), STATUS_COLOR_ROLE)
-
-            current_jobtype = tree.window().selection.selected_jobtype
-            if current_jobtype and current_jobtype != "Select Jobtype":
-                status_key = f"STATUS_{current_jobtype.upper().replace('_', '')}"
-                for sub in shot_data.values():
-                    if status_key in sub:
-                        status_val = sub[status_key].strip().lower()
-                        if status_val == "done":
-                            color = QColor(100, 180, 255)  # blue
-                            shot_item.setForeground(color)
-                            shot_item.setData(color, STATUS_COLOR_ROLE)
-                        elif status_val == "run":
-                            color = QColor(255, 140, 0)   # orange
-                            shot_item.setForeground(color)
-                            shot_item.setData(color, STATUS_COLOR_ROLE)
-                        elif status_val == "changes":
-                            color = QColor(200, 0, 255)   # purple
-                            shot_item.setForeground(color)
-                            shot_item.setData(color, STATUS_COLOR_ROLE)
-                        elif status_val == "omit":
-                            color = QColor(128, 128, 128) # dark grey
-                            shot_item.setForeground(color)
-                            shot_item.setData(color, STATUS_COLOR_ROLE)
-                        elif status_val == "not_started":
-                            color = QColor(224, 224, 224)
-                            shot_item.setForeground(color)
-                            shot_item.setData(color, STATUS_COLOR_ROLE)
-                        break
+            if index.is_disabled(seq, shot_id):
+                shot_item.setForeground(QColor(220, 80, 80))
+                shot_item.setData(QColor(220, 80, 80), STATUS_COLOR_ROLE)
+
+            if current_jobtype:
+                color = STATUS_COLORS.get(index.get_status(seq, shot_id, current_jobtype))
+                if color is not None:
+                    shot_item.setForeground(color)
+                    shot_item.setData(color, STATUS_COLOR_ROLE)
 
             seq_item.appendRow(shot_item)
 
@@ -36,9 +36,7 @@ def refresh_config(window):
     populate_tree(
         window.tree,
         window.config_manager.config,
-        window.config_manager.project,
-        window.config_manager.shot_ranges,
-        window.config_manager.original_lines
+        window.config_manager.project
     )
     auto_resize_tree(window.tree)
 
@@ -135,11 +133,9 @@ def create_new_sequence(window):
         "\n",
     ]
 
-    window.config_manager.original_lines += new_block_lines
-
     try:
-        with open(window.config_manager.config_path, "w", encoding="utf-8", newline="") as f:
-            f.writelines(window.config_manager.original_lines)
+        window.config_manager.write_lines(
+            window.config_manager.config_path, window.config_manager.original_lines + new_block_lines)
 
         refresh_config(window)
         window.statusBar().showMessage(f"Sequence '{seq_name}' created with initial shot '{shot_id}'", 5000)
@@ -184,20 +180,8 @@ def create_new_shot(window):
         QMessageBox.warning(window, "Duplicate", f"Shot '{shot_id}' already exists in '{target_seq}'.")
         return
 
-    insert_line = len(window.config_manager.original_lines)
-
-    if window.selection.selected_shot:
-        key = (target_seq, window.selection.selected_shot)
-        if key in window.config_manager.shot_ranges:
-            _, end = window.config_manager.shot_ranges[key]
-            insert_line = end
-    else:
-        last_end = None
-        for (s, sh), (st, en) in window.config_manager.shot_ranges.items():
-            if s == target_seq:
-                last_end = en
-        if last_end is not None:
-            insert_line = last_end
+    # Next to the selected shot (or the sequence's last shot), in the file that block comes from
+    path, lines, insert_line = window.config_manager.insert_point(target_seq, window.selection.selected_shot)
 
     new_block_lines = [
         "!---------\n",
@@ -212,11 +196,8 @@ def create_new_shot(window):
         "\n",
     ]
 
-    window.config_manager.original_lines[insert_line:insert_line] = new_block_lines
-
     try:
-        with open(window.config_manager.config_path, "w", encoding="utf-8", newline="") as f:
-            f.writelines(window.config_manager.original_lines)
+        window.config_manager.write_lines(path, lines[:insert_line] + new_block_lines + lines[insert_line:])
 
         refresh_config(window)
 
@@ -320,6 +301,22 @@ def show_context_menu(window, pos):
     menu.exec(window.tree.viewport().mapToGlobal(pos))
 
 
+def _edit_shots(window, shots, edit, done_msg, none_msg):
+    """Apply edit to the selected shots' blocks (see ConfigManager.edit_shots) and refresh."""
+    try:
+        affected_count = window.config_manager.edit_shots(shots, edit)
+    except Exception as e:
+        QMessageBox.critical(window, "Save failed", str(e))
+        return
+
+    if affected_count == 0:
+        window.statusBar().showMessage(none_msg, 3000)
+        return
+
+    refresh_config(window)
+    window.statusBar().showMessage(done_msg.format(affected_count), 3000)
+
+
 def _mark_status(window, shots, status_val):
     if not shots:
         return
@@ -331,26 +328,7 @@ def _mark_status(window, shots, status_val):
 
     status_key = f"STATUS_{jobtype.upper().replace('_', '')}"
 
-    original_lines = window.config_manager.original_lines[:]
-    original_ranges = window.config_manager.shot_ranges.copy()
-
-    affected_ranges = sorted(
-        [(original_ranges.get((seq, shot), None), (seq, shot)) for seq, shot in shots],
-        key=lambda x: x[0][0] if x[0] else 999999
-    )
-
-    new_lines = []
-    current_pos = 0
-    affected_count = 0
-
-    for (orig_start, orig_end), (seq, shot) in affected_ranges:
-        if orig_start is None or orig_end is None:
-            continue
-
-        new_lines.extend(original_lines[current_pos:orig_start])
-
-        block_lines = original_lines[orig_start:orig_end]
-
+    def edit(block_lines):
         new_block = []
         added = False
         for ln in block_lines:
@@ -366,146 +344,42 @@ def _mark_status(window, shots, status_val):
                 new_block.insert(-1, f"{status_key}={status_val}\n")
             else:
                 new_block.append(f"{status_key}={status_val}\n")
+        return new_block
 
-        new_lines.extend(new_block)
-        current_pos = orig_end
-        affected_count += 1
-
-    new_lines.extend(original_lines[current_pos:])
+    _edit_shots(window, shots, edit, f"Marked {{}} shot(s) as {status_val}", "No shots affected")
 
-    if affected_count == 0:
-        window.statusBar().showMessage("No shots affected", 3000)
-        return
-
-    try:
-        with open(window.config_manager.config_path, "w", encoding="utf-8", newline="") as f:
-            f.writelines(new_lines)
-
-        window.config_manager.original_lines = new_lines
-        refresh_config(window)
-        window.statusBar().showMessage(f"Marked {affected_count} shot(s) as {status_val}", 3000)
 
-    except Exception as e:
-        QMessageBox.critical(window, "Save failed", str(e))
+def _is_disabled_line(ln):
+    return re.match(r'^\s*DISABLED\s*=\s*(1|yes|true|on)\s*$', ln.strip(), re.IGNORECASE)
 
 
 def _set_multi_enabled(window, shots):
     if not shots:
         return
 
-    original_lines = window.config_manager.original_lines[:]
-    original_ranges = window.config_manager.shot_ranges.copy()
-
-    affected_ranges = sorted(
-        [(original_ranges.get((seq, shot), None), (seq, shot)) for seq, shot in shots],
-        key=lambda x: x[0][0] if x[0] else 999999
-    )
-
-    new_lines = []
-    current_pos = 0
-    affected_count = 0
+    def edit(block_lines):
+        if not any(_is_disabled_line(ln) for ln in block_lines):
+            return None
+        return [ln for ln in block_lines if not _is_disabled_line(ln)]
 
-    for (orig_start, orig_end), (seq, shot) in affected_ranges:
-        if orig_start is None or orig_end is None:
-            continue
-
-        new_lines.extend(original_lines[current_pos:orig_start])
-
-        block_lines = original_lines[orig_start:orig_end]
-
-        is_disabled = any(
-            re.match(r'^\s*DISABLED\s*=\s*(1|yes|true|on)\s*$', ln.strip(), re.IGNORECASE)
-            for ln in block_lines
-        )
-
-        if is_disabled:
-            new_block = [
-                ln for ln in block_lines
-                if not re.match(r'^\s*DISABLED\s*=\s*(1|yes|true|on)\s*$', ln.strip(), re.IGNORECASE)
-            ]
-            new_lines.extend(new_block)
-            affected_count += 1
-        else:
-            new_lines.extend(block_lines)
-
-        current_pos = orig_end
-
-    new_lines.extend(original_lines[current_pos:])
-
-    if affected_count == 0:
-        window.statusBar().showMessage("No disabled shots to enable", 3000)
-        return
-
-    try:
-        with open(window.config_manager.config_path, "w", encoding="utf-8", newline="") as f:
-            f.writelines(new_lines)
-
-        window.config_manager.original_lines = new_lines
-        refresh_config(window)
-        window.statusBar().showMessage(f"Enabled {affected_count} shot(s)", 3000)
-
-    except Exception as e:
-        QMessageBox.critical(window, "Save failed", str(e))
+    _edit_shots(window, shots, edit, "Enabled {} shot(s)", "No disabled shots to enable")
 
 
 def _set_multi_disabled(window, shots):
     if not shots:
         return
 
-    original_lines = window.config_manager.original_lines[:]
-    original_ranges = window.config_manager.shot_ranges.copy()
-
-    affected_ranges = sorted(
-        [(original_ranges.get((seq, shot), None), (seq, shot)) for seq, shot in shots],
-        key=lambda x: x[0][0] if x[0] else 999999
-    )
-
-    new_lines = []
-    current_pos = 0
-    affected_count = 0
-
-    for (orig_start, orig_end), (seq, shot) in affected_ranges:
-        if orig_start is None or orig_end is None:
-            continue
-
-        new_lines.extend(original_lines[current_pos:orig_start])
-
-        block_lines = original_lines[orig_start:orig_end]
-
-        is_disabled = any(
-            re.match(r'^\s*DISABLED\s*=\s*(1|yes|true|on)\s*$', ln.strip(), re.IGNORECASE)
-            for ln in block_lines
-        )
-
-        if not is_disabled:
-            new_block = block_lines[:]
-            if new_block and not new_block[-1].strip():
-                new_block.insert(-1, "DISABLED=1\n")
-            else:
-                new_block.append("DISABLED=1\n")
-            new_lines.extend(new_block)
-            affected_count += 1
+    def edit(block_lines):
+        if any(_is_disabled_line(ln) for ln in block_lines):
+            return None
+        new_block = block_lines[:]
+        if new_block and not new_block[-1].strip():
+            new_block.insert(-1, "DISABLED=1\n")
         else:
-            new_lines.extend(block_lines)
-
-        current_pos = orig_end
-
-    new_lines.extend(original_lines[current_pos:])
+            new_block.append("DISABLED=1\n")
+        return new_block
 
-    if affected_count == 0:
-        window.statusBar().showMessage("All selected shots already disabled", 3000)
-        return
-
-    try:
-        with open(window.config_manager.config_path, "w", encoding="utf-8", newline="") as f:
-            f.writelines(new_lines)
-
-        window.config_manager.original_lines = new_lines
-        refresh_config(window)
-        window.statusBar().showMessage(f"Disabled {affected_count} shot(s)", 3000)
-
-    except Exception as e:
-        QMessageBox.critical(window, "Save failed", str(e))
+    _edit_shots(window, shots, edit, "Disabled {} shot(s)", "All selected shots already disabled")
 
 
 def _delete_multi_shots(window, shots):
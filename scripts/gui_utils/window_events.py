@@ -49,10 +49,10 @@ def on_tree_selection_changed(window, selected, deselected):
             window.last_selected_shot = (seq, shot)
             window.selection.set_from_single_shot(seq, shot, window.config_manager.config, window.jobtype_combo)
 
-            key = (seq, shot)
-            if key in window.config_manager.shot_ranges:
-                start, end = window.config_manager.shot_ranges[key]
-                block_lines = window.config_manager.original_lines[start:end]
+            shot_block = window.config_manager.shot_block(seq, shot)
+            if shot_block is not None:
+                _, lines, start, end = shot_block
+                block_lines = lines[start:end]
 
                 filtered_lines = []
                 for ln in block_lines:
@@ -306,9 +306,7 @@ class StorytoolsWindow(QMainWindow):
         populate_tree(
             self.tree,
             self.config_manager.config,
-            self.config_manager.project,
-            self.config_manager.shot_ranges,
-            self.config_manager.original_lines
+            self.config_manager.project
         )
         auto_resize_tree(self.tree)
 
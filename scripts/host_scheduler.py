@@ -0,0 +1,432 @@
+# host_scheduler.py
+# Load-aware host selection for the launcher.
+# Each job family (flux / wan / qwen / ltx) has a host list from the story globals. For every job the
+# host with the lowest expected wait is picked, from each host's /queue depth and /system_stats
+# (free VRAM as tie-breaker), cached for STATS_TTL seconds. Jobs handed out since the last poll
+# count towards a host's depth, so picks inside one TTL window still spread out.
+# Hosts can carry a capacity weight (FLUX_HOST=big:8188*4): the expected wait is divided by it and
+# the round-robin is weighted, so a 4-GPU node takes four times the jobs of a single-GPU one.
+# When no host of a family answers, selection falls back to plain (weighted) round-robin.
+# Every host has a circuit breaker: it opens after FAILURE_THRESHOLD failed posts/polls in a row
+# (or one failed health probe) and the host gets no jobs until a probe after COOLDOWN succeeds.
+# Jobs with a model fingerprint (checkpoint / LoRA stack) stick to the host that last got the same
+# fingerprint, so hosts reload models as rarely as the load balance allows.
+# Families can cap the prompts in flight per host (FLUX_MAX_INFLIGHT=4, times the host's weight): a host
+# at its cap gets no more jobs until release() reports finished prompts.
+# Stats polls and health probes run outside the scheduler lock, so a slow or dead host only holds up
+# the thread polling it; the lock is held to rank and assign.
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import http_pool  # root level, on sys.path via launcher
+
+STATS_TTL = 2.0          # seconds a /queue + /system_stats poll stays fresh
+UNAVAILABLE_TTL = 30.0   # seconds before a host that did not answer is polled again
+STATS_TIMEOUT = (1, 2)   # connect / read timeout for stats polls
+FAILURE_THRESHOLD = 3    # consecutive failures that open a host's breaker
+COOLDOWN = 30.0          # seconds an open breaker waits before the half-open probe
+AFFINITY_SLACK = 4.0     # extra queued jobs (per unit of weight) a host with the model loaded may have
+
+FAMILIES = ('flux', 'wan', 'qwen', 'ltx')
+
+
+def family_of(jobtype: str):
+    """Job family of a jobtype, with the same substring rules get_next_host always used."""
+    jt_lower = jobtype.lower()
+    if 'flux' in jt_lower:
+        return 'flux'
+    if 'wan' in jt_lower:
+        return 'wan'
+    if 'qwen' in jt_lower or 'cameratransform' in jt_lower:
+        return 'qwen'
+    if 'ltx' in jt_lower:
+        return 'ltx'
+    return None
+
+
+class HostStats:
+    __slots__ = ('running', 'pending', 'vram_free', 'fetched_at', 'ok')
+
+    def __init__(self, running=0, pending=0, vram_free=0, fetched_at=0.0, ok=False):
+        self.running = running
+        self.pending = pending
+        self.vram_free = vram_free
+        self.fetched_at = fetched_at
+        self.ok = ok
+
+    @property
+    def depth(self) -> int:
+        return self.running + self.pending
+
+
+def fetch_stats(host: str, timeout=STATS_TIMEOUT) -> HostStats:
+    """Poll one ComfyUI host. Returns HostStats with ok=False if it did not answer."""
+    now = time.monotonic()
+    try:
+        q = http_pool.get(f"{host}/queue", timeout=timeout)
+        q.raise_for_status()
+        queue_data = q.json()
+        s = http_pool.get(f"{host}/system_stats", timeout=timeout)
+        s.raise_for_status()
+        devices = s.json().get('devices', [])
+    except Exception:
+        return HostStats(fetched_at=now, ok=False)
+    return HostStats(
+        running=len(queue_data.get('queue_running', [])),
+        pending=len(queue_data.get('queue_pending', [])),
+        vram_free=sum(d.get('vram_free', 0) for d in devices),
+        fetched_at=now,
+        ok=True,
+    )
+
+
+class CircuitBreaker:
+    """closed: host gets jobs. open: host is skipped. half-open: a probe is deciding which."""
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold: int = FAILURE_THRESHOLD, cooldown: float = COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0      # consecutive
+        self.opened_at = 0.0
+        self.trips = 0
+        self.ok_count = 0      # posts, for the run summary
+        self.failed_count = 0
+
+    def close(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_success(self):
+        self.ok_count += 1
+        self.close()
+
+    def record_failure(self, trip: bool = False, count: bool = True):
+        if count:
+            self.failed_count += 1
+        self.failures += 1
+        if trip or self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def due_for_probe(self) -> bool:
+        return self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown
+
+
+class HostScheduler:
+    """
+    families: {'flux': ['http://host:8188', ...], ...}; weights: {'flux': {'http://host:8188': 4}, ...}
+    (missing hosts weigh 1). load_aware=False gives round-robin without any polling.
+    limits: {'flux': 4, ...} prompts in flight per unit of weight (0 or missing: no limit).
+    """
+
+    def __init__(self, families: dict, fallback: str, load_aware: bool = True,
+                 ttl: float = STATS_TTL, fetch=fetch_stats, weights: dict = None, limits: dict = None):
+        self.families = {f: list(dict.fromkeys(hosts)) for f, hosts in families.items() if hosts}
+        weights = weights or {}
+        self.weights = {f: {h: max(1, int(weights.get(f, {}).get(h, 1))) for h in hosts}
+                        for f, hosts in self.families.items()}
+        self.fallback = fallback
+        self.load_aware = load_aware
+        self.ttl = ttl
+        self._fetch = fetch
+        self._round_robin = {f: deque(hosts) for f, hosts in self.families.items()}
+        self._credit = {f: dict.fromkeys(hosts, 0) for f, hosts in self.families.items()}
+        self._stats = {}      # host -> HostStats
+        self._assigned = {}   # host -> jobs handed out since its last poll
+        self._total = {}      # host -> jobs handed out this run
+        self._loaded = {}     # host -> model fingerprint of the last job sent there
+        self._rr_count = dict.fromkeys(self.families, 0)
+        self._rr_loaded = {}
+        self.model_loads = {'expected': 0, 'first': 0, 'round_robin': 0}
+        self._breakers = {h: CircuitBreaker() for hosts in self.families.values() for h in hosts}
+        self.limits = {f: max(0, int((limits or {}).get(f) or 0)) for f in self.families}
+        self._inflight = {}   # host -> prompts handed out and not reported finished
+        self._polling = set() # hosts with a stats poll under way
+        self._lock = threading.RLock()
+
+    @property
+    def limited(self) -> bool:
+        return any(self.limits.values())
+
+    def hosts_for(self, jobtype: str) -> list:
+        return self.families.get(family_of(jobtype), [])
+
+    def weight(self, host: str) -> int:
+        """Capacity weight of a host (largest over the families listing it)."""
+        return max((w[host] for w in self.weights.values() if host in w), default=1)
+
+    def _stale(self, host: str, now: float) -> bool:
+        cached = self._stats.get(host)
+        if cached is None:
+            return True
+        max_age = self.ttl if cached.ok else UNAVAILABLE_TTL
+        return now - cached.fetched_at >= max_age
+
+    def stats(self, host: str) -> HostStats:
+        """Cached stats of a host, re-polled once they are older than the TTL."""
+        self._refresh([host])
+        return self._stats.get(host) or HostStats()
+
+    def _refresh(self, hosts) -> None:
+        """Poll the hosts whose stats went stale, without the lock; hosts another thread polls are skipped."""
+        now = time.monotonic()
+        with self._lock:
+            due = [h for h in hosts if h not in self._polling and self._stale(h, now)]
+            self._polling.update(due)
+        try:
+            for host in due:
+                self._poll(host)
+        finally:
+            with self._lock:
+                self._polling.difference_update(due)
+
+    def _poll(self, host: str, probe: bool = False) -> HostStats:
+        fresh = self._fetch(host)  # network: never with the lock held
+        with self._lock:
+            self._stats[host] = fresh
+            self._assigned[host] = 0
+            breaker = self._breakers.get(host)
+            if breaker is not None:
+                # a good poll only closes a breaker as its probe; failed posts are not forgiven by it
+                if fresh.ok and probe:
+                    breaker.close()
+                elif not fresh.ok:
+                    breaker.record_failure(trip=probe, count=False)
+        return fresh
+
+    def probe_all(self) -> None:
+        """Health probe of every host at once; hosts that do not answer start with an open breaker."""
+        hosts = list(self._breakers)
+        if not hosts:
+            return
+        with ThreadPoolExecutor(max_workers=min(8, len(hosts))) as pool:
+            results = dict(zip(hosts, pool.map(self._fetch, hosts)))
+        with self._lock:
+            for host, st in results.items():
+                self._stats[host] = st
+                self._assigned[host] = 0
+                if st.ok:
+                    self._breakers[host].close()
+                else:
+                    self._breakers[host].record_failure(trip=True, count=False)
+
+    def healthy(self, host: str) -> bool:
+        """False while the host's breaker is open; runs the half-open probe once the cooldown is over."""
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            return True
+        with self._lock:
+            probe = breaker.due_for_probe()
+            if probe:
+                breaker.state = CircuitBreaker.HALF_OPEN  # only this caller probes
+        if probe:
+            self._poll(host, probe=True)
+        return breaker.state == CircuitBreaker.CLOSED
+
+    def _closed(self, host: str) -> bool:
+        breaker = self._breakers.get(host)
+        return breaker is None or breaker.state == CircuitBreaker.CLOSED
+
+    def record_result(self, host: str, ok: bool) -> None:
+        """Outcome of a post; connection errors and 5xx answers count as failures."""
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            return
+        with self._lock:
+            if ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    def expected_wait(self, host: str, family: str = None):
+        """
+        Queue depth incl. jobs handed out since the last poll, per unit of capacity weight;
+        None if the host has no stats.
+        """
+        self._refresh([host])
+        return self._expected_wait(host, family)
+
+    def _expected_wait(self, host: str, family: str = None):
+        st = self._stats.get(host)
+        if st is None or not st.ok:
+            return None
+        weight = self.weights[family].get(host, 1) if family in self.weights else self.weight(host)
+        return (st.depth + self._assigned.get(host, 0)) / weight
+
+    def limit(self, host: str, family: str) -> int:
+        """Prompts the host may have in flight for the family, 0 for no limit."""
+        return self.limits.get(family, 0) * self.weights[family].get(host, 1)
+
+    def _has_room(self, family: str, host: str, cost: int) -> bool:
+        limit = self.limit(host, family)
+        inflight = self._inflight.get(host, 0)
+        # an idle host always takes a job, even one with more copies than the limit
+        return not limit or inflight == 0 or inflight + cost <= limit
+
+    def has_room(self, jobtype: str, cost: int = 1) -> bool:
+        """Whether a healthy host of the jobtype's family is below its in-flight limit for cost more prompts."""
+        family = family_of(jobtype)
+        if not self.limits.get(family):
+            return True
+        healthy = [h for h in self.families[family] if self.healthy(h)]
+        with self._lock:
+            # no healthy host: let the job through, pick() routes it to the fallback
+            return not healthy or any(self._has_room(family, h, cost) for h in healthy)
+
+    def release(self, host: str, count: int = 1) -> None:
+        """count prompts on host finished (or were never posted there): frees in-flight room."""
+        with self._lock:
+            self._inflight[host] = max(0, self._inflight.get(host, 0) - count)
+
+    def transfer(self, source: str, target: str, count: int = 1) -> None:
+        """count prompts moved from source to target (work stealing): in-flight and run counts follow."""
+        if source == target:
+            return
+        with self._lock:
+            for host, delta in ((source, -count), (target, count)):
+                self._inflight[host] = max(0, self._inflight.get(host, 0) + delta)
+                self._total[host] = max(0, self._total.get(host, 0) + delta)
+
+    def inflight(self) -> dict:
+        return dict(self._inflight)
+
+    def _next_round_robin(self, family: str, candidates) -> str:
+        """Smooth weighted round-robin over candidates (plain rotation when all weights are 1)."""
+        weights, credit = self.weights[family], self._credit[family]
+        total = 0
+        for host in candidates:
+            credit[host] += weights[host]
+            total += weights[host]
+        host = max(candidates, key=lambda h: credit[h])
+        credit[host] -= total
+        return host
+
+    def _choose(self, family: str, candidates, model) -> tuple[str, str]:
+        order = {h: i for i, h in enumerate(candidates)}
+        waits = {}
+        if self.load_aware:
+            for host in candidates:
+                wait = self._expected_wait(host, family)
+                if wait is not None:
+                    waits[host] = wait
+        if waits:
+            # ties: more free VRAM first, then round-robin order
+            rank = {h: (w, -self._stats[h].vram_free, order[h]) for h, w in waits.items()}
+            reason = 'load'
+        else:
+            # no stats: share of this run's jobs per unit of weight stands in for the wait
+            rank = {h: (self._total.get(h, 0) / self.weights[family][h], 0, order[h]) for h in candidates}
+            reason = 'round-robin'
+
+        if model is not None:
+            affine = [h for h in rank if self._loaded.get(h) == model]
+            least = min(rank[h][0] for h in rank)
+            if affine:
+                host = min(affine, key=lambda h: rank[h])
+                if rank[host][0] - least <= AFFINITY_SLACK:
+                    return host, 'affinity'
+            # new fingerprint (or its hosts are too busy): least loaded host, idle ones first
+            return min(rank, key=lambda h: (rank[h][0], h in self._loaded, rank[h][1:])), reason
+        if reason == 'load':
+            return min(rank, key=lambda h: rank[h]), reason
+        return self._next_round_robin(family, candidates), reason
+
+    def _assign(self, family: str, host: str, model, cost: int) -> None:
+        self._assigned[host] = self._assigned.get(host, 0) + cost
+        self._total[host] = self._total.get(host, 0) + cost
+        self._inflight[host] = self._inflight.get(host, 0) + cost
+        # keep the rotation moving so ties do not always hit the same host
+        self._round_robin[family].remove(host)
+        self._round_robin[family].append(host)
+        if model is None:
+            return
+        previous = self._loaded.get(host)
+        if previous != model:
+            self._loaded[host] = model
+            self.model_loads['expected' if previous is not None else 'first'] += 1
+        # what the old blind rotation would have loaded, for the summary
+        hosts = self.families[family]
+        rr_host = hosts[self._rr_count[family] % len(hosts)]
+        self._rr_count[family] += 1
+        if self._rr_loaded.get(rr_host, model) != model:
+            self.model_loads['round_robin'] += 1
+        self._rr_loaded[rr_host] = model
+
+    def pick(self, jobtype: str, exclude=(), model: str = None, cost: int = 1) -> tuple[str, str]:
+        """
+        (host, reason) for the next job of jobtype, skipping hosts in exclude and hosts whose
+        breaker is open. model (parser.model_fingerprint) keeps jobs on the host that last loaded
+        the same checkpoint / LoRA stack while it is at most AFFINITY_SLACK jobs busier than the
+        least loaded host. cost is the number of prompts the job posts.
+        reason is 'affinity', 'load', 'round-robin', 'fallback' (family has no hosts) or
+        'unhealthy' (host None: no host of the family can take the job).
+        """
+        family = family_of(jobtype)
+        hosts = self.families.get(family)
+        if not hosts:
+            return (None, 'fallback') if self.fallback in exclude else (self.fallback, 'fallback')
+
+        # probes and stale stats first, outside the lock; ranking below only reads the cache
+        usable = [h for h in hosts if h not in exclude and self.healthy(h)]
+        if self.load_aware:
+            self._refresh(usable)
+        with self._lock:
+            candidates = [h for h in self._round_robin[family] if h not in exclude and self._closed(h)]
+            if not candidates:
+                return None, 'unhealthy'
+            if self.limits.get(family):
+                # hosts at their in-flight limit only when every host is (failover)
+                candidates = [h for h in candidates if self._has_room(family, h, cost)] or candidates
+            host, reason = self._choose(family, candidates, model)
+            self._assign(family, host, model, max(1, cost))
+            return host, reason
+
+    def failover(self, jobtype: str, tried, model: str = None) -> str:
+        """Next healthy host of the family not in tried, or None."""
+        return self.pick(jobtype, exclude=tried, model=model)[0]
+
+    def summary(self) -> dict:
+        """Last known stats per host, for run summaries."""
+        return {
+            host: {'ok': st.ok, 'running': st.running, 'pending': st.pending, 'vram_free': st.vram_free}
+            for host, st in self._stats.items()
+        }
+
+    def reloads(self) -> dict:
+        """
+        Model loads implied by this run's routing: 'expected' switches on hosts that had another
+        model, 'first' loads on hosts new to the run, 'round_robin' switches the old rotation
+        would have caused.
+        """
+        return dict(self.model_loads)
+
+    def health(self) -> dict:
+        """Breaker state and post counts per host, for run summaries."""
+        return {
+            host: {'state': b.state, 'ok': b.ok_count, 'failed': b.failed_count, 'trips': b.trips}
+            for host, b in self._breakers.items()
+        }
+
+
+def count_reloads(placements) -> tuple[int, int]:
+    """(reloads, first loads) for (host, model fingerprint) pairs in submission order."""
+    loaded = {}
+    reloads = first = 0
+    for host, model in placements:
+        if model is None:
+            continue
+        previous = loaded.get(host)
+        if previous != model:
+            if previous is None:
+                first += 1
+            else:
+                reloads += 1
+            loaded[host] = model
+    return reloads, first
@@ -0,0 +1,277 @@
+# job_ledger.py
+# Local SQLite ledger of every prompt the launcher submitted, kept next to the story file
+# (<story>.txt.ledger.sqlite). One row per posted prompt (and one per post that failed):
+# who/where/what (job key, host, seed, payload hash) plus submit/start/finish times and outcome.
+# The renders a trigger prompt queued get rows of their own (parent_id = the trigger's prompt id);
+# their start / finish times are the GPU time of the job.
+# Rows are buffered and written in batches; start/finish come from completion_tracker events.
+# Basis for resume (launcher.py --resume) and reporting:  python job_ledger.py <story.txt> [--run N]
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import fingerprint_store
+
+LEDGER_SUFFIX = '.ledger.sqlite'
+LEDGER_BATCH = 200  # buffered rows per write transaction
+
+QUEUED, POST_FAILED = 'queued', 'post_failed'
+LOST, UNREACHABLE = 'lost', 'unreachable'  # resume: posted but unknown to the host / host down
+RESUBMITTED = 'resubmitted'  # lost or failed, queued again by a later run
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    config_path TEXT,
+    started_at  REAL,
+    finished_at REAL,
+    note        TEXT
+);
+CREATE TABLE IF NOT EXISTS prompts (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id       INTEGER REFERENCES runs(run_id),
+    prompt_id    TEXT UNIQUE,
+    client_id    TEXT,
+    host         TEXT,
+    job_key      TEXT,
+    project      TEXT,
+    sequence     TEXT,
+    shot         TEXT,
+    name         TEXT,
+    jobtype      TEXT,
+    seed         INTEGER,
+    copy         INTEGER,
+    payload_hash TEXT,
+    submitted_at REAL,
+    started_at   REAL,
+    finished_at  REAL,
+    outcome      TEXT,
+    error        TEXT,
+    parent_id    TEXT
+);
+CREATE INDEX IF NOT EXISTS prompts_run ON prompts(run_id);
+"""
+
+_RUN = "COALESCE(?, (SELECT MAX(run_id) FROM runs))"  # a run id parameter, None: the last run
+
+_INSERT = ("INSERT OR REPLACE INTO prompts (run_id, prompt_id, client_id, host, job_key, project, sequence, shot, name,"
+           " jobtype, seed, copy, payload_hash, submitted_at, outcome, error)"
+           " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+# a render inherits the job columns of the trigger prompt that queued it
+_INSERT_RENDER = ("INSERT OR IGNORE INTO prompts (run_id, prompt_id, parent_id, host, job_key, project, sequence,"
+                  " shot, name, jobtype, seed, copy, submitted_at, outcome)"
+                  " SELECT run_id, ?, prompt_id, ?, job_key, project, sequence, shot, name, jobtype, seed, copy, ?, ?"
+                  " FROM prompts WHERE prompt_id = ?")
+_UPDATE = ("UPDATE prompts SET started_at = COALESCE(?, started_at), finished_at = COALESCE(?, finished_at),"
+           " outcome = ?, error = COALESCE(?, error) WHERE prompt_id = ?")
+
+
+def ledger_path_for(config_path) -> str:
+    return str(config_path) + LEDGER_SUFFIX
+
+
+def payload_hash(body: bytes) -> str:
+    """Hash of an encoded payload (before its client_id is added)."""
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+class JobLedger:
+    def __init__(self, path: str, batch_size: int = LEDGER_BATCH):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.run_id = None
+        self._inserts = []
+        self._renders = []
+        self._updates = []
+        self._render_ids = set()  # renders whose row is written or buffered
+        self._lock = threading.Lock()
+        # used from the submitter, tracker and GUI threads, always under self._lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        if 'parent_id' not in {row[1] for row in self._db.execute("PRAGMA table_info(prompts)")}:
+            self._db.execute("ALTER TABLE prompts ADD COLUMN parent_id TEXT")  # ledgers from before renders
+        self._db.execute("CREATE INDEX IF NOT EXISTS prompts_parent ON prompts(parent_id)")
+
+    @classmethod
+    def for_config(cls, config_path) -> 'JobLedger':
+        return cls(ledger_path_for(config_path))
+
+    # --- writing ---
+
+    def start_run(self, config_path=None, note: str = '') -> int:
+        with self._lock:
+            cur = self._db.execute("INSERT INTO runs (config_path, started_at, note) VALUES (?, ?, ?)",
+                                   (str(config_path) if config_path else None, time.time(), note))
+            self._db.commit()
+            self.run_id = cur.lastrowid
+        return self.run_id
+
+    def finish_run(self) -> None:
+        self.flush()
+        if self.run_id is None:
+            return
+        with self._lock:
+            self._db.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (time.time(), self.run_id))
+            self._db.commit()
+
+    def record_submit(self, job: dict, prompt_id, host: str, client_id: str = None,
+                      body_hash: str = None, copy: int = 0, error: str = None) -> None:
+        """One posted prompt of a job; prompt_id None records a post that failed on every host."""
+        row = (self.run_id, prompt_id, client_id, host, fingerprint_store.job_key(job), job['project'],
+               job['sequence'], job['shot_id'], job['name'], job['jt'], job.get('seed_start'), copy,
+               body_hash, time.time(), QUEUED if prompt_id else POST_FAILED, error)
+        with self._lock:
+            self._inserts.append(row)
+            if self._pending_rows() >= self.batch_size:
+                self._flush_locked()
+
+    def record_state(self, state) -> None:
+        """completion_tracker listener: start / finish time and outcome of a tracked prompt or render."""
+        row = (state.started_at, state.finished_at, state.status, state.error, state.prompt_id)
+        with self._lock:
+            if state.parent is not None and state.prompt_id not in self._render_ids:
+                self._render_ids.add(state.prompt_id)
+                self._renders.append((state.prompt_id, state.host, state.submitted_at, QUEUED,
+                                      state.parent.prompt_id))
+            self._updates.append(row)
+            if self._pending_rows() >= self.batch_size:
+                self._flush_locked()
+
+    def record_outcome(self, prompt_id: str, outcome: str, error: str = None) -> None:
+        """Outcome found some other way (e.g. resume checking /history)."""
+        with self._lock:
+            self._updates.append((None, time.time() if outcome in ('done', 'error') else None,
+                                  outcome, error, prompt_id))
+            if self._pending_rows() >= self.batch_size:
+                self._flush_locked()
+
+    def record_move(self, prompt_id: str, new_prompt_id: str, host: str) -> None:
+        """A queued prompt was deleted on its host and re-posted on another (rebalancer.py)."""
+        self.flush()  # its insert may still be buffered
+        with self._lock, self._db:
+            self._db.execute("UPDATE prompts SET prompt_id = ?, host = ? WHERE prompt_id = ?",
+                             (new_prompt_id, host, prompt_id))
+
+    def mark_resubmitted(self, row_ids) -> None:
+        """Rows (by id, failed posts have no prompt id) whose job a resume queued again."""
+        self.flush()
+        with self._lock, self._db:
+            self._db.executemany("UPDATE prompts SET outcome = ? WHERE id = ?",
+                                 [(RESUBMITTED, row_id) for row_id in row_ids])
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _pending_rows(self) -> int:
+        return len(self._inserts) + len(self._renders) + len(self._updates)
+
+    def _flush_locked(self) -> None:
+        if not self._pending_rows():
+            return
+        with self._db:  # one transaction per batch; renders after the trigger rows they copy
+            if self._inserts:
+                self._db.executemany(_INSERT, self._inserts)
+            if self._renders:
+                self._db.executemany(_INSERT_RENDER, self._renders)
+            if self._updates:
+                self._db.executemany(_UPDATE, self._updates)
+        self._inserts.clear()
+        self._renders.clear()
+        self._updates.clear()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    # --- reading ---
+
+    def _query(self, sql: str, params=()) -> list:
+        """Rows of a read, with the buffered rows written first."""
+        with self._lock:
+            self._flush_locked()
+            return self._db.execute(sql, params).fetchall()
+
+    def last_run_id(self):
+        return self._query("SELECT MAX(run_id) FROM runs")[0][0]
+
+    def run(self, run_id: int):
+        rows = self._query("SELECT * FROM runs WHERE run_id = ?", (run_id,))
+        return rows[0] if rows else None
+
+    def prompts(self, run_id: int = None) -> list:
+        """Rows of the prompts posted in one run (default: the last one), in submission order."""
+        return self._query(f"SELECT * FROM prompts WHERE run_id = {_RUN} AND parent_id IS NULL ORDER BY id",
+                           (run_id,))
+
+    def renders(self, run_id: int = None) -> dict:
+        """parent prompt id -> rows of the renders it queued, for one run (default: the last one)."""
+        renders = {}
+        for row in self._query(f"SELECT * FROM prompts WHERE run_id = {_RUN} AND parent_id IS NOT NULL ORDER BY id",
+                               (run_id,)):
+            renders.setdefault(row['parent_id'], []).append(row)
+        return renders
+
+    def mean_durations(self) -> dict:
+        """
+        jobtype -> mean GPU-seconds per posted prompt over all runs: the summed start-to-finish
+        time of the renders of each prompt that finished with all of its renders done.
+        """
+        rows = self._query(
+            "SELECT jobtype, AVG(seconds) FROM ("
+            " SELECT r.jobtype AS jobtype, SUM(r.finished_at - r.started_at) AS seconds"
+            " FROM prompts r JOIN prompts p ON p.prompt_id = r.parent_id"
+            " WHERE p.outcome = 'done' AND r.outcome = 'done' AND r.finished_at >= r.started_at"
+            " GROUP BY r.parent_id) GROUP BY jobtype")
+        return {jobtype: seconds for jobtype, seconds in rows}
+
+    def summary(self, run_id: int = None) -> dict:
+        """Prompt counts of a run by outcome, jobtype and host, render counts by outcome."""
+        rows = self.prompts(run_id)
+        summary = {'prompts': len(rows), 'outcome': {}, 'jobtype': {}, 'host': {}, 'renders': {}}
+        for row in rows:
+            for column in ('outcome', 'jobtype', 'host'):
+                value = row[column] or '-'
+                summary[column][value] = summary[column].get(value, 0) + 1
+        for renders in self.renders(run_id).values():
+            for row in renders:
+                summary['renders'][row['outcome']] = summary['renders'].get(row['outcome'], 0) + 1
+        return summary
+
+
+def format_summary(ledger: JobLedger, run_id: int = None) -> str:
+    run_id = run_id if run_id is not None else ledger.last_run_id()
+    if run_id is None:
+        return "Ledger: no runs recorded"
+    s = ledger.summary(run_id)
+    run = ledger.run(run_id)
+    started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started_at'])) if run else '?'
+    lines = [f"Ledger run {run_id} ({started}): {s['prompts']} prompts"]
+    for column in ('outcome', 'jobtype', 'host'):
+        parts = ", ".join(f"{k} {v}" for k, v in sorted(s[column].items()))
+        lines.append(f"  by {column}: {parts or '-'}")
+    if s['renders']:
+        parts = ", ".join(f"{k} {v}" for k, v in sorted(s['renders'].items()))
+        lines.append(f"  renders: {sum(s['renders'].values())} ({parts})")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Report on the prompts recorded for a story")
+    ap.add_argument('config_path', help="story config whose ledger to read")
+    ap.add_argument('--run', type=int, default=None, help="run id (default: the last run)")
+    args = ap.parse_args()
+    path = ledger_path_for(args.config_path)
+    if not os.path.exists(path):
+        raise SystemExit(f"No ledger at {path}")
+    ledger = JobLedger(path)
+    print(format_summary(ledger, args.run))
+    ledger.close()
@@ -6,19 +6,61 @@
 # Updated 2025/2026: LoRAs now passed via WorkflowTrigger inputs instead of patching base workflow
 # Added: LTX_HOST / LTX_HOSTS round-robin support
 # Added: Skip shots with DISABLED=1
-
+# Added: run_all loads the story through the sidecar cache (config_cache.py)
+# Updated: collect_jobs walks shots once using the ShotIndex flags, typed fields decoded per shot
+# Added: streaming mode - iter_jobs feeds a bounded payload queue drained by the submitter
+# Added: --dirty - only queue jobs whose shot fingerprint changed since the last successful run
+# Updated: fingerprints are recorded when a job's renders finish done (--wait, GUI), not when it is queued
+# Updated: asyncio submitter posts to all hosts in parallel with a per-host concurrency limit
+# Updated: posts go through the shared keep-alive sessions in http_pool.py
+# Updated: base workflows are compiled once (workflow_templates.py); prompt text is no longer JSON-escaped
+# Updated: payloads are built copy-on-write and posted as pre-encoded bytes
+# Updated: load-aware host selection from live /queue and /system_stats (host_scheduler.py), HOST_SCHEDULER=roundrobin for the old rotation
+# Added: host health probes, per-host circuit breakers and failover of failed posts to the next healthy host
+# Added: host capacity weights (FLUX_HOST=big:8188*4) - more jobs and more parallel posts for big nodes
+# Added: model-affinity routing - jobs stay on hosts that already loaded their checkpoint / LoRA stack
+# Added: deterministic mode (--deterministic / DETERMINISTIC=1) - no [ts:] cache buster, cache-friendly order, explicit seeds
+# Added: --wait - follow queued prompts to completion over websocket events (completion_tracker.py)
+# Updated: a queued job only counts as done once the renders its trigger node queued are done
+# Added: every posted prompt is recorded in the story's SQLite job ledger (job_ledger.py)
+# Added: --resume - check the last run's prompts against each host's /queue and /history, resubmit lost and failed ones
+# Updated: --resume follows each trigger prompt to the renders it queued and looks prompts up by id in /history
+# Added: --plan - build every payload into a JSONL file without posting, with per-host GPU-seconds from ledger history
+# Updated: GPU-seconds are timed on the renders the trigger nodes queue (ledger rows with a parent_id)
+# Added: per-host in-flight limits (FLUX_MAX_INFLIGHT=N etc.) - the rest waits in a local, reprioritisable backlog
+# Added: PRIORITY= per shot - higher priorities are submitted first, high and hero with ComfyUI's front flag
+# Updated: jobs always pass through the lazily filled backlog - priority order, submission order within one
+# Added: REBALANCE=1 / --rebalance - work stealing of queued prompts from busy to idle hosts (rebalancer.py)
+
+import asyncio
 import json
 import os
+import queue
+import threading
 import time
-import requests
 import sys
+import zlib
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import parser  # config parser
+import config_cache
+import fingerprint_store
+import job_ledger
 
 # Relative paths
 ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
 WORKFLOWS_DIR = os.path.join(ROOT_DIR, 'workflows')
 
+# Root-level modules shared with the ComfyUI nodes (http_pool.py, workflow_templates.py)
+if os.path.abspath(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, os.path.abspath(ROOT_DIR))
+import http_pool
+import workflow_templates
+import completion_tracker
+import host_scheduler  # uses http_pool
+import backlog as job_backlog
+import rebalancer as work_stealing
+
 jobtype_to_json = {
     'ct_flux_t2i':          os.path.join(WORKFLOWS_DIR, 'ct_flux_t2i_node.json'),
     'ct_wan2_5s':           os.path.join(WORKFLOWS_DIR, 'ct_wan2_5s_node.json'),
@@ -27,20 +69,45 @@ jobtype_to_json = {
     'ct_ltx2_i2v':          os.path.join(WORKFLOWS_DIR, 'ct_ltx2_i2v_node.json'),
 }
 
-# Round-robin queues per job family
+# Host selection per job family (host_scheduler.py); the deques are the plain round-robin view
 flux_host_queue = None
 wan_host_queue = None
 qwen_host_queue = None
 ltx_host_queue = None
 fallback_host = "http://127.0.0.1:8188"
-
-def init_host_queues(globals_data):
-    global flux_host_queue, wan_host_queue, qwen_host_queue, ltx_host_queue, fallback_host
+scheduler = None
+backlog = None  # job_backlog.Backlog of the running submission (reprioritisable while it runs)
+_print_lock = threading.Lock()
+
+def _log(line: str) -> None:
+    """Print one whole line; posts run on many threads and print() writes text and newline separately."""
+    with _print_lock:
+        print(line, flush=True)
+
+def _max_inflight(globals_data, family: str) -> int:
+    key = f'{family.upper()}_MAX_INFLIGHT'
+    raw = str(globals_data.get(key, '') or '').strip()
+    if not raw:
+        return 0
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        print(f"Warning: {key}={raw!r} is not a number, no limit used")
+        return 0
+
+def init_host_queues(globals_data, load_aware=None):
+    """
+    Set up host selection from the story globals. load_aware=None reads HOST_SCHEDULER
+    (load = pick by live queue depth, default; roundrobin = old blind rotation).
+    """
+    global flux_host_queue, wan_host_queue, qwen_host_queue, ltx_host_queue, fallback_host, scheduler
     flux_hosts = globals_data.get('FLUX_HOSTS', [])
     wan_hosts = globals_data.get('WAN_HOSTS', [])
     qwen_hosts = globals_data.get('QWEN_HOSTS', [])
     ltx_hosts  = globals_data.get('LTX_HOSTS', [])
     fallback   = globals_data.get('FALLBACK_HOST', '127.0.0.1:8188')
+    if load_aware is None:
+        load_aware = str(globals_data.get('HOST_SCHEDULER', 'load')).strip().lower() != 'roundrobin'
 
     flux_host_queue = deque([f"http://{h}" for h in flux_hosts]) if flux_hosts else None
     wan_host_queue  = deque([f"http://{h}" for h in wan_hosts]) if wan_hosts else None
@@ -48,6 +115,16 @@ def init_host_queues(globals_data):
     ltx_host_queue  = deque([f"http://{h}" for h in ltx_hosts]) if ltx_hosts else None
 
     fallback_host = f"http://{fallback}"
+    weights = {
+        family: {f"http://{h}": w for h, w in globals_data.get(f'{family.upper()}_HOST_WEIGHTS', {}).items()}
+        for family in host_scheduler.FAMILIES
+    }
+    limits = {family: _max_inflight(globals_data, family) for family in host_scheduler.FAMILIES}
+    scheduler = host_scheduler.HostScheduler(
+        {'flux': flux_host_queue or [], 'wan': wan_host_queue or [],
+         'qwen': qwen_host_queue or [], 'ltx': ltx_host_queue or []},
+        fallback_host, load_aware=load_aware, weights=weights, limits=limits,
+    )
 
     print("Host queues initialized:")
     print(f" flux → {flux_host_queue}")
@@ -55,55 +132,153 @@ def init_host_queues(globals_data):
     print(f" qwen → {qwen_host_queue}")
     print(f" ltx  → {ltx_host_queue}")
     print(f" fallback → {fallback_host}")
+    print(f" scheduler → {'load-aware' if load_aware else 'round-robin'}")
+    weighted = {h: scheduler.weight(h) for hosts in scheduler.families.values() for h in hosts
+                if scheduler.weight(h) > 1}
+    if weighted:
+        print(f" weights → {weighted}")
+    if scheduler.limited:
+        print(f" max in flight per host → {({f: n for f, n in scheduler.limits.items() if n})}")
+
+def get_next_host(jobtype: str, model: str = None, cost: int = 1) -> str:
+    """
+    Healthy host with the lowest expected wait for the job family, round-robin when no stats are
+    available. With a model fingerprint, hosts that already have that model loaded come first.
+    """
+    if scheduler is None:
+        init_host_queues({})
+    host, reason = scheduler.pick(jobtype, model=model, cost=cost)
+    family = host_scheduler.family_of(jobtype)
+    if reason == 'unhealthy':
+        print(f"→ All {family.upper()} hosts unavailable, using fallback host: {fallback_host}")
+        return fallback_host
+    if reason == 'fallback':
+        print(f"→ Using fallback host: {fallback_host}")
+    else:
+        print(f"→ Using {family.upper()} host: {host} ({reason})")
+    return host
+
+def format_host_stats() -> str:
+    if scheduler is None or not scheduler.summary():
+        return "Host load: no stats"
+    parts = []
+    for host, st in sorted(scheduler.summary().items()):
+        if st['ok']:
+            parts.append(f"{host} {st['running']} running / {st['pending']} pending, "
+                         f"{st['vram_free'] / 2**30:.1f} GB free")
+        else:
+            parts.append(f"{host} unavailable")
+    return "Host load: " + ", ".join(parts)
+
+def format_model_reloads(results) -> str:
+    """Model loads the routing expected vs. where the prompts actually landed (after failovers)."""
+    if scheduler is None:
+        return "Model reloads: no scheduler"
+    expected = scheduler.reloads()
+    placements = [(host, r['job'].get('model_key')) for r in results if r.get('success')
+                  for host in r.get('hosts', [])]
+    observed, first = host_scheduler.count_reloads(placements)
+    return (f"Model reloads: expected {expected['expected']} (+{expected['first']} first loads), "
+            f"observed {observed} (+{first} first loads), round-robin would need {expected['round_robin']}")
+
+def format_completion(tracker) -> str:
+    counts = tracker.counts()
+    states = tracker.states()
+    failed = [s for s in states if s.status == completion_tracker.ERROR]
+    renders = sum(len(s.renders) for s in states)
+    line = (f"Completion: {counts['done']} done, {counts['error']} failed, "
+            f"{counts['running']} running, {counts['queued']} queued ({renders} renders followed)")
+    for state in failed[:10]:
+        job = state.info or {}
+        line += (f"\n  ❌ {job.get('jt', '?')} {job.get('sequence', '?')}/{job.get('shot_id', '?')}/"
+                 f"{job.get('name', '?')} on {state.host}: {state.error}")
+    return line
+
+def format_plan(results, durations: dict) -> str:
+    """
+    Jobs, prompts and estimated GPU-seconds per host. durations: jobtype -> mean GPU-seconds of
+    the renders one posted prompt queues (job_ledger.mean_durations).
+    """
+    per_host = {}
+    unknown = {}
+    for r in results:
+        if not r.get('success'):
+            continue
+        job = r['job']
+        h = per_host.setdefault(r['server'], {'jobs': 0, 'prompts': 0, 'seconds': 0.0})
+        h['jobs'] += 1
+        h['prompts'] += job['num_jobs']
+        if job['jt'] in durations:
+            h['seconds'] += durations[job['jt']] * job['num_jobs']
+        else:
+            unknown[job['jt']] = unknown.get(job['jt'], 0) + job['num_jobs']
+    if not per_host:
+        return "Plan: nothing to queue"
+    lines = ["Plan per host:"]
+    finish = 0.0
+    for host, h in sorted(per_host.items()):
+        weight = scheduler.weight(host) if scheduler is not None else 1
+        finish = max(finish, h['seconds'] / weight)
+        note = f" (weight {weight}: ~{h['seconds'] / weight:.0f}s)" if weight > 1 else ""
+        lines.append(f" {host}: {h['jobs']} jobs, {h['prompts']} prompts, ~{h['seconds']:.0f} GPU-s{note}")
+    if finish:
+        when = f"{finish / 3600:.1f} h" if finish >= 3600 else f"{finish / 60:.0f} min"
+        lines.append(f" estimated finish: ~{when} (busiest host)")
+    if durations:
+        lines.append(" mean render time per prompt: "
+                     + ", ".join(f"{jt} {sec:.0f}s" for jt, sec in sorted(durations.items())))
+    if unknown:
+        lines.append(" no duration history (not estimated): "
+                     + ", ".join(f"{jt} {n} prompts" for jt, n in sorted(unknown.items())))
+    return "\n".join(lines)
+
+def format_host_health() -> str:
+    if scheduler is None or not scheduler.health():
+        return "Host health: no hosts"
+    parts = []
+    for host, h in sorted(scheduler.health().items()):
+        trips = f", opened {h['trips']}x" if h['trips'] else ""
+        parts.append(f"{host} {h['state']} ({h['ok']} posts ok / {h['failed']} failed{trips})")
+    return "Host health: " + ", ".join(parts)
+
+KNOWN_JOBTYPES = ['ct_flux_t2i', 'ct_wan2_5s', 'ct_qwen_i2i', 'ct_qwen_cameratransform', 'ct_ltx2_i2v']
+FLUX_LORA_SLOTS = 8
+SUBMIT_QUEUE_SIZE = 8  # payloads built ahead of submission in streaming mode
+HOST_CONCURRENCY = 2   # posts in flight per ComfyUI host
+TRIGGER_NODES = ('WorkflowTrigger', 'CT_WAN_TRIGGER', 'CT_LTX2_i2v_trigger', 'QwenCameraTrigger')
+RESUME_TIMEOUT = (2, 10)  # /queue and /history lookups when resuming
+
+def _lookup(shot_data, globals_data, key, default=""):
+    """Launcher lookup rule: a shot value wins unless empty, then globals, then default."""
+    v = shot_data.get(key) or globals_data.get(key, default)
+    return v.strip() if isinstance(v, str) else default
+
+def decode_loras(shot_data, globals_data) -> list[tuple[str, float]]:
+    """(filename, strength) for FLUX_LORA1..8; a bad strength falls back to 1.0."""
+    loras = []
+    for i in range(1, FLUX_LORA_SLOTS + 1):
+        filename = _lookup(shot_data, globals_data, f"FLUX_LORA{i}", "")
+        strength = _lookup(shot_data, globals_data, f"FLUX_LORA{i}_STRENGTH", "1.0")
+        try:
+            loras.append((filename, float(strength)))
+        except (ValueError, TypeError):
+            loras.append((filename, 1.0))
+    return loras
 
-def get_next_host(jobtype: str) -> str:
-    """Round-robin host selection per job family"""
-    global flux_host_queue, wan_host_queue, qwen_host_queue, ltx_host_queue, fallback_host
-    jt_lower = jobtype.lower()
-
-    if 'flux' in jt_lower and flux_host_queue and len(flux_host_queue) > 0:
-        host = flux_host_queue.popleft()
-        flux_host_queue.append(host)
-        print(f"→ Using FLUX host: {host}")
-        return host
-
-    if 'wan' in jt_lower and wan_host_queue and len(wan_host_queue) > 0:
-        host = wan_host_queue.popleft()
-        wan_host_queue.append(host)
-        print(f"→ Using WAN host: {host}")
-        return host
-
-    if 'qwen' in jt_lower or 'cameratransform' in jt_lower:
-        if qwen_host_queue and len(qwen_host_queue) > 0:
-            host = qwen_host_queue.popleft()
-            qwen_host_queue.append(host)
-            print(f"→ Using QWEN host: {host}")
-            return host
-
-    if 'ltx' in jt_lower and ltx_host_queue and len(ltx_host_queue) > 0:
-        host = ltx_host_queue.popleft()
-        ltx_host_queue.append(host)
-        print(f"→ Using LTX host: {host}")
-        return host
-
-    # fallback
-    print(f"→ Using fallback host: {fallback_host}")
-    return fallback_host
-
-def load_and_modify_workflow(base_path: str, job_data: dict, seed_start: int = 0) -> tuple[dict, str]:
+def load_and_modify_workflow(base_path: str, job_data: dict, seed_start: int = 0,
+                             deterministic: bool = False) -> tuple[dict, str]:
     if not os.path.exists(base_path):
         raise FileNotFoundError(f"Base workflow missing: {base_path}")
 
-    with open(base_path, 'r') as f:
-        loaded_data = json.load(f)
-
-    payload_str = json.dumps(loaded_data)
-
-    cache_buster = f" [ts:{int(time.time()*1000)}]"
-    job_data['workflow_json'] += cache_buster
-    payload_str = payload_str.replace("REPLACETEXT", job_data['workflow_json'])
+    template = workflow_templates.load_template(base_path)
 
-    payload = json.loads(payload_str)
+    if not deterministic:
+        # Cache buster: makes every prompt unique, so ComfyUI re-runs even unchanged nodes
+        cache_buster = f" [ts:{int(time.time()*1000)}]"
+        job_data['workflow_json'] += cache_buster
+    # Copy-on-write: only the nodes patched below are copied, the rest is shared with the template
+    writable = ["1"] + template.nodes_of_class("SaveImage", "SaveVideo", "PrimitiveInt", "Int", "KSampler")
+    payload = template.render({workflow_templates.PLACEHOLDER: job_data['workflow_json']}, writable=writable)
 
     if "nodes" in payload:
         prompt_dict = payload
@@ -118,14 +293,15 @@ def load_and_modify_workflow(base_path: str, job_data: dict, seed_start: int = 0
     height     = job_data['height']
     name       = job_data['name']
     jt         = job_data['jt']
-    server_url = get_next_host(jt)
-
     shot_d    = job_data['shot_data']
     globals_d = job_data['globals']
 
+    # Checkpoint / LoRA stack: routes the job to a host that already has those models loaded
+    job_data['model_key'] = parser.model_fingerprint(shot_d, jt)
+    server_url = get_next_host(jt, job_data['model_key'], job_data.get('num_jobs', 1))
+
     def get_val(k, default=""):
-        v = shot_d.get(k) or globals_d.get(k, default)
-        return v.strip() if isinstance(v, str) else default
+        return _lookup(shot_d, globals_d, k, default)
 
     if 'flux' in jt.lower():
         flux_node = prompt_dict.get("1", {})
@@ -145,16 +321,10 @@ def load_and_modify_workflow(base_path: str, job_data: dict, seed_start: int = 0
         inputs["name"] = name
         inputs["seed_start"] = job_data['seed_start']
 
-        for i in range(1, 9):
-            fn_key = f"FLUX_LORA{i}"
-            str_key = f"FLUX_LORA{i}_STRENGTH"
-            filename = get_val(fn_key, "")
-            strength = get_val(str_key, "1.0")
+        loras = job_data.get('loras') or decode_loras(shot_d, globals_d)
+        for i, (filename, strength) in enumerate(loras, start=1):
             inputs[f"lora_{i}"] = filename
-            try:
-                inputs[f"lora_{i}_strength"] = float(strength)
-            except (ValueError, TypeError):
-                inputs[f"lora_{i}_strength"] = 1.0
+            inputs[f"lora_{i}_strength"] = strength
 
         print("DEBUG: LoRA inputs sent to WorkflowTrigger node:")
         for k in sorted(inputs):
@@ -261,180 +431,875 @@ def load_and_modify_workflow(base_path: str, job_data: dict, seed_start: int = 0
                 node["inputs"]["seed"] = job_data['seed_start']
 
     filename_prefix = f"{project}/{sequence}/{shot_id}/{name}_"
-    for nid, node in prompt_dict.items():
-        if node.get("class_type") in ["SaveImage", "SaveVideo"]:
+    if not template.ui_format:
+        for nid in template.nodes_of_class("SaveImage", "SaveVideo"):
+            node = prompt_dict[nid]
             if "filename_prefix" in node["inputs"]:
                 node["inputs"]["filename_prefix"] = filename_prefix
 
     if "prompt" not in payload:
         payload = {"prompt": prompt_dict}
 
+    if job_data.get('priority', 0) >= parser.FRONT_PRIORITY:
+        # ahead of the host's queue, and the trigger node queues its renders at the front as well
+        payload["front"] = True
+        trigger = prompt_dict.get("1")
+        if trigger is not None and trigger.get("class_type") in TRIGGER_NODES:
+            trigger["inputs"]["front"] = True
+
     return payload, server_url
 
+def _try_post(server_url: str, body: bytes, i: int, num_jobs: int, client_id: str = None) -> tuple:
+    """
+    Post one copy of an encoded payload. Returns (prompt id or None, host_fault); host_fault is
+    True when the host itself failed (no connection, timeout, 5xx) so the post may go elsewhere.
+    """
+    job_body = workflow_templates.with_client_id(body, client_id or f"{time.time()}_{i}")
+    try:
+        resp = http_pool.post_bytes(f"{server_url}/prompt", job_body, timeout=15)
+    except Exception as e:
+        _log(f"Queue failed on {server_url}: {e}")
+        if scheduler is not None:
+            scheduler.record_result(server_url, False)
+        return None, True
+    host_fault = resp.status_code >= 500
+    if scheduler is not None:
+        scheduler.record_result(server_url, not host_fault)
+    try:
+        resp.raise_for_status()
+        prompt_id = resp.json().get("prompt_id")
+        _log(f"Queued {i+1}/{num_jobs} → {server_url} | ID: {prompt_id[:8]}...")
+        return prompt_id, False
+    except Exception as e:
+        _log(f"Queue failed on {server_url}: {e}")
+        return None, host_fault
+
+def _post_prompt(server_url: str, body: bytes, i: int, num_jobs: int):
+    """Post one copy of an encoded payload. Returns the prompt id, or None if the post failed."""
+    return _try_post(server_url, body, i, num_jobs)[0]
+
 def queue_workflow_via_api(server_url: str, payload: dict, num_jobs: int = 1) -> list:
     queued_ids = []
-    base_payload = payload
+    body = workflow_templates.encode_payload(payload)  # serialized once, client_id spliced in per post
     for i in range(num_jobs):
-        job_payload = json.loads(json.dumps(base_payload))
-        job_payload["client_id"] = f"{time.time()}_{i}"
-        try:
-            resp = requests.post(f"{server_url}/prompt", json=job_payload, timeout=15)
-            resp.raise_for_status()
-            prompt_id = resp.json().get("prompt_id")
+        prompt_id = _post_prompt(server_url, body, i, num_jobs)
+        if prompt_id is not None:
             queued_ids.append(prompt_id)
-            print(f"Queued {i+1}/{num_jobs} → {server_url} | ID: {prompt_id[:8]}...")
-        except Exception as e:
-            print(f"Queue failed on {server_url}: {e}")
     return queued_ids
 
+async def queue_workflow_async(server_url: str, payload: dict, num_jobs: int, slots_for, executor,
+                               jobtype: str = None, model: str = None, client_id: str = None) -> list:
+    """
+    queue_workflow_via_api for the asyncio submitter: every post runs in executor while
+    holding one of its host's slots (slots_for(host) -> asyncio.Semaphore).
+    A post the host failed is resubmitted to the next healthy host of the jobtype's family
+    (preferring hosts with the job's model loaded).
+    payload may be passed already encoded (bytes).
+    Returns [(prompt_id, host)] in post order, failed posts left out.
+    """
+    loop = asyncio.get_running_loop()
+    body = payload if isinstance(payload, bytes) else workflow_templates.encode_payload(payload)
+
+    async def post(i):
+        host, tried = server_url, []
+        while host is not None:
+            if jobtype is not None and scheduler is not None and host in scheduler.hosts_for(jobtype) \
+                    and not await loop.run_in_executor(None, scheduler.healthy, host):
+                # breaker opened after the payload was built for this host
+                tried.append(host)
+                scheduler.release(host)
+                host = await loop.run_in_executor(None, scheduler.failover, jobtype, tried, model)
+                continue
+            async with slots_for(host):
+                prompt_id, host_fault = await loop.run_in_executor(executor, _try_post, host, body, i, num_jobs,
+                                                                   client_id)
+            if prompt_id is not None:
+                return prompt_id, host
+            if scheduler is not None:
+                scheduler.release(host)  # this copy never got queued there
+            if not host_fault or jobtype is None or scheduler is None:
+                return None
+            tried.append(host)
+            host = await loop.run_in_executor(None, scheduler.failover, jobtype, tried, model)
+            if host is not None:
+                _log(f"↪ Resubmitting {i+1}/{num_jobs} to {host}")
+        return None
+
+    posted = await asyncio.gather(*(post(i) for i in range(num_jobs)))
+    return [p for p in posted if p is not None]
+
+class ShotPlan:
+    """Typed fields of one subshot, decoded once and shared by all of its jobs."""
+    __slots__ = ('shot_data', 'globals', 'width', 'height', 'workflow_json', 'priority', '_loras', '_num_jobs')
+
+    def __init__(self, shot_data, globals_data):
+        self.shot_data = shot_data
+        self.globals = globals_data
+        self.width = int(shot_data.get('WIDTH', globals_data.get('WIDTH', 1024)))
+        self.height = int(shot_data.get('HEIGHT', globals_data.get('HEIGHT', 1024)))
+
+        prompt_parts = []
+        if img := shot_data.get('IMG_PROMPT', '').strip():
+            prompt_parts.append(img)
+        if env := shot_data.get('ENVIRONMENT_PROMPT', '').strip():
+            prompt_parts.append(env)
+        if style := globals_data.get('GRAPHICAL_STYLE', '').strip():
+            prompt_parts.append(style)
+        # Plain text: workflow_templates binds it structurally, so no JSON escaping
+        self.workflow_json = ", ".join(prompt_parts).strip()
+        self.priority = parser.shot_priority(shot_data)
+
+        self._loras = None
+        self._num_jobs = {}
+
+    @property
+    def loras(self) -> list[tuple[str, float]]:
+        if self._loras is None:
+            self._loras = decode_loras(self.shot_data, self.globals)
+        return self._loras
+
+    def num_jobs(self, jt: str) -> int:
+        # Decoded per job family on first use, so a bad value only fails the jobs that read it
+        jt_lower = jt.lower()
+        if 'flux' in jt_lower:
+            family, key = 'flux', 'FLUX_ITERATIONS'
+        elif 'wan' in jt_lower or 'ltx' in jt_lower:
+            return 1
+        elif 'qwen' in jt_lower:
+            family, key = 'qwen', 'GENERATE_QWEN_ANGLES'
+        else:
+            family, key = 'other', 'ITERATIONS'
+        if family not in self._num_jobs:
+            self._num_jobs[family] = int(self.shot_data.get(key, self.globals.get(key, 1)))
+        return self._num_jobs[family]
+
+def _shot_flags(config, key, shot_data):
+    """ShotFlags from the config's ShotIndex; decoded on the spot for plain dict configs."""
+    index = getattr(config, 'index', None)
+    flags = index.flags(key) if index is not None else None
+    return flags if flags is not None else parser.ShotFlags(shot_data, {})
+
+def _job_dict(project, key, jt, plan, seed_start):
+    seq, shot_id, subshot_id = key
+    return {
+        'project': project,
+        'sequence': seq,
+        'shot_id': shot_id,
+        'subshot_id': subshot_id,
+        'jt': jt,
+        'shot_data': plan.shot_data,
+        'num_jobs': plan.num_jobs(jt),
+        'workflow_json': "" if jt == 'ct_qwen_cameratransform' else plan.workflow_json,
+        'width': plan.width,
+        'height': plan.height,
+        'name': subshot_id,
+        'globals': plan.globals,
+        'seed_start': seed_start,
+        'loras': plan.loras if 'flux' in jt else None,
+        'priority': plan.priority,
+    }
+
+def _project_index(config, project_dict):
+    """The config's ShotIndex, or one built on the spot for plain dict configs."""
+    index = getattr(config, 'index', None)
+    if index is not None:
+        return index
+    index = parser.ShotIndex()
+    for seq, shots in project_dict.items():
+        for shot_id, subshots in shots.items():
+            for subshot_id, shot_data in subshots.items():
+                index.add((seq, shot_id, subshot_id), shot_data)
+    return index
+
 def collect_jobs(config, allowed_jobtypes=None, target_project=None, target_sequence=None, target_shot=None):
+    """
+    Job dicts for every enabled shot, ordered by jobtype (KNOWN_JOBTYPES order), then by
+    sorted sequence / shot / name. Shots are walked once and bucketed per jobtype.
+    """
     globals_data = config['globals']
     project = target_project or globals_data.get('PROJECT', 'default')
     if project not in config:
         raise ValueError(f"Project '{project}' not found")
 
-    sequences_to_run = [target_sequence] if target_sequence else list(config[project].keys())
-    jobs = []
-    known_jobtypes = ['ct_flux_t2i', 'ct_wan2_5s', 'ct_qwen_i2i', 'ct_qwen_cameratransform', 'ct_ltx2_i2v']
+    project_dict = config[project]
+    wanted = [jt for jt in KNOWN_JOBTYPES if not allowed_jobtypes or jt in allowed_jobtypes]
+    buckets = {jt: [] for jt in wanted}
+    if not wanted:
+        print("Collected 0 jobs")
+        return []
+
+    seed_start = int(globals_data.get('SEED_START', 0)) % 4294967296
+    sequences_to_run = [target_sequence] if target_sequence else sorted(project_dict.keys())
 
-    for jt in known_jobtypes:
-        if allowed_jobtypes and jt not in allowed_jobtypes:
+    for seq in sequences_to_run:
+        seq_dict = project_dict.get(seq)
+        if seq_dict is None:
             continue
-        for seq in sorted(sequences_to_run):
-            if seq not in config[project]:
+        shots_to_run = [target_shot] if target_shot else sorted(seq_dict.keys())
+        for shot_id in shots_to_run:
+            subshots = seq_dict.get(shot_id)
+            if subshots is None:
                 continue
-            shots_to_run = sorted(config[project][seq].keys()) if not target_shot else [target_shot]
-            for shot_id in shots_to_run:
-                for subshot_id in sorted(config[project][seq][shot_id]):
-                    shot_data = config[project][seq][shot_id][subshot_id]
-
-                    # ─── NEW: Skip disabled shots ───────────────────────────────────────
-                    disabled_val = shot_data.get('DISABLED', '0').strip().lower()
-                    if disabled_val in ('1', 'yes', 'true', 'on', 'disabled'):
-                        print(f"Skipped disabled shot: {project}/{seq}/{shot_id}/{subshot_id}")
-                        continue
-                    # ────────────────────────────────────────────────────────────────────
-
-                    jobtype_str = shot_data.get('JOBTYPE') or shot_data.get('IMAGE_JOBTYPE') or shot_data.get('VIDEO_JOBTYPE')
-                    if not jobtype_str:
-                        continue
-                    jobtypes_list = [j.strip() for j in jobtype_str.split(',') if j.strip()]
-                    if jt not in jobtypes_list:
-                        continue
-
-                    workflow_json = ""
-                    if jt not in ['ct_qwen_cameratransform']:
-                        prompt_parts = []
-                        if img := shot_data.get('IMG_PROMPT', '').strip():
-                            prompt_parts.append(img)
-                        if env := shot_data.get('ENVIRONMENT_PROMPT', '').strip():
-                            prompt_parts.append(env)
-                        if style := globals_data.get('GRAPHICAL_STYLE', '').strip():
-                            prompt_parts.append(style)
-                        workflow_json = ", ".join(prompt_parts).strip()
-
-                    workflow_json_escaped = json.dumps(workflow_json)[1:-1] if workflow_json else ""
-
-                    width = int(shot_data.get('WIDTH', globals_data.get('WIDTH', 1024)))
-                    height = int(shot_data.get('HEIGHT', globals_data.get('HEIGHT', 1024)))
-                    name = subshot_id
-
-                    if 'flux' in jt.lower():
-                        num_jobs = int(shot_data.get('FLUX_ITERATIONS', globals_data.get('FLUX_ITERATIONS', 1)))
-                    elif 'wan' in jt.lower() or 'ltx' in jt.lower():
-                        num_jobs = 1
-                    elif 'qwen' in jt.lower():
-                        num_jobs = int(shot_data.get('GENERATE_QWEN_ANGLES', globals_data.get('GENERATE_QWEN_ANGLES', 1)))
-                    else:
-                        num_jobs = int(shot_data.get('ITERATIONS', globals_data.get('ITERATIONS', 1)))
-
-                    jobs.append({
-                        'project': project,
-                        'sequence': seq,
-                        'shot_id': shot_id,
-                        'subshot_id': subshot_id,
-                        'jt': jt,
-                        'shot_data': shot_data,
-                        'num_jobs': num_jobs,
-                        'workflow_json': workflow_json_escaped,
-                        'width': width,
-                        'height': height,
-                        'name': name,
-                        'globals': globals_data,
-                        'seed_start': int(globals_data.get('SEED_START', 0)) % 4294967296,
-                    })
+            for subshot_id in sorted(subshots):
+                shot_data = subshots[subshot_id]
+                flags = _shot_flags(config, (seq, shot_id, subshot_id), shot_data)
 
+                if flags.disabled:
+                    print(f"Skipped disabled shot: {project}/{seq}/{shot_id}/{subshot_id}")
+                    continue
+
+                shot_jobtypes = [jt for jt in wanted if jt in flags.jobtypes]
+                if not shot_jobtypes:
+                    continue
+
+                plan = ShotPlan(shot_data, globals_data)
+                for jt in shot_jobtypes:
+                    buckets[jt].append(_job_dict(project, (seq, shot_id, subshot_id), jt, plan, seed_start))
+
+    jobs = [job for jt in wanted for job in buckets[jt]]
     print(f"Collected {len(jobs)} jobs")
     return jobs
 
-def run_storytools_execution(config, allowed_jobtypes=None, target_project=None, target_sequence=None, target_shot=None):
+def iter_jobs(config, allowed_jobtypes=None, target_project=None, target_sequence=None, target_shot=None):
+    """
+    Streaming form of collect_jobs: the same job dicts in the same order, yielded one by one.
+    Each jobtype only sorts its own index keys, so the first job is ready without planning
+    the whole project and nothing is kept after it has been yielded.
+    """
     globals_data = config['globals']
-    init_host_queues(globals_data)
-    jobs = collect_jobs(config, allowed_jobtypes, target_project, target_sequence, target_shot)
-    if not jobs:
-        print("No jobs to queue.")
-        return []
+    project = target_project or globals_data.get('PROJECT', 'default')
+    if project not in config:
+        raise ValueError(f"Project '{project}' not found")
 
-    all_results = []
+    project_dict = config[project]
+    index = _project_index(config, project_dict)
+    seed_start = int(globals_data.get('SEED_START', 0)) % 4294967296
+
+    for jt in KNOWN_JOBTYPES:
+        if allowed_jobtypes and jt not in allowed_jobtypes:
+            continue
+        # (seq, shot, name) tuples sort exactly like the nested sorted() walk in collect_jobs
+        keys = sorted(
+            k for k in index.shots_for_jobtype(jt)
+            if (not target_sequence or k[0] == target_sequence) and (not target_shot or k[1] == target_shot)
+        )
+        for key in keys:
+            seq, shot_id, subshot_id = key
+            if index.flags(key).disabled:
+                print(f"Skipped disabled shot: {project}/{seq}/{shot_id}/{subshot_id}")
+                continue
+            shot_data = project_dict[seq][shot_id][subshot_id]
+            yield _job_dict(project, key, jt, ShotPlan(shot_data, globals_data), seed_start)
+
+def job_seed(job) -> int:
+    """
+    Explicit seed of a job in deterministic mode: the shot's own SEED_START if it sets one
+    (a value other than the global one), otherwise the global SEED_START offset by a stable
+    hash of sequence/shot/name, so shots with the same prompt still render different images
+    without a timestamp in the prompt.
+    """
+    own = str(job['shot_data'].get('SEED_START', '') or '').strip()
+    if own and own != str(job['globals'].get('SEED_START', '') or '').strip():
+        return int(own) % 4294967296
+    ident = f"{job['sequence']}/{job['shot_id']}/{job['name']}".encode('utf-8')
+    return (job['seed_start'] + zlib.crc32(ident)) % 4294967296
+
+def _cache_key(job):
+    # same models, then same prompt text back to back; shot order within a group
+    return (parser.model_fingerprint(job['shot_data'], job['jt']) or '', job['workflow_json'],
+            job['sequence'], job['shot_id'], job['subshot_id'])
+
+def cache_friendly(jobs):
+    """
+    Deterministic mode: per jobtype, reorder jobs so jobs sharing model / LoRA and prompt inputs
+    are submitted back to back (model affinity keeps them on one host), and give every job an
+    explicit seed (job_seed). Buffers one jobtype at a time.
+    """
+    bucket, current = [], None
     for job in jobs:
+        if job['jt'] != current and bucket:
+            yield from sorted(bucket, key=_cache_key)
+            bucket = []
+        current = job['jt']
+        job['seed_start'] = job_seed(job)
+        bucket.append(job)
+    yield from sorted(bucket, key=_cache_key)
+
+def start_rebalancer(globals_data, tracker, ledger=None, rebalance: bool = None):
+    """
+    Running work_stealing.Rebalancer when rebalance (None: REBALANCE in the globals) is on and the
+    prompts are tracked; None otherwise. Only moves prompts while this process is alive.
+    """
+    if rebalance is None:
+        rebalance = str(globals_data.get('REBALANCE', '0')).strip().lower() in ('1', 'true', 'yes', 'on')
+    if not rebalance or tracker is None or scheduler is None:
+        return None
+    if not any(len(hosts) > 1 for hosts in scheduler.families.values()):
+        return None
+    print(f"Rebalancer: checking host queues every {work_stealing.REBALANCE_INTERVAL:.0f}s")
+    return work_stealing.Rebalancer(scheduler, tracker, ledger).start()
+
+def stop_rebalancer(rebalancer) -> None:
+    if rebalancer is not None:
+        rebalancer.stop()
+        print(rebalancer.summary())
+
+def select_jobs(jobs, copies: dict):
+    """Only the jobs in copies (fingerprint_store.job_key -> copies to queue), num_jobs set to that."""
+    for job in jobs:
+        n = copies.get(fingerprint_store.job_key(job))
+        if n:
+            job['num_jobs'] = n
+            yield job
+
+def _record_when_done(fingerprints: dict, job: dict, prompts: int):
+    """Tracker callback: records the job's fingerprint once all of its prompts finished done."""
+    remaining = [prompts]
+    lock = threading.Lock()
+
+    def finished(state):
+        if state.status != completion_tracker.DONE:
+            return
+        with lock:
+            remaining[0] -= 1
+            done = remaining[0] == 0
+        if done:
+            fingerprint_store.record_success(fingerprints, job)
+    return finished
+
+def _put(out_queue, item, stop) -> bool:
+    """Blocking put that gives up once the consumer has stopped."""
+    while not stop.is_set():
         try:
+            out_queue.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _build_payloads(jobs, out_queue, stop, deterministic=False):
+    """
+    Producer thread: plans jobs and builds their payloads into the bounded queue.
+    Items are (job, payload, server, error); job=None carries a planning error, None ends the stream.
+    """
+    try:
+        for job in jobs:
             base_path = jobtype_to_json.get(job['jt'])
             if not base_path:
                 print(f"Skipping {job['jt']}: no base workflow")
                 continue
-
-            payload, target_server = load_and_modify_workflow(base_path, job, job['seed_start'])
-
-            queued_ids = queue_workflow_via_api(
-                server_url = target_server,
-                payload = payload,
-                num_jobs = job['num_jobs']
-            )
-
-            all_results.append({
+            try:
+                payload, target_server = load_and_modify_workflow(base_path, job, job['seed_start'], deterministic)
+                item = (job, payload, target_server, None)
+            except Exception as e:
+                item = (job, None, None, e)
+            if not _put(out_queue, item, stop):
+                return
+    except Exception as e:
+        _put(out_queue, (None, None, None, e), stop)
+    finally:
+        _put(out_queue, None, stop)
+
+def _write_plan(pending, plan_file, all_results):
+    """Plan mode consumer: one JSONL line per job (where it would go and its exact payload), nothing posted."""
+    while True:
+        item = pending.get()
+        if item is None:
+            break
+        job, payload, target_server, error = item
+        if job is None:
+            raise error
+        if error is not None:
+            print(f"Error planning {job['jt']}: {error}")
+            all_results.append({'job': job, 'success': False, 'error': str(error)})
+            continue
+        meta = {'key': fingerprint_store.job_key(job), 'jobtype': job['jt'], 'host': target_server,
+                'num_jobs': job['num_jobs'], 'seed': job['seed_start'], 'model': job.get('model_key'),
+                'priority': job.get('priority', 0)}
+        body = workflow_templates.encode_payload(payload)
+        plan_file.write(json.dumps(meta)[:-1].encode('utf-8') + b', "payload": ' + body + b'}\n')
+        all_results.append({
+            'job': job,
+            'prompt_ids': [],
+            'hosts': [target_server] * job['num_jobs'],
+            'server': target_server,
+            'success': True
+        })
+
+async def _submit_all(pending, all_results, fingerprints, max_per_host, tracker=None, ledger=None,
+                      on_finished=None):
+    """
+    Drain the payload queue, posting to all hosts at once with at most max_per_host posts in
+    flight per host. all_results keeps job order, whatever order the posts finish in.
+    With a tracker (completion_tracker.py) every queued prompt is followed until it finishes
+    (on_finished(state) is then called); with a ledger (job_ledger.py) every post is recorded.
+    """
+    loop = asyncio.get_running_loop()
+    host_slots = {}
+    max_inflight = max(1, max_per_host) * SUBMIT_QUEUE_SIZE
+    inflight = asyncio.Semaphore(max_inflight)
+    tasks = set()
+
+    def slots_for(host):
+        slots = host_slots.get(host)
+        if slots is None:
+            weight = scheduler.weight(host) if scheduler is not None else 1
+            slots = host_slots[host] = asyncio.Semaphore(max(1, max_per_host) * weight)
+        return slots
+
+    async def submit(slot, job, payload, target_server):
+        try:
+            client_id = tracker.client_id if tracker is not None else None
+            body = workflow_templates.encode_payload(payload)
+            posted = await queue_workflow_async(target_server, body, job['num_jobs'], slots_for,
+                                                post_executor, job['jt'], job.get('model_key'), client_id)
+            queued_ids = [prompt_id for prompt_id, _ in posted]
+            hosts = [host for _, host in posted]
+            if ledger is not None:
+                body_hash = job_ledger.payload_hash(body)
+                for copy, (prompt_id, host) in enumerate(posted):
+                    ledger.record_submit(job, prompt_id, host, client_id, body_hash, copy)
+                for copy in range(len(posted), job['num_jobs']):
+                    ledger.record_submit(job, None, target_server, client_id, body_hash, copy)
+
+            all_results[slot] = {
                 'job': job,
                 'prompt_ids': queued_ids,
+                'hosts': hosts,  # host of each prompt id, differs from server after a failover
                 'server': target_server,
                 'success': len(queued_ids) > 0
-            })
+            }
 
+            where = ", ".join(sorted(set(hosts))) or target_server
             print(f"{job['jt']} {job['project']}/{job['sequence']}/{job['shot_id']}/{job['subshot_id']} → "
-                  f"{len(queued_ids)} jobs queued on {target_server}")
+                  f"{len(queued_ids)} jobs queued on {where}")
+            if tracker is not None:
+                callbacks = [on_finished]
+                if fingerprints is not None and len(posted) == job['num_jobs']:
+                    callbacks.append(_record_when_done(fingerprints, job, len(posted)))
+                for prompt_id, host in posted:
+                    for callback in callbacks:
+                        tracker.track(host, prompt_id, info=job, callback=callback)
         except Exception as e:
             print(f"Error queuing {job['jt']}: {e}")
-            all_results.append({
+            all_results[slot] = {
                 'job': job,
                 'success': False,
                 'error': str(e)
-            })
+            }
+        finally:
+            inflight.release()
+
+    get_executor = ThreadPoolExecutor(max_workers=1)
+    post_executor = ThreadPoolExecutor(max_workers=max_inflight)
+    try:
+        while True:
+            await inflight.acquire()
+            item = await loop.run_in_executor(get_executor, pending.get)
+            if item is None:
+                break
+            job, payload, target_server, error = item
+            if job is None:
+                raise error
+            slot = len(all_results)
+            all_results.append(None)
+            if error is not None:
+                print(f"Error queuing {job['jt']}: {error}")
+                if ledger is not None:
+                    ledger.record_submit(job, None, None, error=str(error))
+                all_results[slot] = {
+                    'job': job,
+                    'success': False,
+                    'error': str(error)
+                }
+                inflight.release()
+                continue
+            task = asyncio.create_task(submit(slot, job, payload, target_server))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        get_executor.shutdown(wait=False)
+        post_executor.shutdown(wait=True)
+
+def run_storytools_execution(config, allowed_jobtypes=None, target_project=None, target_sequence=None, target_shot=None,
+                             stream: bool = True, max_pending: int = SUBMIT_QUEUE_SIZE,
+                             fingerprints: dict = None, dirty_only: bool = False,
+                             max_per_host: int = HOST_CONCURRENCY, deterministic: bool = None,
+                             tracker=None, ledger=None, only_jobs: dict = None, plan_path: str = None,
+                             rebalance: bool = None):
+    """
+    Plan, build and queue jobs. With stream=True jobs come from iter_jobs and a producer thread
+    builds payloads at most max_pending ahead of submission, so the first prompt is posted right
+    away and memory does not grow with the project. stream=False plans everything up front.
+    fingerprints (see fingerprint_store.py) gets every job whose prompts the tracker saw finish
+    done (nothing without a tracker); with dirty_only jobs whose fingerprint matches the stored
+    one are skipped.
+    Posts go to all hosts in parallel, at most max_per_host times the host's weight at a time
+    per host. Hosts are health-probed first; posts a host fails are resubmitted to another host
+    of the family.
+    deterministic (None: DETERMINISTIC in the globals) drops the timestamp cache buster, so
+    ComfyUI can reuse cached node outputs, and orders jobs with cache_friendly.
+    tracker (completion_tracker.CompletionTracker) gets every queued prompt; posts use its
+    client id so the hosts send it their execution events.
+    ledger (job_ledger.JobLedger) records every post as one run; with a tracker too, start /
+    finish times and outcomes are written as they come in.
+    only_jobs (job key -> copies) limits the run to those jobs, e.g. what resume_run found lost.
+    plan_path: dry run - hosts are picked and payloads built as usual, but written to that JSONL
+    file instead of posted; prints per-host GPU-seconds from the ledger's past render times.
+    With *_MAX_INFLIGHT limits in the globals jobs go through a local backlog (module global
+    backlog, can be reprioritised meanwhile) and are only handed to a host that is below its
+    limit; finished prompts (followed by the tracker, a private one if none is given) free room.
+    This call then returns once the last job is posted, i.e. when the farm is nearly done, so GUI
+    callers run it on a worker thread (gui_utils/run_manager.py).
+    Without limits jobs pass through the backlog too, so higher PRIORITY classes are submitted
+    first and equal ones in submission order. The backlog pulls jobs lazily, a window ahead of
+    the hosts.
+    rebalance (None: REBALANCE in the globals) moves tracked, still queued prompts from busy to
+    idle hosts while this call runs (see start_rebalancer).
+    """
+    global backlog
+    globals_data = config['globals']
+    if deterministic is None:
+        deterministic = str(globals_data.get('DETERMINISTIC', '0')).strip().lower() in ('1', 'true', 'yes', 'on')
+    init_host_queues(globals_data)
+    planning = plan_path is not None
+    limited = scheduler.limited and not planning
+    own_tracker = False
+    if planning:
+        tracker = None
+    else:
+        scheduler.probe_all()
+    if limited and tracker is None:
+        tracker = completion_tracker.CompletionTracker()  # completions free in-flight room
+        own_tracker = True
+    if tracker is not None:
+        for hosts in scheduler.families.values():
+            for host in hosts:
+                tracker.watch(host)  # listening before the first post, so no event is missed
+    if ledger is not None and not planning:
+        if ledger.run_id is None:
+            ledger.start_run(note="deterministic" if deterministic else "")
+        if tracker is not None:
+            tracker.add_listener(ledger.record_state)
+    if stream:
+        jobs = iter_jobs(config, allowed_jobtypes, target_project, target_sequence, target_shot)
+    else:
+        jobs = collect_jobs(config, allowed_jobtypes, target_project, target_sequence, target_shot)
+    if dirty_only:
+        jobs = fingerprint_store.filter_dirty(jobs, fingerprints if fingerprints is not None else {})
+    if only_jobs is not None:
+        jobs = select_jobs(jobs, only_jobs)
+    if deterministic:
+        print("Deterministic mode: no cache buster, cache-friendly job order, explicit seeds")
+        jobs = cache_friendly(jobs)
+
+    pending = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+    # filled lazily, job_backlog.FILL_WINDOW jobs ahead of the hosts, so the first post is not held up
+    backlog = job_backlog.Backlog(jobs)
+    if limited:
+        print(f"Backlog: up to {backlog.window} jobs held locally, fed to hosts as their prompts finish")
+        jobs = backlog.drain(lambda job: scheduler.has_room(job['jt'], job['num_jobs']), stop)
+    else:
+        jobs = backlog.drain(lambda job: True, stop)
+    if limited:
+        run_scheduler, run_backlog = scheduler, backlog
+
+        def on_finished(state):
+            run_scheduler.release(state.host)
+            run_backlog.wake()
+    else:
+        on_finished = None
+    producer = threading.Thread(target=_build_payloads, args=(jobs, pending, stop, deterministic), daemon=True)
+    producer.start()
+
+    all_results = []
+    started = time.perf_counter()
+    rebalancer = None if planning else start_rebalancer(globals_data, tracker, ledger, rebalance)
+    try:
+        if planning:
+            with open(plan_path, 'wb') as plan_file:
+                _write_plan(pending, plan_file, all_results)
+        else:
+            asyncio.run(_submit_all(pending, all_results, fingerprints, max_per_host, tracker, ledger, on_finished))
+    finally:
+        if ledger is not None and not planning:
+            ledger.flush()
+        stop.set()
+        producer.join()
+        try:
+            pending.put_nowait(None)  # unblock the submitter's queue reader if it is still waiting
+        except queue.Full:
+            pass
+        stop_rebalancer(rebalancer)
+        if own_tracker:
+            tracker.close()
+
+    if not all_results:
+        print("No jobs to queue.")
+        return []
+
+    if planning:
+        planned = sum(1 for r in all_results if r.get('success'))
+        print(f"Planned {planned} jobs in {time.perf_counter() - started:.2f}s (payload building only) → {plan_path}")
+        print(format_plan(all_results, ledger.mean_durations() if ledger is not None else {}))
+        print(format_model_reloads(all_results))
+        return all_results
 
     total_queued = sum(len(r['prompt_ids']) for r in all_results if r.get('success'))
     print(f"Total queued: {total_queued} across {len(all_results)} job groups")
+    print(http_pool.format_pool_stats())
+    print(format_host_stats())
+    print(format_host_health())
+    print(format_model_reloads(all_results))
     return all_results
 
-def run_all(config_path=None, allowed_jobtypes=None, only_sequence=None):
+def run_all(config_path=None, allowed_jobtypes=None, only_sequence=None, dirty_only=False, deterministic=None,
+            wait: float = None, only_jobs: dict = None, note: str = "", plan: str = None,
+            rebalance: bool = None):
+    """
+    wait: seconds to follow the queued prompts until they finish (0 = no limit, None = don't wait).
+    only_jobs / note: see resume_run. plan: JSONL path for a dry run (see run_storytools_execution).
+    rebalance: work stealing while submitting and waiting (None: REBALANCE in the globals).
+    """
     if config_path is None:
         default = os.path.join(os.path.dirname(__file__), '..', 'configs', 'story_template.txt')
         config_path = default if os.path.exists(default) else None
     if not config_path:
         raise FileNotFoundError("No config path provided and no default found.")
 
-    config = parser.parse_config(config_path)
+    config = config_cache.load_config(config_path)
     project = config['globals']['PROJECT']
     seq_info = f" (sequence: {only_sequence})" if only_sequence else ""
-    print(f"Running all shots — project: {project}{seq_info}")
+    dirty_info = " — changed shots only" if dirty_only else ""
+    print(f"Running all shots — project: {project}{seq_info}{dirty_info}")
 
-    full_results = run_storytools_execution(
-        config=config,
-        allowed_jobtypes=allowed_jobtypes,
-        target_project=project,
-        target_sequence=only_sequence,
-    )
+    fingerprints = fingerprint_store.load_fingerprints(config_path)
+    ledger = job_ledger.JobLedger.for_config(config_path)
+    if plan is not None:
+        try:
+            return run_storytools_execution(config=config, allowed_jobtypes=allowed_jobtypes,
+                                            target_project=project, target_sequence=only_sequence,
+                                            fingerprints=fingerprints, dirty_only=dirty_only,
+                                            deterministic=deterministic, ledger=ledger, plan_path=plan)
+        finally:
+            ledger.close()
+    tracker = completion_tracker.CompletionTracker() if wait is not None else None
+    ledger.start_run(config_path, note=note or ("deterministic" if deterministic else ""))
+    try:
+        full_results = run_storytools_execution(
+            config=config,
+            allowed_jobtypes=allowed_jobtypes,
+            target_project=project,
+            target_sequence=only_sequence,
+            fingerprints=fingerprints,
+            dirty_only=dirty_only,
+            deterministic=deterministic,
+            tracker=tracker,
+            ledger=ledger,
+            only_jobs=only_jobs,
+            rebalance=rebalance,
+        )
+    finally:
+        fingerprint_store.save_fingerprints(config_path, fingerprints)
+        ledger.flush()
+
+    if tracker is not None:
+        print(f"Waiting for {len(tracker.states())} prompts ({tracker.mode()})...")
+        rebalancer = start_rebalancer(config['globals'], tracker, ledger, rebalance)
+        try:
+            tracker.wait(timeout=wait or None)
+        finally:
+            stop_rebalancer(rebalancer)
+            fingerprint_store.save_fingerprints(config_path, fingerprints)  # jobs that finished meanwhile
+        tracker.close()
+        print(format_completion(tracker))
+    elif dirty_only:
+        print("[fingerprints] Not updated: shots are only recorded once followed to completion (--wait)")
+    ledger.finish_run()
+    print(job_ledger.format_summary(ledger))
+    ledger.close()
 
     print(f"\n=== SUMMARY: {len(full_results)} executions "
           f"({sum(1 for r in full_results if r.get('success'))} successful) ===")
     return full_results
 
+def fetch_history_entry(host: str, prompt_id: str):
+    """/history/<id> entry of one prompt ({} if the host does not know it), None if the host did not answer."""
+    try:
+        resp = http_pool.get(f"{host}/history/{prompt_id}", timeout=RESUME_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json().get(prompt_id) or {}
+    except Exception:
+        return None
+
+def _history_status(entry: dict) -> str:
+    status = entry.get('status') or {}
+    failed = status.get('status_str') == 'error' or any(
+        kind in ('execution_error', 'execution_interrupted') for kind, _ in status.get('messages') or [])
+    return completion_tracker.ERROR if failed else completion_tracker.DONE
+
+def _lookup_prompts(pairs) -> dict:
+    """
+    (host, prompt_id) -> (state, /history entry or None) for each pair: queued / running from one
+    /queue read per host, done / error from /history/<id> (the full /history is capped by
+    ComfyUI's max_history), None if the host no longer knows it, UNREACHABLE if it did not answer.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    hosts = sorted({host for host, _ in pairs})
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(hosts)))) as pool:
+        queues = dict(zip(hosts, pool.map(work_stealing.fetch_queue, hosts)))
+    for host, q in queues.items():
+        if q is None:
+            print(f"Resume: {host} unreachable")
+    found, ask = {}, []
+    for host, prompt_id in pairs:
+        q = queues[host]
+        if q is None:
+            found[(host, prompt_id)] = (job_ledger.UNREACHABLE, None)
+        elif prompt_id in q[0]:
+            found[(host, prompt_id)] = (completion_tracker.RUNNING, None)
+        elif any(item[1] == prompt_id for item in q[1]):
+            found[(host, prompt_id)] = (completion_tracker.QUEUED, None)
+        else:
+            ask.append((host, prompt_id))
+    with ThreadPoolExecutor(max_workers=max(1, min(16, len(ask)))) as pool:
+        entries = pool.map(lambda pair: fetch_history_entry(*pair), ask)
+        for pair, entry in zip(ask, entries):
+            if entry is None:
+                found[pair] = (job_ledger.UNREACHABLE, None)
+            else:
+                found[pair] = (_history_status(entry) if entry else None, entry)
+    return found
+
+# a job with renders in several states: wait while any is still working, resubmit if any failed or got lost
+_RENDER_ORDER = (job_ledger.UNREACHABLE, completion_tracker.RUNNING, completion_tracker.QUEUED,
+                 completion_tracker.ERROR, job_ledger.LOST, completion_tracker.DONE)
+
+def reconcile_run(rows, render_rows: dict = None) -> list:
+    """
+    [(ledger row, state)] for the prompts of a run: queued / running (in the host's /queue),
+    error (failed per its host, or per the ledger once the host forgot it), lost (posted but
+    unknown to its host, or never posted), unreachable (host did not answer) or done. A trigger
+    prompt that finished is only done when every render it queued (listed in its /history
+    outputs or in render_rows, parent prompt id -> ledger rows) is done; a render that failed or
+    got lost makes its prompt error / lost, so resume queues the job again.
+    Also returns the states found for the renders: [(render row or None, prompt id, state)].
+    """
+    render_rows = render_rows or {}
+    skip = (job_ledger.RESUBMITTED,)
+    asked = [(r['host'], r['prompt_id']) for r in rows if r['prompt_id'] and r['host'] and r['outcome'] not in skip]
+    found = _lookup_prompts(asked)
+
+    # renders of every trigger prompt that finished, from its /history outputs and the ledger
+    renders = {}
+    for row in rows:
+        state, entry = found.get((row['host'], row['prompt_id']), (None, None))
+        if state != completion_tracker.DONE and not (state is None and row['outcome'] == completion_tracker.DONE):
+            continue
+        host = row['host']  # posted host URL
+        listed = {r['prompt_id']: (r['host'], r) for r in render_rows.get(row['prompt_id'], ())}
+        from_history = completion_tracker.queued_renders((entry or {}).get('outputs') or {})
+        for prompt_id, render_host in (from_history[0] if from_history else ()):
+            listed.setdefault(prompt_id, (completion_tracker.render_host(host, render_host), None))
+        renders[row['prompt_id']] = [(prompt_id, h, r) for prompt_id, (h, r) in listed.items()]
+    found_renders = _lookup_prompts((h, p) for items in renders.values() for p, h, _ in items)
+
+    states, render_states = [], []
+    for row in rows:
+        if row['outcome'] in skip:
+            states.append((row, row['outcome']))
+            continue
+        if not row['prompt_id']:
+            states.append((row, job_ledger.LOST))
+            continue
+        state, _ = found[(row['host'], row['prompt_id'])]
+        if state is None:
+            # the host forgot it (restart, or out of its history): the ledger's outcome, else lost
+            state = row['outcome'] if row['outcome'] in completion_tracker.FINISHED else job_ledger.LOST
+        if state == completion_tracker.DONE and renders.get(row['prompt_id']):
+            seen = []
+            for prompt_id, host, render_row in renders[row['prompt_id']]:
+                render_state, _ = found_renders[(host, prompt_id)]
+                if render_state is None:
+                    finished = render_row is not None and render_row['outcome'] in completion_tracker.FINISHED
+                    render_state = render_row['outcome'] if finished else job_ledger.LOST
+                render_states.append((render_row, prompt_id, render_state))
+                seen.append(render_state)
+            state = min(seen, key=_RENDER_ORDER.index)
+        states.append((row, state))
+    return states, render_states
+
+def resume_run(config_path, run_id: int = None, wait: float = None):
+    """
+    After a crash: classify every prompt of the last (or given) ledger run and the renders it
+    queued against the hosts (reconcile_run) and queue only the jobs with lost or failed prompts or
+    renders again, as a new ledger run (their old rows are marked resubmitted). Prompts on
+    unreachable hosts are left alone - they may still be rendering.
+    """
+    ledger = job_ledger.JobLedger.for_config(config_path)
+    try:
+        run_id = run_id if run_id is not None else ledger.last_run_id()
+        rows = ledger.prompts(run_id) if run_id is not None else []
+        if not rows:
+            print(f"Resume: no prompts recorded for {config_path}")
+            return []
+        states, render_states = reconcile_run(rows, ledger.renders(run_id))
+        counts = {}
+        copies = {}
+        resubmit = []
+        for row, state in states:
+            counts[state] = counts.get(state, 0) + 1
+            if row['prompt_id'] and state not in (job_ledger.UNREACHABLE, job_ledger.RESUBMITTED):
+                ledger.record_outcome(row['prompt_id'], state)
+            if state in (job_ledger.LOST, completion_tracker.ERROR):
+                copies[row['job_key']] = copies.get(row['job_key'], 0) + 1
+                resubmit.append(row['id'])
+        render_counts = {}
+        for render_row, prompt_id, state in render_states:
+            render_counts[state] = render_counts.get(state, 0) + 1
+            if render_row is not None and state != job_ledger.UNREACHABLE:
+                ledger.record_outcome(prompt_id, state)
+        print(f"Resume run {run_id}: " + ", ".join(f"{n} {state}" for state, n in sorted(counts.items())))
+        if render_counts:
+            print("  renders: " + ", ".join(f"{n} {state}" for state, n in sorted(render_counts.items())))
+        ledger.mark_resubmitted(resubmit)
+    finally:
+        ledger.close()
+    if not copies:
+        print("Nothing to resubmit.")
+        return []
+    print(f"Resubmitting {sum(copies.values())} prompts of {len(copies)} jobs")
+    return run_all(config_path, wait=wait, only_jobs=copies, note=f"resume of run {run_id}")
+
 if __name__ == "__main__":
-    config_path = sys.argv[1] if len(sys.argv) > 1 else None
-    run_all(config_path)
\ No newline at end of file
+    import argparse
+    ap = argparse.ArgumentParser(description="Queue story shots on ComfyUI hosts")
+    ap.add_argument('config_path', nargs='?', default=None, help="story config (default: configs/story_template.txt)")
+    ap.add_argument('--jobtype', action='append', dest='jobtypes', help="only this jobtype (repeatable)")
+    ap.add_argument('--sequence', default=None, help="only this sequence")
+    ap.add_argument('--dirty', action='store_true',
+                    help="only queue shots whose inputs changed since their last successful run "
+                         "(runs are recorded with --wait or from the GUI)")
+    ap.add_argument('--deterministic', action='store_true', default=None,
+                    help="no timestamp cache buster: cache-friendly job order and explicit per-job seeds")
+    ap.add_argument('--wait', type=float, nargs='?', const=0, default=None, metavar='SECONDS',
+                    help="follow the queued prompts until they finish (optionally at most SECONDS)")
+    ap.add_argument('--resume', type=int, nargs='?', const=-1, default=None, metavar='RUN',
+                    help="resubmit the lost and failed prompts of the last (or given) ledger run")
+    ap.add_argument('--rebalance', action='store_true', default=None,
+                    help="move queued prompts from busy to idle hosts while submitting / waiting")
+    ap.add_argument('--plan', nargs='?', const='', default=None, metavar='JSONL',
+                    help="dry run: write the payloads to JSONL (default <story>.plan.jsonl) and estimate GPU time")
+    args = ap.parse_args()
+    if args.resume is not None:
+        config_path = args.config_path or os.path.join(os.path.dirname(__file__), '..', 'configs', 'story_template.txt')
+        resume_run(config_path, None if args.resume < 0 else args.resume, wait=args.wait)
+        sys.exit(0)
+    plan = args.plan
+    if plan == '':
+        plan = (args.config_path or 'story') + '.plan.jsonl'
+    run_all(args.config_path, allowed_jobtypes=args.jobtypes, only_sequence=args.sequence, dirty_only=args.dirty,
+            deterministic=args.deterministic, wait=args.wait, plan=plan, rebalance=args.rebalance)
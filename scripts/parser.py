@@ -1,151 +1,620 @@
 # config_parser.py
 # Updated: support FLUX_HOST, WAN_HOST, QWEN_HOST (comma-separated lists)
+# Updated: parsing is done per "!---------" block so story_document.py can re-parse single blocks
+# Updated: one pass also yields shot line ranges and a ShotIndex (JOBTYPE / DISABLED / STATUS_*)
+# Updated: shots are ShotRecord overlays on the shared globals instead of per-shot copies
+# Added: shot_fingerprint() - per shot and jobtype hash of the inputs that affect a render
+# Added: INCLUDE= in the globals pulls shot blocks from per-sequence files, parsed in parallel
+# Added: host capacity weights (FLUX_HOST=big:8188*4, ...) -> *_HOST_WEIGHTS
+# Added: model_fingerprint() - checkpoint / LoRA stack hash used for model-affinity routing
+# Added: PRIORITY= per shot (or global default) - shot_priority(), FRONT_PRIORITY and up jump host queues
 
-def parse_config(file_path: str) -> dict:
+import glob
+import hashlib
+import os
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+BLOCK_SEPARATOR = '!---------'
+INCLUDE_KEY = 'INCLUDE'
+HOST_WEIGHT_SEP = '*'  # FLUX_HOST=big:8188*4, small:8188 - big takes 4x the jobs
+HOST_FAMILIES = ('FLUX', 'WAN', 'LTX', 'QWEN')
+
+
+def split_blocks(lines: list[str]) -> list[tuple[int, int]]:
     """
-    Parse the configuration file into a nested structure with globals.
-    Now splits FLUX_HOST, WAN_HOST, QWEN_HOST into lists if comma-separated.
+    Split raw config lines into (start, end) spans.
+    Span 0 is the globals section; every later span starts at its separator line.
     """
-    with open(file_path, 'r') as f:
-        lines = f.readlines()
+    spans = []
+    start = 0
+    for i, line in enumerate(lines):
+        if line.strip() == BLOCK_SEPARATOR:
+            spans.append((start, i))
+            start = i
+    spans.append((start, len(lines)))
+    return spans
+
 
-    globals_dict = {}
-    current_shot = {}
+def scan_block(lines: list[str]) -> tuple[dict, int | None, str | None, str | None]:
+    """
+    Single pass over one block (globals or a single shot).
+    Returns (values, seq_offset, seq_value, range_shot): the parsed key/values plus the
+    line-range info the GUI editor uses - a range starts at the last SEQUENCE= line of the
+    block (or at the separator) and is named after the last SHOT= line after that.
+    A leading separator line is ignored, so lines[start:end] of a span can be passed as-is.
+    """
+    values = {}
     multi_line_value = ''
     current_key = None
-    in_global_section = True
-    shots_temp = []  # Temporary list to collect raw shots before nesting
-    i = 0
+    seq_offset = None
+    seq_value = None
+    range_shot = None
 
-    while i < len(lines):
-        line = lines[i]
+    for offset, line in enumerate(lines):
         stripped = line.strip()
-        i += 1
 
         if not stripped:
             if current_key is not None:
                 multi_line_value += '\n' + line.rstrip()
             continue
 
-        if stripped.startswith('#'):
-            continue
-
-        if stripped == '!---------':
-            # Finalize current key if any
-            if current_key is not None:
-                final_value = multi_line_value.strip()
-                if in_global_section:
-                    globals_dict[current_key] = final_value
-                else:
-                    current_shot[current_key] = final_value
-                multi_line_value = ''
-                current_key = None
+        if stripped.startswith("SEQUENCE="):
+            seq_offset = offset
+            seq_value = stripped[9:].strip()
+            range_shot = None
+        elif stripped.startswith("SHOT="):
+            range_shot = stripped[5:].strip()
 
-            # If in shot section, store raw shot
-            if not in_global_section and current_shot:
-                shots_temp.append(current_shot.copy())
-                current_shot = {}
-
-            in_global_section = False
+        if stripped.startswith('#') or stripped == BLOCK_SEPARATOR:
             continue
 
         # Line with possible =
         if '=' in stripped:
             # Finalize previous
             if current_key is not None:
-                final_value = multi_line_value.strip()
-                if in_global_section:
-                    globals_dict[current_key] = final_value
-                else:
-                    current_shot[current_key] = final_value
+                values[current_key] = multi_line_value.strip()
                 multi_line_value = ''
                 current_key = None
 
             parts = stripped.split('=', 1)
             key = parts[0].strip()
-            if len(parts) > 1:
-                value = parts[1].strip()
-                if value:
-                    if in_global_section:
-                        globals_dict[key] = value
-                    else:
-                        current_shot[key] = value
-                else:
-                    # Start multi-line
-                    current_key = key
-                    multi_line_value = ''
-            # else: malformed → ignore
+            value = parts[1].strip()
+            if value:
+                values[key] = value
+            else:
+                # Start multi-line
+                current_key = key
+                multi_line_value = ''
 
         else:
             # Continuation line
             if current_key is not None:
                 multi_line_value += '\n' + line.rstrip()
-            elif stripped:
-                if in_global_section:
-                    if 'SYNOPSIS' not in globals_dict:
-                        globals_dict['SYNOPSIS'] = stripped
-                    else:
-                        globals_dict['SYNOPSIS'] += '\n' + stripped
-                else:
-                    if 'SYNOPSIS' not in current_shot:
-                        current_shot['SYNOPSIS'] = stripped
-                    else:
-                        current_shot['SYNOPSIS'] += '\n' + stripped
+            elif 'SYNOPSIS' not in values:
+                values['SYNOPSIS'] = stripped
+            else:
+                values['SYNOPSIS'] += '\n' + stripped
 
     # Finalize last multi-line if open
     if current_key is not None:
-        final_value = multi_line_value.strip()
-        if in_global_section:
-            globals_dict[current_key] = final_value
-        else:
-            current_shot[current_key] = final_value
+        values[current_key] = multi_line_value.strip()
 
-    if not in_global_section and current_shot:
-        shots_temp.append(current_shot.copy())
+    return values, seq_offset, seq_value, range_shot
 
-    # Build nested structure
-    project_name = globals_dict.get('PROJECT', 'default').strip()
-    config = {'globals': globals_dict}
-    config[project_name] = {}
 
-    for shot in shots_temp:
-        sequence   = shot.get('SEQUENCE', 'unknown')
-        shot_id    = shot.get('SHOT',     'unknown')
-        subshot_id = shot.get('NAME',     'unnamed')
+def parse_block(lines: list[str]) -> dict:
+    """Parse the key/value lines of one block (globals or a single shot)."""
+    return scan_block(lines)[0]
 
-        merged_shot = globals_dict.copy()
-        merged_shot.update(shot)
 
-        if sequence not in config[project_name]:
-            config[project_name][sequence] = {}
-        if shot_id not in config[project_name][sequence]:
-            config[project_name][sequence][shot_id] = {}
+def shot_key(shot: dict) -> tuple[str, str, str]:
+    """(sequence, shot, name) address of a parsed shot block inside config[project]."""
+    return (
+        shot.get('SEQUENCE', 'unknown'),
+        shot.get('SHOT', 'unknown'),
+        shot.get('NAME', 'unnamed'),
+    )
 
-        config[project_name][sequence][shot_id][subshot_id] = merged_shot
 
-    # ────────────────────────────────────────────────
-    # Split host lists in globals
-    # ────────────────────────────────────────────────
-    def split_hosts(s: str) -> list[str]:
-        if not s:
-            return []
-        return [h.strip() for h in s.split(',') if h.strip()]
-
-    g = config['globals']
-    g['FLUX_HOSTS']  = split_hosts(g.get('FLUX_HOST', ''))
-    g['WAN_HOSTS']   = split_hosts(g.get('WAN_HOST',  ''))
-    g['LTX_HOSTS']   = split_hosts(g.get('LTX_HOST',  ''))
-    g['QWEN_HOSTS']  = split_hosts(g.get('QWEN_HOST', ''))
+def parse_host_entry(entry: str) -> tuple[str, int]:
+    """'host:8188*4' -> ('host:8188', 4). No or a bad weight counts as 1."""
+    host, sep, weight = entry.partition(HOST_WEIGHT_SEP)
+    host = host.strip()
+    if not sep:
+        return host, 1
+    try:
+        return host, max(1, int(weight.strip()))
+    except ValueError:
+        print(f"⚠️ Bad host weight '{entry.strip()}' - using 1")
+        return host, 1
+
+
+def split_hosts(s: str) -> list[str]:
+    """Host list of a *_HOST value, capacity weights stripped."""
+    if not s:
+        return []
+    hosts = [parse_host_entry(h)[0] for h in s.split(',') if h.strip()]
+    return [h for h in hosts if h]
+
+
+def host_weights(s: str) -> dict[str, int]:
+    """Capacity weight per host of a *_HOST value; a host listed twice gets both weights."""
+    weights = {}
+    for entry in (s or '').split(','):
+        if not entry.strip():
+            continue
+        host, weight = parse_host_entry(entry)
+        if host:
+            weights[host] = weights.get(host, 0) + weight
+    return weights
+
+
+def finalize_globals(g: dict, verbose: bool = True) -> dict:
+    """Add the parser-derived host lists and host weights to a parsed globals dict (in place)."""
+    for family in HOST_FAMILIES:
+        g[f'{family}_HOSTS'] = split_hosts(g.get(f'{family}_HOST', ''))
+        g[f'{family}_HOST_WEIGHTS'] = host_weights(g.get(f'{family}_HOST', ''))
     g['QWEN_MODE']   = g.get('QWEN_MODE', '5angles')
     # Keep old HOST as ultimate fallback
     g['FALLBACK_HOST'] = g.get('HOST', '127.0.0.1:8188')
 
-    # Debug print
-    print("Global hosts parsed:")
-    print(f"  FLUX_HOSTS   = {g['FLUX_HOSTS']}")
-    print(f"  WAN_HOSTS    = {g['WAN_HOSTS']}")
-    print(f"  LTX_HOSTS    = {g['LTX_HOSTS']}")
-    print(f"  QWEN_HOSTS   = {g['QWEN_HOSTS']}")
-    print(f"  fallback     = {g['FALLBACK_HOST']}")
+    if verbose:
+        print("Global hosts parsed:")
+        print(f"  FLUX_HOSTS   = {g['FLUX_HOSTS']}")
+        print(f"  WAN_HOSTS    = {g['WAN_HOSTS']}")
+        print(f"  LTX_HOSTS    = {g['LTX_HOSTS']}")
+        print(f"  QWEN_HOSTS   = {g['QWEN_HOSTS']}")
+        for family in HOST_FAMILIES:
+            weighted = {h: w for h, w in g[f'{family}_HOST_WEIGHTS'].items() if w > 1}
+            if weighted:
+                print(f"  {family}_HOST weights = {weighted}")
+        print(f"  fallback     = {g['FALLBACK_HOST']}")
+    return g
+
+
+DISABLED_VALUES = ('1', 'yes', 'true', 'on', 'disabled')
+
+
+def status_key_for(jobtype: str) -> str:
+    """STATUS_<JOBTYPE> key the GUI writes for a jobtype, e.g. ct_flux_t2i -> STATUS_CTFLUXT2I."""
+    return f"STATUS_{jobtype.upper().replace('_', '')}"
+
+
+@lru_cache(maxsize=256)
+def split_jobtypes(jobtype_str: str) -> tuple[str, ...]:
+    return tuple(j.strip() for j in jobtype_str.split(',') if j.strip())
+
+
+def jobtypes_of(shot_data) -> tuple[str, ...]:
+    jobtype_str = shot_data.get('JOBTYPE') or shot_data.get('IMAGE_JOBTYPE') or shot_data.get('VIDEO_JOBTYPE')
+    if not jobtype_str:
+        return ()
+    return split_jobtypes(jobtype_str)
+
+
+def is_disabled(shot_data) -> bool:
+    return shot_data.get('DISABLED', '0').strip().lower() in DISABLED_VALUES
+
+
+PRIORITY_KEY = 'PRIORITY'
+PRIORITY_CLASSES = {'background': -1, 'low': -1, 'normal': 0, 'high': 1, 'hero': 2}
+FRONT_PRIORITY = PRIORITY_CLASSES['high']  # and up: submitted with ComfyUI's front flag
+
+
+@lru_cache(maxsize=64)
+def parse_priority(value: str) -> int:
+    """PRIORITY value: a class name (background / low / normal / high / hero) or a number, higher first."""
+    value = value.strip().lower()
+    if not value:
+        return 0
+    if value in PRIORITY_CLASSES:
+        return PRIORITY_CLASSES[value]
+    try:
+        return int(value)
+    except ValueError:
+        print(f"Warning: unknown PRIORITY {value!r}, using normal")
+        return 0
+
+
+def shot_priority(shot_data) -> int:
+    return parse_priority(str(shot_data.get(PRIORITY_KEY, '') or ''))
+
+
+def status_values(values: dict) -> dict:
+    return {
+        k: v.strip().lower()
+        for k, v in values.items()
+        if k.startswith('STATUS_') and isinstance(v, str)
+    }
+
+
+# Inputs that change what a job renders; the fingerprint of a shot covers exactly these
+FINGERPRINT_KEYS = (
+    'IMG_PROMPT', 'ENVIRONMENT_PROMPT', 'ACTION_PROMPT', 'CAMERA_PROMPT', 'AUDIO_PROMPT',
+    'GRAPHICAL_STYLE', 'NEGATIVE_PROMPT', 'WIDTH', 'HEIGHT', 'SEED_START',
+)
+FINGERPRINT_KEYS_BY_FAMILY = {
+    'flux': tuple(f"FLUX_LORA{i}{suffix}" for i in range(1, 9) for suffix in ('', '_STRENGTH'))
+            + ('FLUX_ITERATIONS', 'FLUX_CFG', 'FLUX_DENOISE', 'FLUX_CHECKPOINT'),
+    'wan':  ('WAN_STEPS', 'WAN_CFG'),
+    'ltx':  ('LTX_CHECKPOINT', 'LTX_FPS', 'LTX_VIDEO_LENGTH'),
+    'qwen': ('QWEN_CAMERATRANSFORMATION_MODE', 'GENERATE_QWEN_ANGLES', 'QWEN_MODE'),
+}
+
+
+def fingerprint_keys(jobtype: str) -> tuple[str, ...]:
+    jt_lower = jobtype.lower()
+    for family, keys in FINGERPRINT_KEYS_BY_FAMILY.items():
+        if family in jt_lower:
+            return FINGERPRINT_KEYS + keys
+    return FINGERPRINT_KEYS
+
+
+def shot_fingerprint(shot_data, jobtype: str) -> str:
+    """
+    Stable hash of the effective inputs of one shot for one jobtype (shot values over globals).
+    Unset and empty keys hash the same, so adding an empty KEY= line does not mark a shot dirty.
+    """
+    h = hashlib.sha1(jobtype.encode('utf-8'))
+    for key in fingerprint_keys(jobtype):
+        value = shot_data.get(key) or ''
+        value = value.strip() if isinstance(value, str) else str(value)
+        if value:
+            h.update(f"\0{key}={value}".encode('utf-8'))
+    return h.hexdigest()
+
+
+# Inputs that decide which models a host has to load (checkpoint, LoRA stack). Jobs with the same
+# model fingerprint can run back to back on one host without a reload.
+MODEL_KEYS_BY_FAMILY = {
+    'flux': ('FLUX_CHECKPOINT',) + tuple(f"FLUX_LORA{i}{suffix}" for i in range(1, 9) for suffix in ('', '_STRENGTH')),
+    'ltx':  ('LTX_CHECKPOINT',),
+}
+
+
+def model_fingerprint(shot_data, jobtype: str):
+    """Short hash of the model inputs of one shot for one jobtype; None if the family has none."""
+    jt_lower = jobtype.lower()
+    for family, keys in MODEL_KEYS_BY_FAMILY.items():
+        if family in jt_lower:
+            break
+    else:
+        return None
+    h = hashlib.sha1(family.encode('utf-8'))
+    for key in keys:
+        value = shot_data.get(key) or ''
+        value = value.strip() if isinstance(value, str) else str(value)
+        if value:
+            h.update(f"\0{key}={value}".encode('utf-8'))
+    return h.hexdigest()[:12]
+
+
+class ShotFlags:
+    """Values decoded once per subshot at parse time so nobody has to re-scan its text."""
+    __slots__ = ('jobtypes', 'disabled', 'statuses')
+
+    def __init__(self, shot_data, statuses: dict):
+        self.jobtypes = jobtypes_of(shot_data)
+        self.disabled = is_disabled(shot_data)
+        self.statuses = statuses
+
+
+class ShotIndex:
+    """Query index over the parsed shots: by JOBTYPE, by DISABLED and by STATUS_<JOBTYPE>."""
+
+    def __init__(self):
+        self.by_jobtype = {}  # jobtype -> set of (seq, shot, name)
+        self.shots = {}       # (seq, shot) -> {name: ShotFlags}
+        self._shared = None   # globals dict the cached STATUS_* values below came from
+        self._shared_statuses = {}
+
+    def clear(self):
+        self.by_jobtype.clear()
+        self.shots.clear()
+        self._shared = None
+        self._shared_statuses = {}
+
+    def _statuses(self, shot_data) -> dict:
+        if not isinstance(shot_data, ShotRecord):
+            return status_values(shot_data)
+        # Globals are shared by every record, only scan them once
+        if shot_data.shared is not self._shared:
+            self._shared = shot_data.shared
+            self._shared_statuses = status_values(shot_data.shared)
+        local = status_values(shot_data.local)
+        if not local:
+            return self._shared_statuses
+        return {**self._shared_statuses, **local}
+
+    def add(self, key: tuple[str, str, str], shot_data) -> None:
+        self.remove(key)
+        seq, shot, name = key
+        flags = ShotFlags(shot_data, self._statuses(shot_data))
+        self.shots.setdefault((seq, shot), {})[name] = flags
+        for jt in flags.jobtypes:
+            self.by_jobtype.setdefault(jt, set()).add(key)
+
+    def remove(self, key: tuple[str, str, str]) -> None:
+        seq, shot, name = key
+        subs = self.shots.get((seq, shot))
+        if not subs or name not in subs:
+            return
+        flags = subs.pop(name)
+        if not subs:
+            del self.shots[(seq, shot)]
+        for jt in flags.jobtypes:
+            keys = self.by_jobtype.get(jt)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_jobtype[jt]
+
+    def snapshot(self) -> list:
+        """JSON-safe lists/dicts only, for config_cache.py (keys and jobtypes become lists)."""
+        shots = [
+            [seq, shot, {name: [list(f.jobtypes), f.disabled, f.statuses] for name, f in subs.items()}]
+            for (seq, shot), subs in self.shots.items()
+        ]
+        return [shots, {jt: [list(key) for key in keys] for jt, keys in self.by_jobtype.items()}]
+
+    def restore(self, snapshot: list, shared: dict) -> None:
+        shots, by_jobtype = snapshot
+        self.clear()
+        for seq, shot, subs in shots:
+            restored = self.shots[(seq, shot)] = {}
+            for name, (jobtypes, disabled, statuses) in subs.items():
+                flags = ShotFlags.__new__(ShotFlags)
+                flags.jobtypes, flags.disabled, flags.statuses = tuple(jobtypes), disabled, statuses
+                restored[name] = flags
+        self.by_jobtype = {jt: {tuple(key) for key in keys} for jt, keys in by_jobtype.items()}
+        self._shared = shared
+        self._shared_statuses = status_values(shared)
+
+    def flags(self, key: tuple[str, str, str]):
+        seq, shot, name = key
+        return self.shots.get((seq, shot), {}).get(name)
 
-    return config
\ No newline at end of file
+    def shots_for_jobtype(self, jobtype: str) -> set:
+        return self.by_jobtype.get(jobtype, set())
+
+    def jobtypes_for(self, seq: str, shot: str) -> set:
+        return {jt for f in self.shots.get((seq, shot), {}).values() for jt in f.jobtypes}
+
+    def is_disabled(self, seq: str, shot: str) -> bool:
+        return any(f.disabled for f in self.shots.get((seq, shot), {}).values())
+
+    def get_status(self, seq: str, shot: str, jobtype: str) -> str:
+        """STATUS_<JOBTYPE> of the first subshot that has one, '' if none."""
+        status_key = status_key_for(jobtype)
+        for f in self.shots.get((seq, shot), {}).values():
+            if status_key in f.statuses:
+                return f.statuses[status_key]
+        return ""
+
+
+class StoryConfig(dict):
+    """
+    The usual {'globals': ..., project: {seq: {shot: {name: shot_data}}}} dict,
+    plus what the same parse pass learned about it:
+      shot_ranges  (seq, shot) -> (start, end) line span for the GUI editor
+      index        ShotIndex of jobtypes / DISABLED / STATUS_*
+      shot_globals the raw globals the ShotRecords read through to; config['globals'] is a
+                   copy that finalize_globals adds the derived *_HOSTS etc. to
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shot_ranges = {}
+        self.index = ShotIndex()
+        self.shot_globals = {}
+
+
+class ShotRecord(Mapping):
+    """
+    Read-only shot view: shot-local values first, then the one raw globals dict shared by
+    every shot (StoryConfig.shot_globals, without the finalize_globals keys). Only the shot's own keys are stored, so memory no longer grows with
+    shots x globals. Behaves like the merged dict it replaces (.get, [], in, items, ...).
+    """
+    __slots__ = ('local', 'shared')
+
+    def __init__(self, shared: dict, local: dict):
+        self.local = local
+        self.shared = shared
+
+    def __getitem__(self, key):
+        if key in self.local:
+            return self.local[key]
+        return self.shared[key]
+
+    def get(self, key, default=None):
+        if key in self.local:
+            return self.local[key]
+        return self.shared.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.local or key in self.shared
+
+    def __iter__(self):
+        yield from self.local
+        for key in self.shared:
+            if key not in self.local:
+                yield key
+
+    def __len__(self):
+        return len(self.local) + sum(1 for key in self.shared if key not in self.local)
+
+    def copy(self) -> dict:
+        """Flattened plain-dict copy (what merge_shot used to return)."""
+        merged = dict(self.shared)
+        merged.update(self.local)
+        return merged
+
+    def __repr__(self):
+        return f"ShotRecord({self.local!r})"
+
+    def __reduce__(self):
+        return ShotRecord, (self.shared, self.local)
+
+
+def merge_shot(globals_dict: dict, shot: dict) -> ShotRecord:
+    return ShotRecord(globals_dict, shot)
+
+
+def insert_shot(project_dict: dict, key: tuple[str, str, str], shot_data) -> None:
+    sequence, shot_id, subshot_id = key
+    project_dict.setdefault(sequence, {}).setdefault(shot_id, {})[subshot_id] = shot_data
+
+
+def remove_shot(project_dict: dict, key: tuple[str, str, str]) -> None:
+    """Remove one subshot and prune the sequence/shot dicts it leaves empty."""
+    sequence, shot_id, subshot_id = key
+    shots = project_dict.get(sequence)
+    if shots is None or shot_id not in shots:
+        return
+    shots[shot_id].pop(subshot_id, None)
+    if not shots[shot_id]:
+        del shots[shot_id]
+    if not shots:
+        del project_dict[sequence]
+
+
+def fill_config(config: StoryConfig, globals_values: dict, shots) -> StoryConfig:
+    """
+    (Re)build config in place from parsed globals and (key, values) shot blocks in
+    document order. Later blocks win when two blocks share a key, like before.
+    """
+    globals_dict = dict(globals_values)
+    project_name = globals_dict.get('PROJECT', 'default').strip()
+
+    config.clear()
+    config.index.clear()
+    config['globals'] = globals_dict
+    config[project_name] = {}
+    # Shots overlay the globals as written, not the derived host lists added below
+    config.shot_globals = dict(globals_values)
+
+    winners = {}
+    for key, values in shots:
+        winners[key] = values
+    for key, values in winners.items():
+        merged = merge_shot(config.shot_globals, values)
+        insert_shot(config[project_name], key, merged)
+        config.index.add(key, merged)
+
+    # ────────────────────────────────────────────────
+    # Split host lists in globals
+    # ────────────────────────────────────────────────
+    finalize_globals(globals_dict)
+    return config
+
+
+def fill_shot_ranges(shot_ranges: dict, block_ranges) -> dict:
+    """
+    block_ranges: (start, end, seq_offset, seq_value, range_shot) per block in document order.
+    A block without SEQUENCE= belongs to the last sequence seen.
+    """
+    shot_ranges.clear()
+    current_seq = None
+    for start, end, seq_offset, seq_value, range_shot in block_ranges:
+        if seq_offset is not None:
+            current_seq = seq_value
+            start += seq_offset
+        if current_seq is not None and range_shot:
+            shot_ranges[(current_seq, range_shot)] = (start, end)
+    return shot_ranges
+
+
+def parse_lines(lines: list[str]) -> StoryConfig:
+    """
+    Parse already-read config lines in a single pass into the nested config,
+    its shot line ranges and its ShotIndex.
+    """
+    globals_values = {}
+    shots = []
+    block_ranges = []
+    for i, (start, end) in enumerate(split_blocks(lines)):
+        values, seq_offset, seq_value, range_shot = scan_block(lines[start:end])
+        block_ranges.append((start, end, seq_offset, seq_value, range_shot))
+        if i == 0:
+            globals_values = values
+        elif values:
+            shots.append((shot_key(values), values))
+
+    config = fill_config(StoryConfig(), globals_values, shots)
+    fill_shot_ranges(config.shot_ranges, block_ranges)
+    return config
+
+
+def include_paths(globals_values: dict, base_dir: str) -> list[str]:
+    """
+    Files listed by INCLUDE= (comma or line separated, globs allowed), relative to base_dir,
+    in the order given. Globs expand in sorted order.
+    """
+    paths = []
+    for item in globals_values.get(INCLUDE_KEY, '').replace('\n', ',').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        pattern = os.path.join(base_dir, item)
+        paths.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+    return paths
+
+
+def scan_shot_file(lines: list[str]) -> list[tuple[tuple[str, str, str], dict]]:
+    """
+    (key, values) shot blocks of an included file. Included files hold shot blocks only:
+    text before the first separator is a shot too if it sets SHOT=, otherwise it is ignored.
+    """
+    shots = []
+    for i, (start, end) in enumerate(split_blocks(lines)):
+        values = parse_block(lines[start:end])
+        if values and (i > 0 or 'SHOT' in values):
+            shots.append((shot_key(values), values))
+    return shots
+
+
+def read_shot_file(file_path: str) -> list[tuple[tuple[str, str, str], dict]]:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return scan_shot_file(f.readlines())
+
+
+def map_files(func, paths: list[str], max_workers: int = None) -> list:
+    """func(path) for every path, spread over worker processes when there is more than one."""
+    if len(paths) < 2:
+        return [func(p) for p in paths]
+    workers = min(len(paths), max_workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, paths))
+
+
+def merge_included(config: StoryConfig, included) -> StoryConfig:
+    """
+    Add the shots of INCLUDE= files (one (key, values) list per file, in include order)
+    to a parsed main config. A later file wins over the main file and earlier includes.
+    Shot ranges stay those of the main file.
+    """
+    project_dict = config.setdefault(config['globals'].get('PROJECT', 'default').strip(), {})
+    for shots in included:
+        for key, values in shots:
+            merged = merge_shot(config.shot_globals, values)
+            insert_shot(project_dict, key, merged)
+            config.index.add(key, merged)
+    return config
+
+
+def parse_config(file_path: str) -> StoryConfig:
+    """
+    Parse the configuration file into a nested structure with globals.
+    Now splits FLUX_HOST, WAN_HOST, QWEN_HOST into lists if comma-separated.
+    The returned dict also carries .shot_ranges and .index (see StoryConfig).
+    Files named by INCLUDE= are parsed in parallel and merged in.
+    """
+    with open(file_path, 'r') as f:
+        lines = f.readlines()
+    config = parse_lines(lines)
+    paths = include_paths(config['globals'], os.path.dirname(os.path.abspath(file_path)))
+    if paths:
+        merge_included(config, map_files(read_shot_file, paths))
+    return config
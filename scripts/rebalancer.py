@@ -0,0 +1,183 @@
+# rebalancer.py
+# Work stealing between the hosts of a job family while the launcher is still running.
+# Every REBALANCE_INTERVAL seconds each host's /queue is read; when one host is STEAL_GAP or more
+# queued prompts (per unit of weight) busier than an idle host of the same family, pending prompts
+# this launcher posted there (tracked by completion_tracker) are deleted from that queue and
+# re-posted on the idle host, last queued first. The tracker, the scheduler's in-flight counts and
+# the job ledger follow the move, so waits, limits and resume stay consistent.
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import http_pool  # root level, on sys.path via launcher
+import workflow_templates
+import completion_tracker
+import host_scheduler
+import job_ledger
+import parser
+
+REBALANCE_INTERVAL = 5.0  # seconds between queue checks
+STEAL_GAP = 2.0           # queue depth difference (per unit of weight) worth a move
+IDLE_LOAD = 1.0           # a host at or below this depth per unit of weight takes stolen prompts
+MAX_MOVES = 4             # prompts moved per family and check
+QUEUE_TIMEOUT = (1, 5)
+
+
+def fetch_queue(host: str):
+    """(running ids, pending items oldest first) of a host, None if it did not answer."""
+    try:
+        resp = http_pool.get(f"{host}/queue", timeout=QUEUE_TIMEOUT)
+        resp.raise_for_status()
+        data = resp.json()
+    except Exception:
+        return None
+    # items are [number, prompt_id, prompt, extra_data, outputs, ...]; number is the queue order
+    pending = sorted(data.get('queue_pending', []), key=lambda item: item[0])
+    return [item[1] for item in data.get('queue_running', [])], pending
+
+
+class Rebalancer:
+    def __init__(self, scheduler, tracker, ledger=None, interval: float = REBALANCE_INTERVAL):
+        self.scheduler = scheduler
+        self.tracker = tracker
+        self.ledger = ledger
+        self.interval = interval
+        self.moves = {}  # (source, target) -> prompts moved
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'Rebalancer':
+        self._thread = threading.Thread(target=self._run, daemon=True, name="rebalancer")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                print(f"[rebalancer] check failed: {e}")
+
+    def step(self) -> int:
+        """One check of every family; returns the number of prompts moved."""
+        families = {f: hosts for f, hosts in self.scheduler.families.items() if len(hosts) > 1}
+        hosts = sorted({h for hs in families.values() for h in hs if self.scheduler.healthy(h)})
+        if len(hosts) < 2:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(8, len(hosts))) as pool:
+            queues = dict(zip(hosts, pool.map(fetch_queue, hosts)))
+        depth = {h: len(q[0]) + len(q[1]) for h, q in queues.items() if q is not None}
+        moved = 0
+        for family, members in families.items():
+            moved += self._balance(family, [h for h in members if h in depth], depth, queues)
+        return moved
+
+    def _load(self, family: str, host: str, depth: dict) -> float:
+        return depth[host] / self.scheduler.weights[family].get(host, 1)
+
+    def _movable(self, family: str, host: str, pending) -> list:
+        """Our still queued prompts of the family on host, last to run first."""
+        movable = []
+        for item in reversed(pending):
+            state = self.tracker.state(item[1])
+            if state is None or state.status != completion_tracker.QUEUED or state.host != host:
+                continue
+            if state.parent is not None:
+                continue  # a render queued by a trigger node reads its inputs from that host's disk
+            job = state.info or {}
+            if 'jt' in job and host_scheduler.family_of(job['jt']) != family:
+                continue
+            movable.append((item, state))
+        return movable
+
+    def _balance(self, family: str, members: list, depth: dict, queues: dict) -> int:
+        if len(members) < 2:
+            return 0
+        moved = 0
+        candidates = {h: self._movable(family, h, queues[h][1]) for h in members}
+        while moved < MAX_MOVES:
+            source = max(members, key=lambda h: self._load(family, h, depth))
+            target = min(members, key=lambda h: self._load(family, h, depth))
+            if not candidates[source] or self._load(family, target, depth) > IDLE_LOAD \
+                    or self._load(family, source, depth) - self._load(family, target, depth) < STEAL_GAP:
+                break
+            item, state = candidates[source].pop(0)
+            if not self._move(item, state, source, target):
+                break
+            depth[source] -= 1
+            depth[target] += 1
+            moved += 1
+        return moved
+
+    def _move(self, item, state, source: str, target: str) -> bool:
+        """Delete one pending prompt from source and post it on target. False if it could not be taken."""
+        prompt_id = item[1]
+        try:
+            http_pool.post_bytes(f"{source}/queue", json.dumps({"delete": [prompt_id]}).encode('utf-8'),
+                                 timeout=QUEUE_TIMEOUT).raise_for_status()
+        except Exception as e:
+            print(f"[rebalancer] delete of {prompt_id[:8]} on {source} failed: {e}")
+            return False
+        # the prompt may have started (or finished) between the /queue read and the delete
+        after = fetch_queue(source)
+        if after is None or prompt_id in after[0] or any(p[1] == prompt_id for p in after[1]):
+            return False
+        try:
+            history = http_pool.get(f"{source}/history/{prompt_id}", timeout=QUEUE_TIMEOUT).json()
+        except Exception:
+            history = {}
+        if history.get(prompt_id):
+            return False
+
+        payload = {"prompt": item[2]}
+        if (state.info or {}).get('priority', 0) >= parser.FRONT_PRIORITY:
+            payload["front"] = True
+        body = workflow_templates.encode_payload(payload, client_id=self.tracker.client_id)
+        new_id = self._post(target, body)
+        if new_id is None:
+            # put it back where it was rather than lose it
+            new_id, target = self._post(source, body), source
+            if new_id is None:
+                print(f"[rebalancer] {prompt_id[:8]} could not be re-posted; left for --resume")
+                if self.ledger is not None:
+                    self.ledger.record_outcome(prompt_id, job_ledger.LOST)
+                # finishes its tracker state (and frees its in-flight room) instead of waiting forever
+                self.tracker.handle_event(source, {'type': 'execution_error', 'data': {
+                    'prompt_id': prompt_id, 'node_type': 'rebalancer', 'exception_message': 'lost while moving'}})
+                return False
+
+        self.tracker.move(prompt_id, target, new_id)
+        self.scheduler.transfer(source, target)
+        if self.ledger is not None:
+            self.ledger.record_move(prompt_id, new_id, target)
+        if target != source:
+            self.moves[(source, target)] = self.moves.get((source, target), 0) + 1
+            print(f"⇄ Moved {prompt_id[:8]} {source} → {target} (now {new_id[:8]})")
+        return target != source
+
+    def _post(self, host: str, body: bytes):
+        try:
+            resp = http_pool.post_bytes(f"{host}/prompt", body, timeout=QUEUE_TIMEOUT)
+        except Exception as e:
+            self.scheduler.record_result(host, False)
+            print(f"[rebalancer] post on {host} failed: {e}")
+            return None
+        self.scheduler.record_result(host, resp.status_code < 500)
+        try:
+            resp.raise_for_status()
+            return resp.json().get("prompt_id")
+        except Exception as e:
+            print(f"[rebalancer] post on {host} failed: {e}")
+            return None
+
+    def summary(self) -> str:
+        if not self.moves:
+            return "Rebalancer: no prompts moved"
+        parts = ", ".join(f"{s} → {t}: {n}" for (s, t), n in sorted(self.moves.items()))
+        return f"Rebalancer: {sum(self.moves.values())} prompts moved ({parts})"
@@ -0,0 +1,167 @@
+# story_document.py
+# In-memory story config that keeps per-block line spans and content hashes.
+# On update only the "!---------" blocks whose text changed are re-parsed, and the
+# nested config[project][seq][shot][name] structure, its shot ranges and its
+# ShotIndex are patched in place.
+
+import hashlib
+
+import parser  # config parser
+
+
+class StoryBlock:
+    """One "!---------" block: its current line span, content hash and parsed values."""
+    __slots__ = ('start', 'end', 'digest', 'values', 'key', 'seq_offset', 'seq_value', 'range_shot')
+
+    def __init__(self, start, end, digest, block_lines):
+        self.start = start
+        self.end = end
+        self.digest = digest
+        self.values, self.seq_offset, self.seq_value, self.range_shot = parser.scan_block(block_lines)
+        self.key = parser.shot_key(self.values) if self.values else None
+
+
+def _winners(blocks) -> dict:
+    """key -> the last block with that key (later blocks win, like in a full parse)."""
+    return {b.key: b for b in blocks if b.key is not None}
+
+
+def _digest(block_lines):
+    return hashlib.sha1(''.join(block_lines).encode('utf-8')).digest()
+
+
+class StoryDocument:
+    def __init__(self):
+        self.lines = []
+        self.blocks = []
+        self.config = parser.StoryConfig()
+        self.shot_ranges = self.config.shot_ranges
+        self.index = self.config.index
+        self.project = ""
+        self.last_reparsed = 0
+
+    def snapshot(self) -> dict:
+        """
+        JSON-safe state for config_cache.py: block values and the index, no objects.
+        Lines are re-read from the story file.
+        """
+        blocks = [
+            [b.start, b.end, b.digest.hex(), b.values, b.key and list(b.key), b.seq_offset, b.seq_value, b.range_shot]
+            for b in self.blocks
+        ]
+        return {
+            'blocks': blocks,
+            'index': self.index.snapshot(),
+            'shot_ranges': [[seq, shot, start, end] for (seq, shot), (start, end) in self.shot_ranges.items()],
+            'project': self.project,
+        }
+
+    @classmethod
+    def restore(cls, state: dict) -> 'StoryDocument':
+        """Rebuild a document from snapshot()."""
+        self = cls()
+        for start, end, digest, values, key, seq_offset, seq_value, range_shot in state['blocks']:
+            block = StoryBlock.__new__(StoryBlock)
+            block.start, block.end, block.digest = start, end, bytes.fromhex(digest)
+            block.values, block.key = values, key and tuple(key)
+            block.seq_offset, block.seq_value, block.range_shot = seq_offset, seq_value, range_shot
+            self.blocks.append(block)
+        self.project = state['project']
+        for seq, shot, start, end in state['shot_ranges']:
+            self.shot_ranges[(seq, shot)] = (start, end)
+
+        # Same tree fill_config builds, minus the per-shot index work (restored below)
+        shot_globals = dict(self.blocks[0].values)
+        project_dict = {}
+        winners = {}
+        for block in self.blocks[1:]:
+            if block.key is not None:
+                winners[block.key] = block
+        for key, block in winners.items():
+            parser.insert_shot(project_dict, key, parser.ShotRecord(shot_globals, block.values))
+        self.index.restore(state['index'], shot_globals)
+        self.config.shot_globals = shot_globals
+        self.config['globals'] = parser.finalize_globals(dict(shot_globals), verbose=False)
+        self.config[self.project] = project_dict
+        return self
+
+    def load(self, lines: list[str]) -> int:
+        """Full parse of lines. Returns the number of blocks parsed."""
+        self.blocks = []
+        return self.update(lines)
+
+    def update(self, lines: list[str]) -> int:
+        """
+        Bring the document in line with new file lines.
+        Blocks with an unchanged hash are reused; returns how many blocks were re-parsed.
+        """
+        old_blocks = self.blocks
+        old_globals = old_blocks[0] if old_blocks else None
+
+        reusable = {}
+        for block in old_blocks:
+            reusable.setdefault(block.digest, []).append(block)
+
+        new_blocks = []
+        added = []
+        for start, end in parser.split_blocks(lines):
+            block_lines = lines[start:end]
+            digest = _digest(block_lines)
+            pool = reusable.get(digest)
+            if pool:
+                block = pool.pop(0)
+                block.start, block.end = start, end
+            else:
+                block = StoryBlock(start, end, digest, block_lines)
+                added.append(block)
+            new_blocks.append(block)
+
+
+        self.lines = lines
+        self.blocks = new_blocks
+        self.last_reparsed = len(added)
+
+        if old_globals is None or new_blocks[0] is not old_globals:
+            # Globals feed every shot: re-merge all shots from their cached block values
+            parser.fill_config(
+                self.config,
+                new_blocks[0].values,
+                ((b.key, b.values) for b in new_blocks[1:] if b.key is not None),
+            )
+            self.project = new_blocks[0].values.get('PROJECT', 'default').strip()
+        else:
+            self._patch_config(old_blocks)
+
+        parser.fill_shot_ranges(
+            self.shot_ranges,
+            ((b.start, b.end, b.seq_offset, b.seq_value, b.range_shot) for b in new_blocks),
+        )
+        return self.last_reparsed
+
+    def _patch_config(self, old_blocks):
+        # A shot changes when its winning (last) block is another block than before: edited,
+        # added and removed blocks, and duplicates that were reordered or lost their twin
+        old, new = _winners(old_blocks[1:]), _winners(self.blocks[1:])
+        self.reset_shots({key for key in old.keys() | new.keys() if old.get(key) is not new.get(key)})
+
+    def reset_shots(self, affected):
+        """Re-merge the given shot keys from this document's blocks; keys no block has are removed."""
+        if not affected:
+            return
+
+        # Later blocks win like in a full parse
+        winners = {}
+        for block in self.blocks[1:]:
+            if block.key in affected:
+                winners[block.key] = block
+
+        project_dict = self.config.setdefault(self.project, {})
+        for key in affected:
+            block = winners.get(key)
+            if block is None:
+                parser.remove_shot(project_dict, key)
+                self.index.remove(key)
+            else:
+                merged = parser.merge_shot(self.config.shot_globals, block.values)
+                parser.insert_shot(project_dict, key, merged)
+                self.index.add(key, merged)
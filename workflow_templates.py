@@ -0,0 +1,163 @@
+# workflow_templates.py - Compiled ComfyUI workflow templates
+# A workflow JSON is loaded once per file (reloaded when it changes on disk). Compiling records
+# where its placeholders (REPLACETEXT, ...) sit and which node ids have which class_type,
+# so building a job payload is one copy plus direct patches at those paths - no text
+# replace on serialized JSON, and prompt text never needs JSON escaping.
+# Payloads can also be built copy-on-write (render(writable=...), fork()): only the nodes being
+# patched are copied, all other node dicts are shared with the template and must not be mutated.
+import json
+import os
+import re
+import threading
+
+PLACEHOLDER = "REPLACETEXT"
+
+_templates = {}
+_lock = threading.Lock()
+
+
+class WorkflowTemplate:
+    def __init__(self, path: str, data: dict, placeholders=(PLACEHOLDER,)):
+        self.path = path
+        self.placeholders = tuple(placeholders)
+        self.ui_format = "nodes" in data      # UI export (nodes + links), not an API prompt
+        self.wrapped = "prompt" in data       # API prompt already wrapped in {"prompt": ...}
+        self.slots = []                       # (key path, original string) of strings holding a placeholder
+        self.nodes_by_class = {}              # class_type -> node ids of the API prompt
+        self._text = json.dumps(data)
+        self._base = data                     # parsed once, shared read-only by copy-on-write renders
+        self._pattern = re.compile("|".join(
+            re.escape(p) for p in sorted(self.placeholders, key=len, reverse=True)
+        ))
+        self._scan(data, ())
+
+        if not self.ui_format:
+            for node_id, node in data.get("prompt", data).items():
+                if isinstance(node, dict) and "class_type" in node:
+                    self.nodes_by_class.setdefault(node["class_type"], []).append(node_id)
+
+    def _scan(self, value, path):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                self._scan(v, path + (k,))
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                self._scan(v, path + (i,))
+        elif isinstance(value, str) and self._pattern.search(value):
+            self.slots.append((path, value))
+
+    def count(self, placeholder: str = PLACEHOLDER) -> int:
+        """Occurrences of a placeholder across all string values."""
+        return sum(s.count(placeholder) for _, s in self.slots)
+
+    def render(self, values: dict = None, writable=None) -> dict:
+        """
+        Copy of the workflow with placeholders bound to values ({placeholder: text}).
+        Placeholders missing from values (or bound to None) are left as they are.
+        writable=None gives a full private copy. With a list of node ids only those nodes
+        (node dict + inputs dict) and the containers holding placeholders are copied; the
+        rest is shared with the template and must be treated as read-only.
+        """
+        if writable is None:
+            payload = json.loads(self._text)
+            owned = None
+        else:
+            payload = dict(self._base)
+            owned = {()}
+            prefix = ("prompt",) if self.wrapped else ()
+            prompt = self._base.get("prompt", self._base) if not self.ui_format else {}
+            for node_id in writable:
+                node = prompt.get(node_id)
+                if isinstance(node, dict):
+                    _own(payload, prefix + ((node_id, "inputs") if "inputs" in node else (node_id,)), owned)
+        if not values:
+            return payload
+
+        def bind(match):
+            text = values.get(match.group(0))
+            return match.group(0) if text is None else str(text)
+
+        for path, original in self.slots:
+            if owned is None:
+                parent = payload
+                for key in path[:-1]:
+                    parent = parent[key]
+            else:
+                parent = _own(payload, path[:-1], owned)
+            parent[path[-1]] = self._pattern.sub(bind, original)
+        return payload
+
+    @staticmethod
+    def prompt_of(payload: dict) -> dict:
+        """The node dict of an API payload, wrapped or not."""
+        return payload.get("prompt", payload)
+
+    def nodes_of_class(self, *class_types) -> list:
+        ids = []
+        for class_type in class_types:
+            ids.extend(self.nodes_by_class.get(class_type, ()))
+        return ids
+
+
+def _own(payload, path, owned) -> dict:
+    """Make every container along path private to payload (copied once) and return the last one."""
+    container = payload
+    for depth in range(len(path)):
+        key = path[depth]
+        child = container[key]
+        if path[:depth + 1] not in owned:
+            child = dict(child) if isinstance(child, dict) else list(child)
+            container[key] = child
+            owned.add(path[:depth + 1])
+        container = child
+    return container
+
+
+def fork(payload: dict, node_ids) -> dict:
+    """
+    Copy-on-write copy of an API payload (wrapped in "prompt" or not) for one more job:
+    only node_ids (node dict + inputs dict) are copied, every other node is shared with payload.
+    Use it instead of json.loads(json.dumps(payload)) when a job only changes a few nodes.
+    """
+    wrapped = "prompt" in payload
+    prompt = dict(payload["prompt"] if wrapped else payload)
+    for node_id in node_ids:
+        node = prompt.get(node_id)
+        if isinstance(node, dict):
+            node = dict(node)
+            node["inputs"] = dict(node.get("inputs", {}))
+            prompt[node_id] = node
+    if wrapped:
+        forked = dict(payload)
+        forked["prompt"] = prompt
+        return forked
+    return prompt
+
+
+def encode_payload(payload: dict, client_id: str = None) -> bytes:
+    """Serialize a payload straight to the bytes posted to /prompt."""
+    if client_id is not None:
+        payload = {**payload, "client_id": client_id}
+    return json.dumps(payload).encode('utf-8')
+
+
+def with_client_id(body: bytes, client_id: str) -> bytes:
+    """Add client_id to an already encoded (non-empty) payload without re-serializing it."""
+    return body[:-1] + b', "client_id": ' + json.dumps(client_id).encode('utf-8') + b'}'
+
+
+def load_template(path: str, placeholders=(PLACEHOLDER,)) -> WorkflowTemplate:
+    """Compiled template for a workflow file, cached until the file changes."""
+    path = os.path.abspath(path)
+    mtime_ns = os.stat(path).st_mtime_ns  # FileNotFoundError for a missing workflow
+    key = (path, tuple(placeholders))
+    cached = _templates.get(key)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    template = WorkflowTemplate(path, data, placeholders)
+    with _lock:
+        _templates[key] = (mtime_ns, template)
+    return template